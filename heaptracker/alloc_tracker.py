@@ -0,0 +1,59 @@
+class AllocTracker():
+  '''
+  Live allocations keyed by (asid, addr), plus running per-ASID totals.
+
+  The totals are updated on every add/remove, so taking a snapshot only copies
+  the per-ASID summary (a handful of processes) instead of walking every live
+  allocation. An ASID drops out of the summary once its last allocation is freed,
+  which matches what a full rescan of active_allocs would report.
+  '''
+
+  def __init__(self):
+    self.active_allocs = {} # (asid, addr): (size, name). If kernel, asid=0 & name=None
+    self.asid_totals = {}   # asid: {'name': 'foo', 'total_size': X, 'total_allocs': Y}
+
+  def add(self, address, size, asid=0, name=None):
+    # Same address allocated again without a free we saw (e.g. missed hook), replace it
+    if (asid, address) in self.active_allocs:
+      self.rem(address, asid=asid)
+
+    self.active_allocs[(asid, address)] = (size, name)
+
+    totals = self.asid_totals.get(asid)
+    if totals == None:
+      totals = {'name': name, 'total_size': 0, 'total_allocs': 0}
+      self.asid_totals[asid] = totals
+
+    totals['total_size'  ] += size
+    totals['total_allocs'] += 1
+
+  def rem(self, address, asid=0):
+    alloc = self.active_allocs.pop((asid, address), None)
+    if alloc == None:
+      return # Not one of ours
+
+    totals = self.asid_totals[asid]
+    totals['total_size'  ] -= alloc[0]
+    totals['total_allocs'] -= 1
+    if totals['total_allocs'] == 0:
+      del self.asid_totals[asid]
+
+  def snapshot(self):
+    '''
+    Copy of the per-ASID totals: {asid: {'name', 'total_size', 'total_allocs'}}
+    '''
+    return {asid: dict(totals) for asid, totals in self.asid_totals.items()}
+
+def rescan_snapshot(active_allocs):
+  '''
+  Per-ASID totals rebuilt by walking every live allocation, the original report_allocs.
+  Kept as the reference for bench.py.
+  '''
+  active_sizes  = {} # asid (0 for kernel): {name: 'foo', total_size: X, total_allocs: Y}
+  for ((asid, addr), (size, name)) in active_allocs.items():
+    if asid not in active_sizes:
+      active_sizes[asid] = {'name': name, 'total_size': 0, 'total_allocs': 0}
+
+    active_sizes[asid]['total_size'  ] += size
+    active_sizes[asid]['total_allocs'] += 1
+  return active_sizes
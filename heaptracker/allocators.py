@@ -0,0 +1,129 @@
+import time
+
+# Hook kinds -----------------------------------------------------------------------------------------------------------
+
+ALLOC = "alloc"         # Returns the new chunk, NULL on failure
+ALLOC_OUT = "alloc_out" # Writes the new chunk through an out pointer arg, returns 0 on success
+REALLOC = "realloc"     # Returns the new chunk, the old one (ptr arg) is freed unless the call failed
+FREE = "free"           # Frees the chunk in the ptr arg, hooked at entry since there's nothing to wait for
+
+# SLUB struct kmem_cache starts: cpu_slab, flags, min_partial, size (u32), object_size (u32).
+# Guest kernel layout, not read from debug info: `pahole -C kmem_cache vmlinux` shows it for another kernel.
+# Every read is sanity checked, a kernel with another layout (or SLAB) fails loudly instead of plotting garbage.
+KMEM_CACHE_SIZE_OFFSET = 0x18
+KMEM_CACHE_OBJECT_SIZE_OFFSET = 0x1c
+KMEM_CACHE_MAX_SIZE = (1 << 22)
+
+def kmem_cache_object_size(cache, read):
+  size = read(cache + KMEM_CACHE_SIZE_OFFSET, 4)
+  object_size = read(cache + KMEM_CACHE_OBJECT_SIZE_OFFSET, 4)
+  if not (0 < object_size <= size <= KMEM_CACHE_MAX_SIZE):
+    raise RuntimeError(f"struct kmem_cache at {cache:#x} doesn't match the expected SLUB layout "
+                       f"(size: {size}, object_size: {object_size}), check KMEM_CACHE_*_OFFSET")
+  return object_size
+
+# Allocator table ------------------------------------------------------------------------------------------------------
+
+# name: {
+#   "kernel": hooked once from System.map, otherwise per process at libc base + offset
+#   "default": hooked unless the allocator spec says otherwise, hot kernel slab paths are opt-in
+#   "kind":   one of the hook kinds above
+#   "args":   number of args captured at entry
+#   "size":   (args, read) -> chunk size, read(addr, byte_cnt) reads guest memory as an int
+#   "ptr":    arg index of the chunk being freed (REALLOC, FREE)
+#   "out":    arg index of the out pointer (ALLOC_OUT)
+# }
+
+ALLOCATORS = {
+  # libc
+  "malloc"           : {"kernel": False, "default": True,  "kind": ALLOC,     "args": 1, "size": lambda args, read: args[0]},
+  "calloc"           : {"kernel": False, "default": True,  "kind": ALLOC,     "args": 2, "size": lambda args, read: args[0] * args[1]},
+  "realloc"          : {"kernel": False, "default": True,  "kind": REALLOC,   "args": 2, "size": lambda args, read: args[1], "ptr": 0},
+  "posix_memalign"   : {"kernel": False, "default": True,  "kind": ALLOC_OUT, "args": 3, "size": lambda args, read: args[2], "out": 0},
+  "free"             : {"kernel": False, "default": True,  "kind": FREE,      "args": 1, "ptr": 0},
+
+  # Kernel
+  "__kmalloc"        : {"kernel": True,  "default": True,  "kind": ALLOC,     "args": 1, "size": lambda args, read: args[0]},
+  "kmem_cache_alloc" : {"kernel": True,  "default": False, "kind": ALLOC,     "args": 1,
+                        "size": lambda args, read: kmem_cache_object_size(args[0], read)},
+  "vmalloc"          : {"kernel": True,  "default": True,  "kind": ALLOC,     "args": 1, "size": lambda args, read: args[0]},
+  "kfree"            : {"kernel": True,  "default": True,  "kind": FREE,      "args": 1, "ptr": 0},
+  "kmem_cache_free"  : {"kernel": True,  "default": False, "kind": FREE,      "args": 2, "ptr": 1},
+  "vfree"            : {"kernel": True,  "default": True,  "kind": FREE,      "args": 1, "ptr": 0},
+}
+
+def enabled_allocators(spec):
+  '''
+  Table names to hook for "default", "all", "none", or a comma-separated list of allocators
+  '''
+  if spec == "default":
+    return [name for name, allocator in ALLOCATORS.items() if allocator["default"]]
+  if spec == "all":
+    return list(ALLOCATORS)
+  if spec == "none":
+    return []
+
+  enabled = spec.split(",")
+  for name in enabled:
+    if name not in ALLOCATORS:
+      raise RuntimeError(f"Unknown allocator: {name}")
+  return [name for name in ALLOCATORS if name in enabled]
+
+def on_return(allocator, args, retval, add, rem, read):
+  '''
+  Apply a returning (non-FREE) allocator call through add(addr, size) and rem(addr)
+  '''
+  kind = allocator["kind"]
+  if kind == ALLOC:
+    if retval != 0:
+      add(retval, allocator["size"](args, read))
+
+  elif kind == ALLOC_OUT:
+    if retval == 0:
+      add(read(args[allocator["out"]], 8), allocator["size"](args, read))
+
+  elif kind == REALLOC:
+    size = allocator["size"](args, read)
+    old_ptr = args[allocator["ptr"]]
+    # realloc(ptr, 0) may free and return NULL, any other NULL return leaves ptr allocated
+    if (old_ptr != 0) and ((retval != 0) or (size == 0)):
+      rem(old_ptr)
+    if retval != 0:
+      add(retval, size)
+
+# Stats ----------------------------------------------------------------------------------------------------------------
+
+class HookStats():
+  '''
+  Per-allocator hook hits and time spent in our handlers, opt-in since timing every hook has a cost of its own.
+  Doesn't include the emulator's own cost of dispatching the hooks, bench.py measures that end to end.
+  '''
+
+  def __init__(self):
+    self.hit_cnt = {} # name: entry hook hits
+    self.ret_cnt = {} # name: return hook hits
+    self.sec = {}     # name: handler time, entry and return
+
+  def timed(self, name, handler, is_return=False):
+    '''
+    Wrap a hook handler to count and time it under name, handlers are only wrapped when stats are on
+    '''
+    cnts = self.ret_cnt if is_return else self.hit_cnt
+    cnts.setdefault(name, 0)
+    self.sec.setdefault(name, 0.0)
+
+    def _timed(*args):
+      start_time = time.perf_counter()
+      handler(*args)
+      cnts[name] += 1
+      self.sec[name] += time.perf_counter() - start_time
+    return _timed
+
+  def __str__(self):
+    lines = []
+    for name in ALLOCATORS:
+      if self.hit_cnt.get(name, 0):
+        hit_cnt = self.hit_cnt[name]
+        lines.append(f"[ALLOC] {name}: hit_cnt: {hit_cnt}, ret_cnt: {self.ret_cnt.get(name, 0)}, "
+                     f"handler_sec: {self.sec[name]:.4f}, avg_usec: {self.sec[name] * 1e6 / hit_cnt:.1f}")
+    return "\n".join(lines) if lines else "[ALLOC] no allocator hooks hit"
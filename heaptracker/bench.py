@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+from sys import argv
+import os
+import re
+import sys
+import json
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from alloc_tracker import AllocTracker, rescan_snapshot
+from snapshots import SnapshotSeries, load_snapshots
+import heaplog
+import allocators
+
+# Workload -------------------------------------------------------------------------------------------------------------
+
+def gen_events(live_cnt, churn_cnt, asid_cnt=4, seed=0):
+  '''
+  Synthetic malloc/free stream shaped like the tree workload: the heap grows to live_cnt chunks
+  spread over a few processes plus the kernel (asid 0), then churns with paired free/malloc.
+  Events are (op, asid, addr, size) with op 1 = alloc, 0 = free.
+  '''
+  rng = random.Random(seed)
+  asids = [0] + [0x1000 * (i + 1) for i in range(asid_cnt)]
+  live = []
+  events = []
+  next_addr = 0x10000
+
+  def alloc():
+    nonlocal next_addr
+    asid = rng.choice(asids)
+    size = rng.choice([24, 32, 64, 128, 4096])
+    events.append((1, asid, next_addr, size))
+    live.append((asid, next_addr))
+    next_addr += size
+
+  for _ in range(live_cnt):
+    alloc()
+
+  for _ in range(churn_cnt):
+    idx = rng.randrange(len(live))
+    (asid, addr) = live[idx]
+    live[idx] = live[-1]
+    live.pop()
+    events.append((0, asid, addr, 0))
+    alloc()
+
+  return events
+
+# Plot series, densified exactly like heaptracker.py does before plotting
+def plot_series(recorded_results, prop_name):
+  user_sizes = {}
+  asid_names = {}
+  for ts_details in recorded_results:
+    for asid, asid_details in ts_details.items():
+      if asid not in user_sizes.keys():
+        user_sizes[asid] = [0]*len(recorded_results)
+        asid_names[asid] = asid_details['name']
+
+  for ts, ts_details in enumerate(recorded_results):
+    for asid, asid_details in ts_details.items():
+      user_sizes[asid][ts] = asid_details[prop_name]
+  return (user_sizes, asid_names)
+
+# Benchmarks -----------------------------------------------------------------------------------------------------------
+
+def run_rescan(events, report_every):
+  active_allocs = {}
+  recorded_results = []
+  for i, (op, asid, addr, size) in enumerate(events):
+    if op:
+      active_allocs[(asid, addr)] = (size, hex(asid))
+    elif (asid, addr) in active_allocs:
+      del active_allocs[(asid, addr)]
+    if (i % report_every) == 0:
+      recorded_results.append(rescan_snapshot(active_allocs))
+  return recorded_results
+
+def run_incremental(events, report_every):
+  tracker = AllocTracker()
+  recorded_results = []
+  for i, (op, asid, addr, size) in enumerate(events):
+    if op:
+      tracker.add(addr, size, asid=asid, name=hex(asid))
+    else:
+      tracker.rem(addr, asid=asid)
+    if (i % report_every) == 0:
+      recorded_results.append(tracker.snapshot())
+  return recorded_results
+
+def bench_tracker(live_cnts, churn_cnt, report_every):
+  '''
+  Time both trackers as the live heap grows, and check the plotted series match
+  '''
+  print(f"[TRACKER] {churn_cnt} churn events after warmup, snapshot every {report_every} events")
+  for live_cnt in live_cnts:
+    events = gen_events(live_cnt, churn_cnt)
+
+    start_time = time.perf_counter()
+    old_results = run_rescan(events, report_every)
+    rescan_sec = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    new_results = run_incremental(events, report_every)
+    incr_sec = time.perf_counter() - start_time
+
+    same = all(plot_series(old_results, prop) == plot_series(new_results, prop) for prop in ['total_allocs', 'total_size'])
+    print(f"  live_cnt: {live_cnt:>8}, rescan: {rescan_sec:.3f} sec, incremental: {incr_sec:.3f} sec, "
+          f"speedup: {rescan_sec / incr_sec:.1f}x, same_series: {same}")
+    assert(same)
+
+def bench_snapshots(row_cnt, asid_cnt):
+  '''
+  List-of-dicts snapshots vs SnapshotSeries: memory held, time to densify for plotting, saved size
+  '''
+  rng = random.Random(0)
+  rows = []
+  for ts in range(row_cnt):
+    # Processes come and go, about half are live at any time
+    rows.append({asid: {'name': hex(asid), 'total_size': rng.randrange(1 << 20), 'total_allocs': rng.randrange(1000)}
+                 for asid in range(asid_cnt) if ((asid + ts // 100) % 2) == 0})
+
+  print(f"[SNAPSHOTS] {row_cnt} snapshots, {asid_cnt} asids")
+
+  tracemalloc.start()
+  recorded_results = [{asid: dict(totals) for asid, totals in row.items()} for row in rows]
+  list_bytes = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  tracemalloc.start()
+  series = SnapshotSeries()
+  for row in rows:
+    series.record(row)
+  col_bytes = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  start_time = time.perf_counter()
+  for prop in ['total_allocs', 'total_size']:
+    (user_sizes, asid_names) = plot_series(recorded_results, prop)
+  list_sec = time.perf_counter() - start_time
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, "heap_snapshots.npz")
+    series.save(path)
+    start_time = time.perf_counter()
+    loaded = load_snapshots(path)
+    cols = [loaded[prop] for prop in ['total_allocs', 'total_size']]
+    col_sec = time.perf_counter() - start_time
+    file_bytes = os.path.getsize(path)
+
+    # Same series as densifying the list of dicts
+    (user_sizes, asid_names) = plot_series(recorded_results, 'total_size')
+    for col, asid in enumerate(loaded['asids']):
+      assert(list(cols[1][:, col]) == user_sizes[int(asid)])
+      assert(str(loaded['names'][col]) == asid_names[int(asid)])
+
+  print(f"  list of dicts: {list_bytes / 1e6:.1f} MB, densify: {list_sec:.3f} sec")
+  print(f"  columnar: {col_bytes / 1e6:.1f} MB (incl. preallocated rows), mmap load: {col_sec:.3f} sec, npz: {file_bytes / 1e6:.1f} MB")
+
+def bench_event_log(live_cnt, churn_cnt):
+  '''
+  Per-event cost of appending to the event log vs live tracking, and offline reconstruction time
+  '''
+  events = gen_events(live_cnt, churn_cnt)
+  print(f"[EVENT_LOG] {len(events)} events, {live_cnt} live")
+
+  tracker = AllocTracker()
+  start_time = time.perf_counter()
+  for (op, asid, addr, size) in events:
+    if op:
+      tracker.add(addr, size, asid=asid, name=hex(asid))
+    else:
+      tracker.rem(addr, asid=asid)
+  track_sec = time.perf_counter() - start_time
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, "heap_events.bin")
+    event_log = heaplog.EventLog(path)
+    start_time = time.perf_counter()
+    for instr_cnt, (op, asid, addr, size) in enumerate(events):
+      event_log.append(instr_cnt * 100, asid, op, addr, size)
+    event_log.close()
+    log_sec = time.perf_counter() - start_time
+    print(f"  live tracking: {track_sec * 1e9 / len(events):.0f} ns/event, "
+          f"event log: {log_sec * 1e9 / len(events):.0f} ns/event, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    for bin_instrs in [1000, 100000]:
+      start_time = time.perf_counter()
+      (events_arr, names) = heaplog.reconstruct(path, bin_instrs, os.path.join(tmp_dir, "heap_snapshots.npz"))
+      next_idx = heaplog.match_events(events_arr)
+      peaks = heaplog.peak_usage(events_arr, next_idx)
+      leaked = heaplog.leaks(events_arr, next_idx)
+      print(f"  reconstruct at {bin_instrs} instrs/step + peaks + leaks: {time.perf_counter() - start_time:.3f} sec")
+
+    # Live allocations at the end are exactly what the tracker still holds
+    assert(len(leaked) == len(tracker.active_allocs))
+
+ALLOC_LINE = re.compile(r"^\[ALLOC\] (\S+): hit_cnt: (\d+), ret_cnt: (\d+), handler_sec: ([\d.]+)")
+
+def run_heaptracker(alloc_spec, timed=True):
+  '''
+  One full heaptracker.py run on the tree workload (needs PANDA), returns (wall_sec, {allocator: stats})
+  '''
+  cmd = ["python3", "heaptracker.py", "snapshot", "heap_events.bin", "100000", alloc_spec] + (["timed"] if timed else [])
+  start_time = time.perf_counter()
+  out = subprocess.run(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True).stdout
+  wall_sec = time.perf_counter() - start_time
+
+  stats = {}
+  for line in out.splitlines():
+    m = ALLOC_LINE.match(line.strip())
+    if m:
+      stats[m.group(1)] = {'hit_cnt': int(m.group(2)), 'ret_cnt': int(m.group(3)), 'handler_sec': float(m.group(4))}
+  return (wall_sec, stats)
+
+def bench_allocators(out_path):
+  '''
+  Hook overhead per allocator: run with no allocator hooks, then each allocator alone, then the default set and all.
+  Overhead is wall time over the unhooked run, so it includes PANDA's hook dispatch, not just our handlers.
+  The default set is also run untimed, the difference is what HookStats itself costs.
+  '''
+  names = list(allocators.ALLOCATORS)
+  run_heaptracker("all") # Warm the symbol cache so no run pays for guest nm/grep lookups
+
+  (base_sec, _) = run_heaptracker("none")
+  results = {'baseline_sec': base_sec, 'allocators': {}}
+  print(f"[ALLOCATORS] no hooks: {base_sec:.2f} sec")
+
+  (untimed_sec, _) = run_heaptracker("default", timed=False)
+  results['default_untimed_sec'] = untimed_sec
+  print(f"  {'default untimed':<18} overhead: {untimed_sec - base_sec:>7.2f} sec")
+
+  for alloc_spec in names + ["default", "all"]:
+    (wall_sec, stats) = run_heaptracker(alloc_spec)
+    hit_cnt = sum(s['hit_cnt'] for s in stats.values())
+    handler_sec = sum(s['handler_sec'] for s in stats.values())
+    results['allocators'][alloc_spec] = {'wall_sec': wall_sec, 'hit_cnt': hit_cnt, 'handler_sec': handler_sec}
+    print(f"  {alloc_spec:<18} overhead: {wall_sec - base_sec:>7.2f} sec, hit_cnt: {hit_cnt:>8}, handler: {handler_sec:.3f} sec")
+
+  with open(out_path, "w") as f:
+    json.dump(results, f, indent=2)
+
+# Main -----------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+  # Hacky 1st arg -> "allocators" benchmarks hook overhead on the tree workload under PANDA: allocators <out_json>
+  if len(argv) > 1 and argv[1] == "allocators":
+    bench_allocators(argv[2] if len(argv) > 2 else "bench_allocators.json")
+    sys.exit(0)
+
+  churn_cnt = int(argv[1]) if len(argv) > 1 else 100000
+  report_every = int(argv[2]) if len(argv) > 2 else 1000
+
+  bench_tracker([1000, 10000, 100000], churn_cnt, report_every)
+  bench_snapshots(100000, 16)
+  bench_event_log(100000, churn_cnt)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+from sys import argv
+import struct
+import json
+import os
+
+import numpy as np
+
+from snapshots import save_columns
+
+# Format ---------------------------------------------------------------------------------------------------------------
+
+# Event log file:
+#
+#   header: MAGIC, VERSION, 3 bytes padding
+#   events: fixed-size little-endian records (instr_cnt u64, asid u64, op u8, addr u64, size u64)
+#
+# Records are appended in guest order, so the file can be memory-mapped as a NumPy structured array.
+# Process names are kept in a JSON sidecar (<log>.names.json, {asid: name}), they're only needed offline.
+
+MAGIC = b"HEAP"
+VERSION = 1
+HEADER_SIZE = 8
+
+OP_FREE = 0
+OP_ALLOC = 1
+
+RECORD = struct.Struct("<QQBQQ")
+RECORD_DTYPE = np.dtype([('instr_cnt', '<u8'), ('asid', '<u8'), ('op', 'u1'), ('addr', '<u8'), ('size', '<u8')])
+assert(RECORD.size == RECORD_DTYPE.itemsize)
+
+def names_path(path):
+  return path + ".names.json"
+
+# Capture --------------------------------------------------------------------------------------------------------------
+
+class EventLog():
+  '''
+  Buffered writer for allocation events, each append is one pack_into a preallocated buffer.
+  The buffer is written out when full, so the file is touched once every buf_records events.
+  '''
+
+  def __init__(self, path, buf_records=(1 << 14)):
+    self.path = path
+    self.file = open(path, "wb")
+    self.file.write(MAGIC + bytes([VERSION]) + bytes(HEADER_SIZE - len(MAGIC) - 1))
+    self.buf = bytearray(RECORD.size * buf_records)
+    self.buf_off = 0
+    self.event_cnt = 0
+    self.names = {} # asid: name, first seen
+
+  def append(self, instr_cnt, asid, op, addr, size=0):
+    RECORD.pack_into(self.buf, self.buf_off, instr_cnt, asid, op, addr, size)
+    self.buf_off += RECORD.size
+    self.event_cnt += 1
+    if self.buf_off == len(self.buf):
+      self.flush()
+
+  def add_name(self, asid, name):
+    if asid not in self.names:
+      self.names[asid] = name
+
+  def flush(self):
+    self.file.write(memoryview(self.buf)[:self.buf_off])
+    self.buf_off = 0
+
+  def close(self):
+    self.flush()
+    self.file.close()
+    with open(names_path(self.path), "w") as f:
+      json.dump({hex(asid): name for asid, name in self.names.items()}, f, indent=2)
+
+  def __str__(self):
+    return f"[EVENT_LOG] {self.path}: {self.event_cnt} events"
+
+# Reconstruction -------------------------------------------------------------------------------------------------------
+
+def load_events(path):
+  '''
+  Memory-mapped structured array of every record in the log
+  '''
+  with open(path, "rb") as f:
+    header = f.read(HEADER_SIZE)
+  assert(header[:len(MAGIC)] == MAGIC)
+  assert(header[len(MAGIC)] == VERSION)
+
+  event_cnt = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+  if event_cnt == 0:
+    return np.zeros(0, dtype=RECORD_DTYPE)
+  return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(event_cnt,))
+
+def load_names(path):
+  try:
+    with open(names_path(path), "r") as f:
+      return {int(asid, 16): name for asid, name in json.load(f).items()}
+  except OSError:
+    return {}
+
+def match_events(events):
+  '''
+  For each event, the index of the next event on the same (asid, addr), -1 if there is none.
+  That next event ends an allocation: a free, or a re-allocation whose free was missed,
+  the same rules AllocTracker applies live. Frees with no live allocation before them end nothing.
+  '''
+  event_cnt = len(events)
+  idx = np.arange(event_cnt)
+  order = np.lexsort((idx, events['addr'], events['asid'])) # By asid, then addr, then time
+
+  asids = events['asid'][order]
+  addrs = events['addr'][order]
+  same_next = np.zeros(event_cnt, dtype=bool)
+  same_next[:-1] = (asids[1:] == asids[:-1]) & (addrs[1:] == addrs[:-1])
+
+  next_idx = np.full(event_cnt, -1, dtype=np.int64)
+  next_idx[order[:-1][same_next[:-1]]] = order[1:][same_next[:-1]]
+  return next_idx
+
+def event_deltas(events, next_idx):
+  '''
+  Per-event change in live (bytes, chunks) for the event's asid, plus the mask of allocations never freed
+  '''
+  is_alloc = (events['op'] == OP_ALLOC)
+  sizes = events['size'].astype(np.int64)
+
+  delta_size = np.where(is_alloc, sizes, 0)
+  delta_cnt = is_alloc.astype(np.int64)
+
+  # Each event ends at most one allocation (the one just before it), so these indices are unique
+  ended = is_alloc & (next_idx >= 0)
+  delta_size[next_idx[ended]] -= sizes[ended]
+  delta_cnt[next_idx[ended]] -= 1
+
+  leaked = is_alloc & (next_idx < 0)
+  return (delta_size, delta_cnt, leaked)
+
+def asid_columns(events):
+  '''
+  (asids in order of first appearance, per-event column index into them)
+  '''
+  (uniq, first_idx, inverse) = np.unique(events['asid'], return_index=True, return_inverse=True)
+  by_first = np.argsort(first_idx, kind="stable")
+  rank = np.empty(len(uniq), dtype=np.int64)
+  rank[by_first] = np.arange(len(uniq))
+  return (uniq[by_first], rank[inverse.reshape(-1)])
+
+def live_curves(events, bin_instrs, next_idx=None):
+  '''
+  Live bytes and chunks per asid at the end of every bin_instrs guest instructions.
+  Returns (asids, {'total_size': (bin_cnt, asid_cnt), 'total_allocs': (bin_cnt, asid_cnt)})
+  '''
+  if next_idx is None:
+    next_idx = match_events(events)
+  (delta_size, delta_cnt, leaked) = event_deltas(events, next_idx)
+  (asids, cols) = asid_columns(events)
+
+  bins = (events['instr_cnt'] // bin_instrs).astype(np.int64)
+  bin_cnt = int(bins[-1]) + 1 if len(bins) else 0
+  flat = (bins * len(asids)) + cols
+
+  curves = {}
+  for (name, delta) in [('total_size', delta_size), ('total_allocs', delta_cnt)]:
+    grid = np.zeros(bin_cnt * len(asids), dtype=np.int64)
+    np.add.at(grid, flat, delta)
+    curves[name] = np.cumsum(grid.reshape(bin_cnt, len(asids)), axis=0)
+  return (asids, curves)
+
+def peak_usage(events, next_idx=None):
+  '''
+  {asid: (peak live bytes, instr_cnt when first reached)} at full event resolution
+  '''
+  if next_idx is None:
+    next_idx = match_events(events)
+  (delta_size, delta_cnt, leaked) = event_deltas(events, next_idx)
+  (asids, cols) = asid_columns(events)
+
+  # Group events by asid keeping time order, running sum within each group
+  order = np.argsort(cols, kind="stable")
+  starts = np.searchsorted(cols[order], np.arange(len(asids)))
+  ends = np.append(starts[1:], len(order))
+  running = np.cumsum(delta_size[order])
+
+  peaks = {}
+  for col, asid in enumerate(asids):
+    (start, end) = (starts[col], ends[col])
+    base = running[start - 1] if start else 0
+    group = running[start:end] - base
+    peak_at = int(np.argmax(group))
+    peaks[int(asid)] = (int(group[peak_at]), int(events['instr_cnt'][order[start + peak_at]]))
+  return peaks
+
+def leaks(events, next_idx=None):
+  '''
+  Allocations still live when the log ends, as a structured array of their alloc records
+  '''
+  if next_idx is None:
+    next_idx = match_events(events)
+  return np.asarray(events[event_deltas(events, next_idx)[2]])
+
+def reconstruct(path, bin_instrs, out_path):
+  '''
+  Write the live-heap curves for a log at bin_instrs resolution in SnapshotSeries format (plot.py, load_snapshots)
+  '''
+  events = load_events(path)
+  names = load_names(path)
+  (asids, curves) = live_curves(events, bin_instrs)
+  save_columns(out_path, [int(asid) for asid in asids], [names.get(int(asid)) or "" for asid in asids], curves,
+               unit=f'Guest Instructions ({bin_instrs} per step)')
+  return (events, names)
+
+# Main -----------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+  log_path = argv[1] if len(argv) > 1 else "heap_events.bin"
+  bin_instrs = int(argv[2]) if len(argv) > 2 else 100000
+  out_path = argv[3] if len(argv) > 3 else "heap_snapshots.npz"
+  leak_cnt = int(argv[4]) if len(argv) > 4 else 10
+
+  (events, names) = reconstruct(log_path, bin_instrs, out_path)
+  next_idx = match_events(events)
+  print(f"{len(events)} events, curves at {bin_instrs} instrs per step written to {out_path}")
+
+  print("Peak live heap per process:")
+  for asid, (peak_size, instr_cnt) in peak_usage(events, next_idx).items():
+    label = "Kernel" if asid == 0 else names.get(asid) or hex(asid)
+    print(f"  {label:<16} {hex(asid):>18}: {peak_size} bytes at instr {instr_cnt}")
+
+  leaked = leaks(events, next_idx)
+  print(f"{len(leaked)} allocations never freed ({int(leaked['size'].sum())} bytes), largest {leak_cnt}:")
+  for leak in np.sort(leaked, order='size')[::-1][:leak_cnt]:
+    label = "Kernel" if leak['asid'] == 0 else names.get(int(leak['asid'])) or hex(int(leak['asid']))
+    print(f"  {label:<16} {hex(int(leak['addr'])):>18}: {int(leak['size'])} bytes, allocated at instr {int(leak['instr_cnt'])}")
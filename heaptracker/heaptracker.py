@@ -1,42 +1,130 @@
 #!/usr/bin/env python3
+from sys import argv
 from pandare import Panda
-import matplotlib.pyplot as plt
+
+from alloc_tracker import AllocTracker
+from snapshots import SnapshotSeries, load_snapshots
+from plot import plot_snapshots
+from symcache import SymbolCache
+import allocators
+import heaplog
+
+# Hacky 1st arg -> "log" appends every allocation event to a binary log instead of tracking totals live
+# Hacky 2nd arg -> event log path, 3rd arg -> instructions per step when plotting from the log
+log_mode = (argv[1] == "log") if len(argv) > 1 else False
+log_path = argv[2] if len(argv) > 2 else "heap_events.bin"
+log_bin_instrs = int(argv[3]) if len(argv) > 3 else 100000
+
+# Hacky 4th arg -> allocators to hook: "default", "all", "none", or comma-separated names from allocators.ALLOCATORS
+enabled_allocators = allocators.enabled_allocators(argv[4] if len(argv) > 4 else "default")
+
+# Hacky 5th arg -> "timed" counts and times every hook handler, printed as [ALLOC] lines (bench.py uses this)
+hook_stats = allocators.HookStats() if (len(argv) > 5 and argv[5] == "timed") else None
 
 panda = Panda(generic="x86_64")
 
-(malloc_offset, free_offset) = (None, None)
+libc_offsets = {} # Enabled libc allocators: offset from libc base, None if not exported
 analysis_active = False
 hooked_asids = set()
+scanned_asids = {} # asid: signature of the mappings last walked without finding libc
+map_stats = {'scan_cnt': 0, 'skip_hooked_cnt': 0, 'skip_unchanged_cnt': 0, 'skip_same_signature_cnt': 0}
+sym_cache = SymbolCache("heap_symbols.json") # Offsets of hooked symbols, reused between runs
+LIBC_PREFIX = b"/lib/x86_64-linux-gnu/libc-"
+MAP_ANONYMOUS = 0x20
+ret_stats = {'stale_cnt': 0, 'ignored_cnt': 0} # Pending calls dropped without returning, return hits with no call
+STALE_WINDOW = 0x2000 # Pending calls this far below a new one are on the same stack, further away may be another thread's
+
+def add_hook(name, addr, handler, asid=None, kernel=False, is_return=False):
+  '''
+  Hook addr with handler, counted and timed under name when hook stats are on
+  '''
+  if hook_stats != None:
+    handler = hook_stats.timed(name, handler, is_return=is_return)
+  panda.hook(addr, asid=asid, kernel=kernel)(handler)
 
-def hook_ret_with_args(panda, name, entry_addr, func=None, asid=None, kernel=False):
+def hook_ret_with_args(panda, name, entry_addr, func=None, asid=None, kernel=False, arg_cnt=2):
   '''
   Helper function to run `func` when a function returns.
-  The function is called with three args: in_arg1, in_arg2, and ret_val
+  The function is called with three args: cpu, [in_arg1, ... in_argN], and ret_val
 
-  This is done by setting up a hook at the function start, which grabs the first 2
-  arguments, then registers a second hook at the return address.  When the second hook
-  fires, we call the user-provided function.
+  This is done by setting up a hook at the function start, which grabs the first arg_cnt
+  arguments, and a second hook at the return address. There is one return hook per call site,
+  added the first time it's seen and reused after that, so hooks don't pile up per call.
+  Calls in flight are matched to their return by ASID, stack pointer and return address, a return hook hit
+  with nothing matching (code reaching the return address some other way) is ignored.
   '''
-  hooked_args = []
+  ret_hooked = set()
+  pending = {} # (asid, rsp after return): (return address, args captured at entry)
+
+  def hook_return(ret_addr):
+    def _return(cpu, tb, h):
+      key = (panda.current_asid(cpu), panda.arch.get_reg(cpu, "rsp"))
+      entry = pending.get(key)
+      if (entry == None) or (entry[0] != ret_addr):
+        ret_stats['ignored_cnt'] += 1
+        return
+      del pending[key]
+      func(cpu, entry[1], panda.arch.get_reg(cpu, "rax"))
+    add_hook(name, ret_addr, _return, asid=asid, kernel=kernel, is_return=True)
 
-  @panda.hook(entry_addr, asid=asid, kernel=kernel)
   def _enter(cpu, tb, h):
-    # Grab ret_addr off stack and first two args
-    ret_addr = panda.virtual_memory_read(cpu, panda.arch.get_reg(cpu, "rsp"), 8, fmt="int")
-    hooked_args = [panda.arch.get_arg(cpu, idx) for idx in range(2)]
+    # Grab ret_addr off stack and first arg_cnt args
+    call_asid = panda.current_asid(cpu)
+    rsp = panda.arch.get_reg(cpu, "rsp")
+    ret_addr = panda.virtual_memory_read(cpu, rsp, 8, fmt="int")
 
-    # Setup a new hook to run just once at ret_addr and call user-provided func
-    @panda.hook(ret_addr, asid=asid, kernel=kernel)
-    def _return(cpu, tb, h):
-      h.enabled = False
-      retval = panda.arch.get_reg(cpu, "rax")
-      func(cpu, hooked_args, retval)
+    # Calls that never came back (longjmp, exit, a fault) left entries at or below this one's return slot
+    stale = [key for key in pending if (key[0] == call_asid) and ((rsp + 8 - STALE_WINDOW) <= key[1] <= (rsp + 8))]
+    for key in stale:
+      del pending[key]
+    ret_stats['stale_cnt'] += len(stale)
+    pending[(call_asid, rsp + 8)] = (ret_addr, [panda.arch.get_arg(cpu, idx) for idx in range(arg_cnt)])
+
+    if ret_addr not in ret_hooked:
+      ret_hooked.add(ret_addr)
+      hook_return(ret_addr)
+
+  add_hook(name, entry_addr, _enter, asid=asid, kernel=kernel)
+
+def hook_allocator(fname, addr, asid=None, kernel=False):
+  '''
+  Hook one function from allocators.ALLOCATORS. Frees are handled at entry,
+  everything else at return using the args captured at entry.
+  Kernel allocations are tracked under asid 0 with no name.
+  '''
+  allocator = allocators.ALLOCATORS[fname]
 
-def add_hooks_if_necessary(cpu):
+  def read(cpu, buf, byte_cnt):
+    return panda.virtual_memory_read(cpu, buf, byte_cnt, fmt="int")
+
+  if allocator["kind"] == allocators.FREE:
+    def _free(cpu, tb, h):
+      buf = panda.arch.get_arg(cpu, allocator["ptr"]) # Entry hook: rax is still the caller's, the pointer is an arg
+      rem_alloc(buf, asid=0 if kernel else panda.current_asid(cpu))
+    add_hook(fname, addr, _free, asid=asid, kernel=kernel)
+    return
+
+  def _returned(cpu, in_args, retval):
+    (asid, name) = (0, None) if kernel else (panda.current_asid(cpu), panda.get_process_name(cpu))
+    allocators.on_return(allocator, in_args, retval,
+        add=lambda buf, size: add_alloc(buf, size, asid=asid, name=name),
+        rem=lambda buf: rem_alloc(buf, asid=asid),
+        read=lambda buf, byte_cnt: read(cpu, buf, byte_cnt))
+
+  hook_ret_with_args(panda, fname, addr, func=_returned, asid=asid, kernel=kernel, arg_cnt=allocator["args"])
+
+def mapping_signature(mappings):
+  '''
+  Cheap fingerprint of a process's file-backed mappings: their count and a hash of base/size, no guest strings read
+  '''
+  spans = tuple((mapping.base, mapping.size) for mapping in mappings if mapping.file != panda.ffi.NULL)
+  return (len(spans), hash(spans))
+
+def add_hooks_if_necessary(cpu, maps_changed=False):
   '''
   Called when something may have changed with the memory maps
   in the current process. Scan mappings for libc and set hooks
-  on malloc and free relative to the libc base address.
+  on its allocators relative to the libc base address.
   '''
 
   if not analysis_active:
@@ -44,52 +132,55 @@ def add_hooks_if_necessary(cpu):
 
   asid = panda.current_asid(cpu)
   if asid in hooked_asids:
-      return # Already hooked this process
-
-  name = panda.get_process_name(cpu)
+    map_stats['skip_hooked_cnt'] += 1
+    return # Already hooked this process
+
+  if (asid in scanned_asids) and (not maps_changed):
+    map_stats['skip_unchanged_cnt'] += 1
+    return # No file mmap since the last scan, so libc still isn't mapped
+
+  maps = panda.get_mappings(cpu) # Owns the entries, keep it alive while they're used
+  mappings = list(maps)
+  signature = mapping_signature(mappings)
+  if scanned_asids.get(asid) == signature:
+    map_stats['skip_same_signature_cnt'] += 1
+    return # Same file mappings as the last scan, skip reading their names
+
+  map_stats['scan_cnt'] += 1
+  scanned_asids[asid] = signature
   # Find current libc address and update hooks
-  for mapping in panda.get_mappings(cpu):
+  for mapping in mappings:
     if mapping.file != panda.ffi.NULL and \
-        panda.ffi.string(mapping.file).decode().startswith("/lib/x86_64-linux-gnu/libc-"):
+        panda.ffi.string(mapping.file).startswith(LIBC_PREFIX):
       hooked_asids.add(asid)
-      hook_ret_with_args(panda, f"{name}_malloc", mapping.base + malloc_offset, asid=asid,
-          func=lambda cpu, in_args, retval: add_alloc(retval, in_args[0],
-                                             asid=panda.current_asid(cpu),
-                                             name=panda.get_process_name(cpu)))
-
-      # Note for free we don't need retval, just the hook
-      @panda.hook(mapping.base+free_offset, asid=asid, kernel=False)
-      def process_free(cpu, tb, h):
-        buf = panda.arch.get_reg(cpu, 'rax')
-        asid = panda.current_asid(cpu)
-        rem_alloc(buf, asid=asid)
+      for fname, offset in libc_offsets.items():
+        hook_allocator(fname, mapping.base + offset, asid=asid)
 
 # Allocation trackers
-recorded_results = [] # List of active allocations updated every 1k blocks
-active_allocs = {} # (asid, addr): (size, name). If kernel, asid=0 & name=None
+snapshots = SnapshotSeries() # Per-ASID totals, one row every 1k blocks
+tracker = AllocTracker() # Live allocations + running per-ASID totals
+event_log = heaplog.EventLog(log_path) if log_mode else None # Replaces both of the above in log mode
+
+# Log mode timestamps: guest instruction count, read only when an event is logged (no per-block callback)
+def instr_cnt():
+  return panda.rr_get_guest_instr_count()
+
 def add_alloc(address, size, asid=0, name=None):
-  global active_allocs
-  active_allocs[(asid, address)] = (size, name)
+  if event_log != None:
+    event_log.append(instr_cnt(), asid, heaplog.OP_ALLOC, address, size)
+    if name != None:
+      event_log.add_name(asid, name)
+  else:
+    tracker.add(address, size, asid=asid, name=name)
 
 def rem_alloc(address, asid=0):
-  global active_allocs
-  if (asid, address) in active_allocs:
-    del active_allocs[(asid, address)]
+  if event_log != None:
+    event_log.append(instr_cnt(), asid, heaplog.OP_FREE, address)
+  else:
+    tracker.rem(address, asid=asid)
 
 def report_allocs():
-  global recorded_results
-  active_sizes  = {} # asid (0 for kernel): {name: 'foo', total_size: X, total_allocs: Y}
-  for ((asid, addr), (size, name)) in active_allocs.items():
-    if asid not in active_sizes:
-      active_sizes[asid] = {'name': name, 'total_size': 0, 'total_allocs': 0}
-
-    active_sizes[asid]['total_size'  ] += size
-    active_sizes[asid]['total_allocs'] += 1
-
-  this_ts = {}
-  for asid, details in active_sizes.items():
-    this_ts[asid] = details
-  recorded_results.append(this_ts)
+  snapshots.record(tracker.asid_totals)
 
 
 BBE_CTR = 0
@@ -103,7 +194,9 @@ def report_every_1000(cpu, tb):
 # End allocation trackers
 
 # There are three times we need to update our hooks: on process changes
-# and on return from sys_brk or sys_mmap which may have loaded libc
+# and on return from sys_brk or sys_mmap which may have loaded libc.
+# Only a file-backed mmap can map libc, so only it checks an already scanned process again.
+# brk just moves the heap end, anonymous mmaps have no file.
 @panda.ppp("osi", "on_task_change")
 def task_change(cpu):
   add_hooks_if_necessary(cpu)
@@ -113,8 +206,8 @@ def brk(cpu, *unused):
   add_hooks_if_necessary(cpu)
 
 @panda.ppp("syscalls2", "on_sys_mmap_return")
-def mmap(cpu, *unused):
-  add_hooks_if_necessary(cpu)
+def mmap(cpu, pc, addr, length, prot, flags, fd, pgoff):
+  add_hooks_if_necessary(cpu, maps_changed=not (flags & MAP_ANONYMOUS))
 
 @panda.queue_blocking
 def setup_hooks():
@@ -124,22 +217,35 @@ def setup_hooks():
   '''
   panda.revert_sync("root")
 
-  # Find malloc and free offsets in libc
-  global malloc_offset, free_offset
-  libc = panda.run_serial_cmd("find /lib/ -name 'libc.so.*'")
-  malloc_offset = int("0x"+panda.run_serial_cmd(f"nm -D {libc} | grep 'T malloc$' | awk '{{print $1}}'"), 16)
-  free_offset = int("0x"+panda.run_serial_cmd(f"nm -D {libc} | grep 'T free$' | awk '{{print $1}}'"), 16)
-
-  # Get addresses to hook and setup hooks. Note kmalloc/vmalloc use helper to hook at return
-  for fname in ["kfree", "__kmalloc", "vmalloc"]:
-    addr = int(panda.run_serial_cmd(f"grep 'T {fname}$' /boot/System.map*|tail -n1|awk '{{print $1}}'"), 16)
-    if fname == "kfree":
-      @panda.hook(addr, kernel=True)
-      def kfree_hook(cpu, tb, h):
-        rem_alloc(panda.arch.get_reg(cpu, 'rax'))
-    else:
-      hook_ret_with_args(panda, fname, addr, kernel=True,
-                        func=lambda cpu, in_args, retval: add_alloc(retval, in_args[0]))
+  # Hash libc and System.map in one command, symbols are only looked up for builds not in the cache
+  hashes = panda.run_serial_cmd("sha256sum $(find /lib/ -name 'libc.so.*') $(ls /boot/System.map*|tail -n1)")
+  lines = [line.split() for line in hashes.strip().splitlines()]
+  if (len(lines) != 2) or any(len(line) != 2 for line in lines):
+    raise RuntimeError(f"Expected exactly one libc.so.* under /lib/ and one /boot/System.map*, sha256sum printed:\n{hashes}")
+  ((libc_hash, libc), (map_hash, system_map)) = lines
+
+  # Symbols a guest doesn't have are cached as None and left unhooked
+  def hex_or_none(out):
+    out = out.strip()
+    return int(out, 16) if out else None
+
+  # Find offsets of the enabled libc allocators, hooked per process once libc is mapped
+  libc_syms = [fname for fname in enabled_allocators if not allocators.ALLOCATORS[fname]["kernel"]]
+  libc_offsets.update(sym_cache.resolve(libc, libc_hash, libc_syms,
+      lambda sym: hex_or_none(panda.run_serial_cmd(f"nm -D {libc} | grep -E ' [TW] {sym}$' | head -n1 | awk '{{print $1}}'"))))
+
+  # Get kernel allocator addresses and setup hooks
+  kernel_syms = [fname for fname in enabled_allocators if allocators.ALLOCATORS[fname]["kernel"]]
+  kernel_addrs = sym_cache.resolve(system_map, map_hash, kernel_syms,
+      lambda sym: hex_or_none(panda.run_serial_cmd(f"grep -E ' [TW] {sym}$' {system_map}|tail -n1|awk '{{print $1}}'")))
+  for fname, addr in kernel_addrs.items():
+    if addr != None:
+      hook_allocator(fname, addr, kernel=True)
+
+  for (path, addrs) in [(libc, libc_offsets), (system_map, kernel_addrs)]:
+    for fname in [fname for fname, addr in addrs.items() if addr == None]:
+      print(f"[ALLOC] {fname} not found in {path}, not hooked")
+      del addrs[fname]
 
 
 @panda.queue_blocking
@@ -153,45 +259,25 @@ def drive_guest():
 
   global analysis_active
   analysis_active = True
-  panda.enable_callback("report_every_1000")
+  if not log_mode:
+    panda.enable_callback("report_every_1000")
   print("Guest output:\n", "="*60 , "\n", panda.run_serial_cmd("./tree/tree 100"))
   print("="*60)
   panda.end_analysis()
 
 panda.run()
 
-# Visualize results with matplotlib
-for (figname, prop_name) in [('Heap Chunks Allocated', 'total_allocs'), ('Heap Bytes Allocated', 'total_size')]:
-  user_sizes = {} # asid: [ allocations_at_0, ... allocations_at_N ]
-  asid_names = {} # asid: name
-
-  # First go through all timestamps and grab all asids observed, make a list of 0s for each at each timestamp
-  for ts_details in recorded_results:
-    for asid, asid_details in ts_details.items():
-      if asid not in user_sizes.keys():
-        user_sizes[asid] = [0]*len(recorded_results)
-        asid_names[asid] = asid_details['name']
-
-
-  # At each time stamp, append num active allocations for the asid
-  for ts, ts_details in enumerate(recorded_results):
-    for asid, asid_details in ts_details.items():
-      user_sizes[asid][ts] = asid_details[prop_name]
-
-  fig = plt.gcf()
-  fig.set_size_inches(9, 5)
-
-  # Plot each result
-  for asid in user_sizes:
-    if asid == 0:            label = "Kernel"
-    elif asid in asid_names: label = asid_names[asid]
-    else:                    label = hex(asid)
-    plt.plot([x for x in range(len(recorded_results))], user_sizes[asid], label=label)
-
-  plt.title(f'Total {figname} per Process')
-  plt.xlabel('Basic Block Count (thousands)')
-  plt.ylabel(figname)
-  lgd = plt.legend(bbox_to_anchor=(1.01, 1), loc='upper left', fontsize='small')
-
-  plt.savefig(prop_name+".png", bbox_inches='tight')
-  plt.clf()
+if hook_stats != None:
+  print(hook_stats)
+print(sym_cache)
+print("[MAPPINGS] " + ", ".join(f"{k}: {v}" for k, v in map_stats.items()))
+print("[RETURNS] " + ", ".join(f"{k}: {v}" for k, v in ret_stats.items()))
+
+# Save results, then visualize with matplotlib from the saved file (`python3 plot.py` redraws without a rerun)
+if event_log != None:
+  event_log.close()
+  print(event_log)
+  heaplog.reconstruct(log_path, log_bin_instrs, "heap_snapshots.npz")
+else:
+  snapshots.save("heap_snapshots.npz")
+plot_snapshots(load_snapshots("heap_snapshots.npz"))
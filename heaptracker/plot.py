@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+from sys import argv
+import matplotlib.pyplot as plt
+
+from snapshots import load_snapshots, ROW_UNIT
+
+def plot_snapshots(snapshots):
+  '''
+  One figure per column of a saved SnapshotSeries (see load_snapshots), one line per process
+  '''
+  asids = [int(asid) for asid in snapshots['asids']]
+  asid_names = {asid: str(name) for asid, name in zip(asids, snapshots['names'])}
+  xlabel = str(snapshots['unit'][0]) if 'unit' in snapshots else ROW_UNIT
+
+  for (figname, prop_name) in [('Heap Chunks Allocated', 'total_allocs'), ('Heap Bytes Allocated', 'total_size')]:
+    series = snapshots[prop_name] # rows: timestamps, cols: asids
+    ts_cnt = series.shape[0]
+
+    fig = plt.gcf()
+    fig.set_size_inches(9, 5)
+
+    # Plot each result
+    for col, asid in enumerate(asids):
+      if asid == 0:            label = "Kernel"
+      elif asid in asid_names: label = asid_names[asid]
+      else:                    label = hex(asid)
+      plt.plot([x for x in range(ts_cnt)], series[:, col], label=label)
+
+    plt.title(f'Total {figname} per Process')
+    plt.xlabel(xlabel)
+    plt.ylabel(figname)
+    lgd = plt.legend(bbox_to_anchor=(1.01, 1), loc='upper left', fontsize='small')
+
+    plt.savefig(prop_name+".png", bbox_inches='tight')
+    plt.clf()
+
+if __name__ == "__main__":
+  # Re-plot a previous run without re-running the guest
+  plot_snapshots(load_snapshots(argv[1] if len(argv) > 1 else "heap_snapshots.npz"))
@@ -0,0 +1,110 @@
+import zipfile
+import struct
+
+import numpy as np
+
+COLUMNS = ['total_size', 'total_allocs']
+ROW_UNIT = 'Basic Block Count (thousands)'
+
+class SnapshotSeries():
+  '''
+  Per-ASID totals over time, stored column-wise: one row per snapshot, one column per ASID.
+
+  Arrays are preallocated and doubled when full in either dimension. An ASID that is absent
+  from a snapshot (no live allocations) reads as 0, as the old plotting code assumed.
+  Columns are in order of first appearance, the name is the one seen at that point.
+  '''
+
+  def __init__(self, row_cap=1024, col_cap=8):
+    self.row_cnt = 0
+    self.asid_cols = {} # asid: column index
+    self.asids = []
+    self.names = []
+    self.data = {col: np.zeros((row_cap, col_cap), dtype=np.int64) for col in COLUMNS}
+
+  def grow(self, row_cap, col_cap):
+    for col, arr in self.data.items():
+      new_arr = np.zeros((row_cap, col_cap), dtype=np.int64)
+      new_arr[:arr.shape[0], :arr.shape[1]] = arr
+      self.data[col] = new_arr
+
+  def get_col(self, asid, name):
+    col = self.asid_cols.get(asid)
+    if col == None:
+      col = len(self.asids)
+      self.asid_cols[asid] = col
+      self.asids.append(asid)
+      self.names.append(name if name != None else "")
+    return col
+
+  def record(self, asid_totals):
+    '''
+    Append one row from {asid: {'name', 'total_size', 'total_allocs'}}, e.g. AllocTracker.asid_totals
+    '''
+    cols = [(self.get_col(asid, totals['name']), totals) for asid, totals in asid_totals.items()]
+
+    (row_cap, col_cap) = self.data['total_size'].shape
+    if (self.row_cnt == row_cap) or (len(self.asids) > col_cap):
+      while len(self.asids) > col_cap:
+        col_cap *= 2
+      self.grow(row_cap * 2 if self.row_cnt == row_cap else row_cap, col_cap)
+
+    row = self.row_cnt
+    for (col, totals) in cols:
+      for name in COLUMNS:
+        self.data[name][row, col] = totals[name]
+    self.row_cnt += 1
+
+  def __len__(self):
+    return self.row_cnt
+
+  def column(self, name):
+    '''
+    (row_cnt, asid_cnt) view of one of COLUMNS, without the unused preallocated space
+    '''
+    return self.data[name][:self.row_cnt, :len(self.asids)]
+
+  def save(self, path, unit=ROW_UNIT):
+    save_columns(path, self.asids, self.names, {name: self.column(name) for name in COLUMNS}, unit=unit)
+
+def save_columns(path, asids, names, columns, unit=ROW_UNIT):
+  '''
+  Uncompressed .npz, so load_snapshots can memory-map the arrays in place.
+  columns holds a (row_cnt, asid_cnt) array for each of COLUMNS, unit labels what a row is.
+  '''
+  np.savez(path,
+    asids=np.array(asids, dtype=np.uint64),
+    names=np.array(names, dtype=str),
+    unit=np.array([unit], dtype=str),
+    **columns)
+
+# Loading --------------------------------------------------------------------------------------------------------------
+
+def load_snapshots(path):
+  '''
+  Dict of name: array from a saved SnapshotSeries, each array memory-mapped out of the .npz.
+  np.load ignores mmap_mode for .npz archives, but savez stores members uncompressed,
+  so each .npy member can be mapped at its offset in the zip.
+  '''
+  arrays = {}
+  with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+    for info in zf.infolist():
+      assert(info.compress_type == zipfile.ZIP_STORED)
+
+      # Local file header: fixed 30 bytes, then name and extra field of variable length
+      f.seek(info.header_offset)
+      (name_len, extra_len) = struct.unpack("<HH", f.read(30)[26:30])
+      f.seek(info.header_offset + 30 + name_len + extra_len)
+
+      version = np.lib.format.read_magic(f)
+      if version == (1, 0):
+        (shape, fortran_order, dtype) = np.lib.format.read_array_header_1_0(f)
+      else:
+        (shape, fortran_order, dtype) = np.lib.format.read_array_header_2_0(f)
+      name = info.filename[:-len(".npy")]
+      if 0 in shape:
+        arrays[name] = np.zeros(shape, dtype=dtype)
+      else:
+        arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                 order="F" if fortran_order else "C")
+  return arrays
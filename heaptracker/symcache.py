@@ -0,0 +1,46 @@
+import json
+import os
+
+class SymbolCache():
+  '''
+  Symbol offsets per guest binary, saved as JSON between runs.
+  Entries are keyed by the file's path and content hash, so a rebuilt libc or kernel is looked up again
+  rather than hooked at stale offsets.
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    self.entries = {} # "path:hash": {symbol: offset}
+    self.hit_cnt = 0
+    self.lookup_cnt = 0
+    if os.path.isfile(path):
+      with open(path, "r") as f:
+        self.entries = json.load(f)
+
+  @staticmethod
+  def key(file_path, content_hash):
+    return f"{file_path}:{content_hash}"
+
+  def resolve(self, file_path, content_hash, names, lookup):
+    '''
+    {name: offset} for each symbol in the file, calling lookup(name) only for ones not cached yet
+    '''
+    entry = self.entries.setdefault(SymbolCache.key(file_path, content_hash), {})
+    missing = [name for name in names if name not in entry]
+    for name in missing:
+      entry[name] = lookup(name)
+
+    self.hit_cnt += len(names) - len(missing)
+    self.lookup_cnt += len(missing)
+    if missing:
+      self.save()
+    return {name: entry[name] for name in names}
+
+  def save(self):
+    tmp_path = self.path + ".tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(self.entries, f, indent=2)
+    os.replace(tmp_path, self.path)
+
+  def __str__(self):
+    return f"[SYMBOLS] {self.path}: cache_hit_cnt: {self.hit_cnt}, lookup_cnt: {self.lookup_cnt}"
@@ -0,0 +1,204 @@
+import zstandard
+
+# Format ---------------------------------------------------------------------------------------------------------------
+
+# Block trace file:
+#
+#   header: MAGIC, VERSION, varint-prefixed arch string, varint-prefixed space string
+#   events: varint stream, each one of:
+#       0                                   -> block definition follows: varint pc, varint len, raw bytes
+#       ((block_id << 1) | is_exec) + 1     -> translate (is_exec == 0) or execute (is_exec == 1) of a block
+#
+# Blocks are defined once, on first use, and numbered in order of definition.
+# The whole file may be zstd-compressed, detected on read by the zstd frame magic.
+
+MAGIC = b"IRTR"
+VERSION = 1
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def encode_varint(val):
+    assert(val >= 0)
+    out = bytearray()
+    while True:
+        byte = val & 0x7f
+        val >>= 7
+        if val:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def decode_varint(buf, pos):
+    val = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        val |= (byte & 0x7f) << shift
+        if not (byte & 0x80):
+            return val, pos
+        shift += 7
+
+# Capture --------------------------------------------------------------------------------------------------------------
+
+class TraceWriter():
+
+    '''
+    Streams translated/executed blocks to a compact trace file.
+    Drop-in for SBEval in run.py callbacks: lift_block() logs a translation, log_block() an execution.
+    '''
+
+    def __init__(self, path, arch, space, compress = True):
+        self.file = open(path, "wb")
+        self.compressor = None
+        self.stream = self.file
+        if compress:
+            self.compressor = zstandard.ZstdCompressor()
+            self.stream = self.compressor.stream_writer(self.file)
+
+        self.block_ids = {}
+        self.translate_cnt = 0
+        self.exec_cnt = 0
+
+        self.stream.write(MAGIC + bytes([VERSION]))
+        for s in [str(arch), str(space)]:
+            s = s.encode()
+            self.stream.write(encode_varint(len(s)) + s)
+
+    def get_block_id(self, pc, data):
+        key = (pc, bytes(data))
+        block_id = self.block_ids.get(key, None)
+        if block_id == None:
+            block_id = len(self.block_ids)
+            self.block_ids[key] = block_id
+            self.stream.write(b"\x00" + encode_varint(pc) + encode_varint(len(key[1])) + key[1])
+        return block_id
+
+    def lift_block(self, pc, data):
+        self.translate_cnt += 1
+        self.stream.write(encode_varint((self.get_block_id(pc, data) << 1) + 1))
+
+    def log_block(self, pc, data):
+        self.exec_cnt += 1
+        self.stream.write(encode_varint(((self.get_block_id(pc, data) << 1) | 1) + 1))
+
+    def close(self):
+        if self.compressor:
+            self.stream.close()
+        else:
+            self.file.close()
+
+    def __str__(self):
+        return (
+            f"[TRACE] unique_bb_cnt: {len(self.block_ids)}, "
+            f"translate_cnt: {self.translate_cnt}, "
+            f"exec_cnt: {self.exec_cnt}"
+        )
+
+# Replay ---------------------------------------------------------------------------------------------------------------
+
+# Longest event head: a block definition's marker, pc and length varints (64-bit values, 10 bytes each)
+MAX_HEAD_SIZE = 30
+
+class StreamWindow():
+
+    '''
+    Bytes from pos onward in a (possibly decompressing) stream, refilled a chunk at a time.
+    Callers decode straight out of buf and hand pos back before the next fill().
+    '''
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = b""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, byte_cnt):
+
+        '''
+        Make byte_cnt bytes available from pos, fewer only at the end of the stream. Returns how many are.
+        '''
+
+        if ((len(self.buf) - self.pos) < byte_cnt) and (not self.eof):
+            chunks = [self.buf[self.pos:]]
+            avail = len(chunks[0])
+            while (avail < byte_cnt) and (not self.eof):
+                chunk = self.stream.read(max(self.chunk_size, byte_cnt - avail))
+                if chunk:
+                    chunks.append(chunk)
+                    avail += len(chunk)
+                else:
+                    self.eof = True
+            self.buf = b"".join(chunks)
+            self.pos = 0
+        return len(self.buf) - self.pos
+
+class TraceReader():
+
+    '''
+    Iterates (is_exec, pc, bytes) events from a trace file.
+    The file is read and decompressed as a stream, chunk_size bytes at a time, so memory use doesn't grow with the
+    trace: only the block definitions seen so far are kept.
+    '''
+
+    def __init__(self, path, chunk_size = (1 << 20)):
+        self.path = path
+        self.chunk_size = chunk_size
+
+        with open(path, "rb") as f:
+            self.is_compressed = (f.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC)
+            f.seek(0)
+            (_, (self.arch, self.space)) = self.read_header(f)
+
+    def read_header(self, f):
+
+        '''
+        Window over the file's (decompressed) contents positioned at the first event, plus the header fields
+        '''
+
+        stream = zstandard.ZstdDecompressor().stream_reader(f) if self.is_compressed else f
+        window = StreamWindow(stream, self.chunk_size)
+        window.fill(len(MAGIC) + 1)
+        buf = window.buf
+        if (not buf.startswith(MAGIC)) or (len(buf) <= len(MAGIC)) or (buf[len(MAGIC)] != VERSION):
+            raise RuntimeError(f"Not a version {VERSION} block trace: {self.path}")
+
+        window.pos = len(MAGIC) + 1
+        fields = []
+        for _ in range(2):
+            window.fill(MAX_HEAD_SIZE)
+            str_len, window.pos = decode_varint(window.buf, window.pos)
+            window.fill(str_len)
+            fields.append(window.buf[window.pos:window.pos + str_len].decode())
+            window.pos += str_len
+        return (window, fields)
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            (window, _) = self.read_header(f)
+            buf = window.buf
+            pos = window.pos
+            blocks = []
+            while True:
+                # Refill only near the end of the window, most events decode straight from buf
+                if (len(buf) - pos) < MAX_HEAD_SIZE:
+                    window.pos = pos
+                    if window.fill(MAX_HEAD_SIZE) == 0:
+                        return
+                    (buf, pos) = (window.buf, window.pos)
+
+                val, pos = decode_varint(buf, pos)
+                if val == 0:
+                    pc, pos = decode_varint(buf, pos)
+                    block_len, pos = decode_varint(buf, pos)
+                    if (len(buf) - pos) < block_len:
+                        window.pos = pos
+                        window.fill(block_len)
+                        (buf, pos) = (window.buf, window.pos)
+                    blocks.append((pc, bytes(buf[pos:pos + block_len])))
+                    pos += block_len
+                else:
+                    val -= 1
+                    pc, data = blocks[val >> 1]
+                    yield (bool(val & 1), pc, data)
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+
+from sys import argv
+import os
+import sys
+import time
+import json
+import random
+import struct
+import platform
+import subprocess
+
+import pypcode
+
+import switchboard
+import lift_pool
+import lift_stats
+import test
+
+# Corpus ---------------------------------------------------------------------------------------------------------------
+
+def gen_corpus(block_cnt, snippets, base_addr = 0x100000, gap = 0):
+
+    '''
+    Distinct (addr, bytes) blocks built from test snippets and laid out back to back (or gap bytes apart),
+    so every block misses the result cache
+    '''
+
+    corpus = []
+    addr = base_addr
+    for i in range(block_cnt):
+        data = snippets[i % len(snippets)].bytes
+        corpus.append((addr, data))
+        addr += len(data) + gap
+    return corpus
+
+x86_64_snippets = [test.bb_call_imm, test.bb_call_neg_imm, test.bb_call_reg, test.bb_ret]
+
+# Per-arch instruction vocabulary for generated blocks: straight-line body instrs, then one terminator.
+# Terminators are (kind, encoder) with the encoder taking (instr_addr, rng), kind "none" is a plain jump.
+
+def x86_call_rel32(addr, rng):
+    return b"\xe8" + struct.pack("<i", rng.randint(-0x100000, 0x100000))
+
+def x86_jmp_rel32(addr, rng):
+    return b"\xe9" + struct.pack("<i", rng.randint(-0x100000, 0x100000))
+
+def arm_bl(addr, rng):
+    return struct.pack("<I", 0xeb000000 | (rng.randint(-0x10000, 0x10000) & 0xffffff))
+
+def arm_b(addr, rng):
+    return struct.pack("<I", 0xea000000 | (rng.randint(-0x10000, 0x10000) & 0xffffff))
+
+def mips_jal(addr, rng):
+    trgt = (addr & 0xf0000000) | (rng.randrange(0, 0x1000000) << 2)
+    return struct.pack(">I", 0x0c000000 | ((trgt >> 2) & 0x3ffffff)) + b"\x00\x00\x00\x00"
+
+ARCH_VOCAB = {
+    "i386" : {
+        "body" : [
+            b"\x89\xd8",                # mov eax, ebx
+            b"\x40",                    # inc eax
+            b"\x31\xc0",                # xor eax, eax
+            b"\x05\x37\x13\x00\x00",    # add eax, 0x1337
+            b"\x53",                    # push ebx
+            b"\x5b",                    # pop ebx
+        ],
+        "term" : [
+            ("call_imm", x86_call_rel32),
+            ("call_reg", lambda addr, rng: b"\xff\xd0"),    # call eax
+            ("ret", lambda addr, rng: b"\xc3"),
+            ("none", x86_jmp_rel32),
+            ("none", lambda addr, rng: b"\x74" + bytes([rng.randrange(0x80)])),  # jz rel8
+        ],
+    },
+    "x86_64" : {
+        "body" : [
+            b"\x48\x89\xd8",            # mov rax, rbx
+            b"\x48\xff\xc0",            # inc rax
+            b"\x48\x31\xc0",            # xor rax, rax
+            b"\x48\x05\x37\x13\x00\x00",  # add rax, 0x1337
+            b"\x53",                    # push rbx
+            b"\x5b",                    # pop rbx
+        ],
+        "term" : [
+            ("call_imm", x86_call_rel32),
+            ("call_reg", lambda addr, rng: b"\xff\xd0"),    # call rax
+            ("ret", lambda addr, rng: b"\xc3"),
+            ("none", x86_jmp_rel32),
+            ("none", lambda addr, rng: b"\x74" + bytes([rng.randrange(0x80)])),  # jz rel8
+        ],
+    },
+    "arm" : {
+        "body" : [
+            b"\x0f\x00\xa0\xe1",        # mov r0, pc
+            b"\x02\x10\xa0\xe3",        # mov r1, #2
+            b"\x01\x20\x81\xe0",        # add r2, r1, r1
+            b"\x01\x30\x43\xe2",        # sub r3, r3, #1
+        ],
+        "term" : [
+            ("call_imm", arm_bl),
+            ("call_reg", lambda addr, rng: b"\x33\xff\x2f\xe1"),  # blx r3
+            ("ret", lambda addr, rng: b"\x1e\xff\x2f\xe1"),       # bx lr
+            ("none", arm_b),
+        ],
+    },
+    "mips" : {
+        "body" : [
+            b"\x25\x08\x00\x01",        # addiu t0, t0, 1
+            b"\x01\x00\x48\x25",        # move t1, t0
+            b"\x8f\xaa\x00\x00",        # lw t2, 0(sp)
+        ],
+        "term" : [
+            ("call_imm", mips_jal),
+            ("call_reg", lambda addr, rng: b"\x03\x20\xf8\x09\x00\x00\x00\x00"),   # jalr t9; nop
+            ("ret", lambda addr, rng: b"\x03\xe0\x00\x08\x00\x00\x00\x00"),        # jr ra; nop
+            ("none", lambda addr, rng: b"\x10\x00\x00\x10\x00\x00\x00\x00"),       # b 0x44; nop
+        ],
+    },
+}
+
+def gen_arch_corpus(arch, block_cnt, seed = 0, base_addr = 0x400000, max_body = 12):
+
+    '''
+    Deterministic (addr, bytes) blocks for an arch: the arch's test.py snippets first,
+    then random-length generated blocks laid out back to back
+    '''
+
+    rng = random.Random(seed)
+    vocab = ARCH_VOCAB[arch]
+    corpus = [(s.addr, s.bytes) for s in test.__dict__.values() if isinstance(s, test.TestSnippet) and s.arch == arch]
+
+    addr = base_addr
+    while len(corpus) < block_cnt:
+        data = b"".join(rng.choice(vocab["body"]) for _ in range(rng.randint(1, max_body)))
+        kind, encode = rng.choice(vocab["term"])
+        data += encode(addr + len(data), rng)
+        corpus.append((addr, data))
+        addr += len(data)
+    return corpus[:block_cnt]
+
+# Benchmarks -----------------------------------------------------------------------------------------------------------
+
+def bench_bap(block_cnt, worker_cnt, batch_size):
+
+    '''
+    Per-block wall-clock latency and `mc` calls per block: one call per block, lift_blocks() batches, worker pool.
+    Blocks are spaced apart, batches from live execution order are rarely address-contiguous.
+    '''
+
+    corpus = gen_corpus(block_cnt, x86_64_snippets, gap = 0x10)
+
+    sb = switchboard.SBBap("x86_64")
+    start_time = time.perf_counter()
+    for addr, data in corpus:
+        sb.lift_block(addr, data)
+    per_call_sec = (time.perf_counter() - start_time) / block_cnt
+
+    sb_batch = switchboard.SBBap("x86_64")
+    start_time = time.perf_counter()
+    for i in range(0, block_cnt, batch_size):
+        sb_batch.lift_blocks(corpus[i:(i + batch_size)])
+    batch_sec = (time.perf_counter() - start_time) / block_cnt
+
+    pool = lift_pool.LiftPool(switchboard.SBBap, worker_cnt, batch_size)
+    sb_pool = switchboard.SBBap("x86_64", pool=pool)
+    start_time = time.perf_counter()
+    for addr, data in corpus:
+        sb_pool.lift_block(addr, data)
+    sb_pool.flush()
+    pool_sec = (time.perf_counter() - start_time) / block_cnt
+    pool.close()
+
+    for other in [sb_batch, sb_pool]:
+        assert(sb.call_imm_cnt == other.call_imm_cnt)
+        assert(sb.call_reg_cnt == other.call_reg_cnt)
+        assert(sb.ret_cnt == other.ret_cnt)
+
+    print(
+        f"[BAP] block_cnt: {block_cnt}, "
+        f"per_call: {per_call_sec:.6f} sec/block ({(sb.mc_cnt / block_cnt):.3f} mc/block), "
+        f"batch {batch_size}: {batch_sec:.6f} sec/block ({(sb_batch.mc_cnt / block_cnt):.3f} mc/block), "
+        f"pool ({pool.worker_cnt} workers, batch {batch_size}): {pool_sec:.6f} sec/block, "
+        f"speedup: {(per_call_sec / batch_sec):.2f}x batched, {(per_call_sec / pool_sec):.2f}x pool"
+    )
+
+def bench_lift_blocks(block_cnt, run_bap):
+
+    '''
+    Blocks/second per IR, one lift_block() call per block vs. one lift_blocks() call for all
+    '''
+
+    corpus = gen_corpus(block_cnt, x86_64_snippets)
+    sb_classes = [switchboard.SBVex, switchboard.SBPCode]
+    if run_bap:
+        sb_classes.append(switchboard.SBBap)
+
+    for sb_cls in sb_classes:
+        sb = sb_cls("x86_64")
+        start_time = time.perf_counter()
+        for addr, data in corpus:
+            sb.lift_block(addr, data)
+        single_sec = time.perf_counter() - start_time
+
+        sb_batch = sb_cls("x86_64")
+        start_time = time.perf_counter()
+        sb_batch.lift_blocks(corpus)
+        batch_sec = time.perf_counter() - start_time
+
+        assert(sb.call_imm_cnt == sb_batch.call_imm_cnt)
+        assert(sb.call_reg_cnt == sb_batch.call_reg_cnt)
+        assert(sb.ret_cnt == sb_batch.ret_cnt)
+
+        print(
+            f"[{sb.ir}] block_cnt: {block_cnt}, "
+            f"lift_block: {(block_cnt / single_sec):.1f} blocks/sec, "
+            f"lift_blocks: {(block_cnt / batch_sec):.1f} blocks/sec"
+        )
+
+def legacy_pcode_classify(sb, start_addr, data):
+
+    '''
+    Baseline: the original op-name string compares over every op of every instruction
+    '''
+
+    start_time = time.perf_counter()
+    ba_data = bytearray(data)
+    sb.loader.setData(start_addr, ba_data, len(ba_data))
+    addr = pypcode.Address(sb.def_space, start_addr)
+    lastaddr = pypcode.Address(sb.def_space, start_addr + len(ba_data))
+
+    done = False
+    while addr < lastaddr:
+        sb.emit.clearCache()
+        length = sb.trans.oneInstruction(sb.emit, addr)
+        for op in sb.emit.opcache:
+            op_name = pypcode.get_opname(op.getOpcode())
+            if op_name in ("CALL", "CALLIND", "RETURN"):
+                done = True
+        if done:
+            break
+        addr = addr + length
+    return time.perf_counter() - start_time
+
+def bench_pcode_classifier(iter_cnt):
+
+    '''
+    Per-block PCODE lift time, original op-name classifier vs. integer opcode fast path
+    '''
+
+    sb = switchboard.SBPCode("x86_64")
+    for snippet in x86_64_snippets:
+        legacy_sec = sum(legacy_pcode_classify(sb, snippet.addr, snippet.bytes) for _ in range(iter_cnt)) / iter_cnt
+
+        fast_sec = 0
+        for _ in range(iter_cnt):
+            start_time = time.perf_counter()
+            sb.lift_new_block(snippet.addr, snippet.bytes)
+            fast_sec += time.perf_counter() - start_time
+        fast_sec /= iter_cnt
+
+        print(
+            f"[PCODE] {snippet.type.value}: "
+            f"by_name: {legacy_sec:.6f} sec/block, "
+            f"by_opcode: {fast_sec:.6f} sec/block, "
+            f"speedup: {(legacy_sec / fast_sec):.2f}x"
+        )
+
+def bench_prefilter(block_cnt, sb_classes = None):
+
+    '''
+    Full lifting vs. last-instruction pre-filter per arch and IR.
+    False negatives are counted with every skipped block audited, speed with no audits.
+    '''
+
+    for arch in ARCH_VOCAB:
+        corpus = gen_arch_corpus(arch, block_cnt)
+        for sb_cls in (sb_classes or [switchboard.SBVex, switchboard.SBPCode]):
+            sb_full = sb_cls(arch)
+            start_time = time.perf_counter()
+            for addr, data in corpus:
+                sb_full.lift_block(addr, data)
+            full_sec = time.perf_counter() - start_time
+
+            sb_fast = sb_cls(arch)
+            sb_fast.enable_prefilter(audit_every = 0)
+            start_time = time.perf_counter()
+            for addr, data in corpus:
+                sb_fast.lift_block(addr, data)
+            filter_sec = time.perf_counter() - start_time
+
+            sb_audit = sb_cls(arch)
+            sb_audit.enable_prefilter(audit_every = 1)
+            for addr, data in corpus:
+                sb_audit.lift_block(addr, data)
+
+            fn_rate = (sb_audit.prefilter_fn_cnt / sb_audit.prefilter_audit_cnt) if sb_audit.prefilter_audit_cnt else 0.0
+            print(
+                f"[{sb_full.ir}] {arch} block_cnt: {block_cnt}, "
+                f"full: {(block_cnt / full_sec):.1f} blocks/sec, "
+                f"prefilter: {(block_cnt / filter_sec):.1f} blocks/sec, "
+                f"skip_cnt: {sb_fast.prefilter_skip_cnt}, "
+                f"false_neg_rate: {fn_rate:.6f}"
+            )
+
+# Regression Suite -----------------------------------------------------------------------------------------------------
+
+def lib_version(name):
+    try:
+        from importlib import metadata
+        return metadata.version(name)
+    except Exception:
+        return None
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)),
+            stderr = subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def time_pass(sb, corpus):
+
+    '''
+    One lift_block() pass over the corpus, per-block latency histogram and blocks/second
+    '''
+
+    hist = lift_stats.LogHistogram()
+    pass_start = time.perf_counter()
+    for addr, data in corpus:
+        start_time = time.perf_counter()
+        sb.lift_block(addr, data)
+        hist.add(time.perf_counter() - start_time)
+    pass_sec = time.perf_counter() - pass_start
+
+    return {
+        "block_cnt" : len(corpus),
+        "total_sec" : pass_sec,
+        "blocks_per_sec" : (len(corpus) / pass_sec) if pass_sec else 0.0,
+        "mean_sec" : (hist.total_sec / hist.cnt) if hist.cnt else 0.0,
+        "p50_sec" : hist.percentile(50),
+        "p90_sec" : hist.percentile(90),
+        "p99_sec" : hist.percentile(99),
+        "max_sec" : hist.max_sec,
+    }
+
+def bench_suite(block_cnt, run_bap, out_path = None, archs = None, seed = 0):
+
+    '''
+    Cold (every block lifted) vs. warm (every block a result cache hit) lift_block() timing,
+    per arch and IR, over a fixed generated corpus. No PANDA or guest needed.
+    '''
+
+    sb_classes = [switchboard.SBVex, switchboard.SBPCode]
+    if run_bap:
+        sb_classes.append(switchboard.SBBap)
+
+    results = {
+        "meta" : {
+            "block_cnt" : block_cnt,
+            "seed" : seed,
+            "git_rev" : git_rev(),
+            "python" : platform.python_version(),
+            "pyvex" : lib_version("pyvex"),
+            "pypcode" : lib_version("pypcode"),
+            "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results" : [],
+    }
+
+    for arch in (archs or list(ARCH_VOCAB)):
+        corpus = gen_arch_corpus(arch, block_cnt, seed)
+        for sb_cls in sb_classes:
+            sb = sb_cls(arch)
+            cold = time_pass(sb, corpus)
+            warm = time_pass(sb, corpus)
+            results["results"].append({
+                "arch" : arch,
+                "ir" : str(sb.ir),
+                "cold" : cold,
+                "warm" : warm,
+                "call_imm_cnt" : sb.call_imm_cnt,
+                "call_reg_cnt" : sb.call_reg_cnt,
+                "ret_cnt" : sb.ret_cnt,
+                "lift_fail_cnt" : sb.bb_result_cache.get_fail_cnt(),
+            })
+
+            for label, res in [("cold", cold), ("warm", warm)]:
+                print(
+                    f"[{sb.ir}] {arch} {label}: "
+                    f"{res['blocks_per_sec']:.1f} blocks/sec, "
+                    f"p50: {res['p50_sec']:.6f} sec, "
+                    f"p90: {res['p90_sec']:.6f} sec, "
+                    f"p99: {res['p99_sec']:.6f} sec"
+                )
+
+    if out_path:
+        with open(out_path, "w") as f:
+            json.dump(results, f, indent = 4)
+        print(f"Wrote {out_path}")
+    return results
+
+# Run ------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    # Hacky 1st arg -> "suite" runs the per-arch regression suite: suite <block_cnt> <out_json> <opt_bap>
+    if len(argv) > 1 and argv[1] == "suite":
+        block_cnt = int(argv[2]) if len(argv) > 2 else 1000
+        out_path = argv[3] if len(argv) > 3 else "bench_suite.json"
+        run_bap = (argv[4] != "no_bap") if len(argv) > 4 else False
+        bench_suite(block_cnt, run_bap, out_path)
+        sys.exit(0)
+
+    block_cnt = int(argv[1]) if len(argv) > 1 else 1000
+    worker_cnt = int(argv[2]) if len(argv) > 2 else os.cpu_count()
+    batch_size = int(argv[3]) if len(argv) > 3 else 64
+
+    bench_pcode_classifier(block_cnt)
+    bench_prefilter(block_cnt)
+    bench_lift_blocks(block_cnt, run_bap = True)
+    bench_bap(block_cnt, worker_cnt, batch_size)
@@ -1,14 +1,18 @@
+import hashlib
+import array
+
+DIGEST_SIZE = 16
+
 def byte_str(byte_arr, sep="\\x"):
     return (sep + sep.join('{:02x}'.format(x) for x in byte_arr)).strip()
 
-class HashableBytearray(bytearray):
+def block_digest(bb_bytes):
 
     '''
-    Hack for Python's hashing rules
+    Fixed-size digest of block bytes, used in cache keys instead of the bytes themselves
     '''
 
-    def __hash__(self):
-        return hash(byte_str(self))
+    return hashlib.blake2b(bb_bytes, digest_size=DIGEST_SIZE).digest()
 
 class BBResult():
 
@@ -16,10 +20,12 @@ class BBResult():
     Log IR hit/miss
     '''
 
+    __slots__ = ("arch", "addr", "bb_bytes", "ir_dst", "true_dst", "is_miss", "is_lift_exception")
+
     def __init__(self, arch, addr, bb_bytes, ir_dst, true_dst, lift_exception = False):
         self.arch = str(arch)
         self.addr = addr
-        self.bb_bytes = HashableBytearray(bb_bytes)
+        self.bb_bytes = bytes(bb_bytes)
         self.ir_dst = ir_dst
         self.true_dst = true_dst
         self.is_miss = None
@@ -30,7 +36,7 @@ class BBResult():
         self.is_lift_exception = lift_exception
 
     def __eq__(self, other):
-        if isinstance(other, BBResult):
+        if isinstance(other, (BBResult, BBResultView)):
             return(
                 self.arch == other.arch
                 and self.addr == other.addr
@@ -43,8 +49,7 @@ class BBResult():
             return False
 
     def __hash__(self):
-        #return hash(tuple(sorted(self.__dict__.items())))
-        return hash(tuple(self.arch, self.addr, self.bb_bytes, self.ir_dst))
+        return hash((self.arch, self.addr, self.bb_bytes, self.ir_dst))
 
     @staticmethod
     def opt_int_to_str(val):
@@ -65,42 +70,328 @@ class BBResult():
             "bytes:": f"{byte_str(self.bb_bytes)}",
         }
 
+# Block Table ----------------------------------------------------------------------------------------------------------
+
+class BlockTable():
+
+    '''
+    Interned blocks: each distinct (addr, bytes) is stored once as immutable bytes and numbered in order.
+    SBEval shares one table across every IR's result cache.
+    '''
+
+    def __init__(self, verify_bytes = False):
+        self.verify_bytes = verify_bytes
+        self.ids = {}
+        self.collisions = {}
+        self.addrs = array.array("Q")
+        self.blocks = []
+        self.collision_cnt = 0
+
+        # Last interned block, repeat lookups with the same bytes object skip hashing
+        self.last_addr = None
+        self.last_bytes = None
+        self.last_bid = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get_id(self, addr, bb_bytes):
+        if (bb_bytes is self.last_bytes) and (addr == self.last_addr):
+            return self.last_bid
+
+        bid = self.ids.get((addr, block_digest(bb_bytes)), None)
+        if (bid != None) and self.verify_bytes and (self.blocks[bid] != bb_bytes):
+            bid = self.collisions.get((addr, bytes(bb_bytes)), None)
+        return bid
+
+    def intern(self, addr, bb_bytes):
+        bid = self.get_id(addr, bb_bytes)
+        if bid == None:
+            bid = len(self.blocks)
+            key = (addr, block_digest(bb_bytes))
+            if key in self.ids:
+                self.collision_cnt += 1
+                self.collisions[(addr, bytes(bb_bytes))] = bid
+            else:
+                self.ids[key] = bid
+            self.addrs.append(addr)
+            self.blocks.append(bytes(bb_bytes))
+
+        self.last_addr = addr
+        self.last_bytes = self.blocks[bid]
+        self.last_bid = bid
+        return bid
+
+    def canonical(self, addr, bb_bytes):
+
+        '''
+        The interned bytes object for a block, interning it if new
+        '''
+
+        return self.blocks[self.intern(addr, bb_bytes)]
+
+# Result Cache ---------------------------------------------------------------------------------------------------------
+
+class BBResultView():
+
+    '''
+    Read-only BBResult for one block of a BBResultCache, fields are read from the cache's columns
+    '''
+
+    __slots__ = ("bbc", "bid")
+
+    def __init__(self, bbc, bid):
+        self.bbc = bbc
+        self.bid = bid
+
+    @property
+    def arch(self):
+        return self.bbc.arch
+
+    @property
+    def addr(self):
+        return self.bbc.block_table.addrs[self.bid]
+
+    @property
+    def bb_bytes(self):
+        return self.bbc.block_table.blocks[self.bid]
+
+    @property
+    def ir_dst(self):
+        return self.bbc.get_ir_dst(self.bid)
+
+    @property
+    def true_dst(self):
+        return self.bbc.get_true_dst(self.bid)
+
+    @property
+    def is_miss(self):
+        return self.bbc.get_is_miss(self.bid)
+
+    @property
+    def is_lift_exception(self):
+        return bool(self.bbc.flags[self.bid] & BBResultCache.IS_FAIL)
+
+    __eq__ = BBResult.__eq__
+    __hash__ = BBResult.__hash__
+    to_str_dict = BBResult.to_str_dict
+
 class BBResultCache():
 
     '''
-    Result cache to avoid re-lifting
+    Result cache to avoid re-lifting.
+    Blocks are interned in a BlockTable (shared across IRs by SBEval, private otherwise),
+    results are compact columns indexed by block id and read back through BBResultView.
+    Hits, misses, and fails are classified as results change, so summaries don't rescan the cache.
     '''
 
-    def __init__(self):
-        self.cache = {}
+    HAS_RESULT      = 0x1
+    HAS_IR_DST      = 0x2
+    HAS_TRUE_DST    = 0x4
+    IS_FAIL         = 0x8
+
+    def __init__(self, arch = None, verify_bytes = False, block_table = None):
+        self.arch = str(arch)
+        self.owns_table = (block_table == None)
+        self.block_table = BlockTable(verify_bytes) if self.owns_table else block_table
+        self.clear()
+
+        # Lookup stats
+        self.lookup_cnt = 0
+        self.lookup_hit_cnt = 0
+
+    def clear(self):
+        if self.owns_table:
+            self.block_table = BlockTable(self.block_table.verify_bytes)
+
+        # Columns, block id -> value
+        self.ir_dst = array.array("Q")
+        self.true_dst = array.array("Q")
+        self.flags = array.array("B")
+        self.result_cnt = 0
+
+        # Classified results, block id -> None (insertion ordered set)
+        self.hits = {}
+        self.misses = {}
+        self.fails = {}
+
+    def grow(self, bid):
+        grow_cnt = max(bid + 1, len(self.block_table)) - len(self.flags)
+        if grow_cnt > 0:
+            self.ir_dst.frombytes(bytes(grow_cnt * self.ir_dst.itemsize))
+            self.true_dst.frombytes(bytes(grow_cnt * self.true_dst.itemsize))
+            self.flags.frombytes(bytes(grow_cnt))
+
+    def has_result(self, bid):
+        return (bid != None) and (bid < len(self.flags)) and bool(self.flags[bid] & BBResultCache.HAS_RESULT)
+
+    def get_ir_dst(self, bid):
+        return self.ir_dst[bid] if (self.flags[bid] & BBResultCache.HAS_IR_DST) else None
+
+    def get_true_dst(self, bid):
+        return self.true_dst[bid] if (self.flags[bid] & BBResultCache.HAS_TRUE_DST) else None
+
+    def get_is_miss(self, bid):
+        flags = self.flags[bid]
+        if (flags & BBResultCache.HAS_IR_DST) and (flags & BBResultCache.HAS_TRUE_DST):
+            return (self.ir_dst[bid] != self.true_dst[bid])
+        return None
+
+    def get_id(self, bbr):
+        if isinstance(bbr, BBResultView):
+            return bbr.bid
+        return self.block_table.get_id(bbr.addr, bbr.bb_bytes)
 
     def add(self, bbr):
         assert(isinstance(bbr, BBResult))
-        key = (bbr.addr, bbr.bb_bytes)
-        res = self.cache.get(key, None)
-        if res:
-            assert(res == bbr)
-        else:
-            self.cache[key] = bbr
+        self.put(bbr.addr, bbr.bb_bytes, bbr.ir_dst, bbr.true_dst, bbr.is_lift_exception)
+
+    def put(self, addr, bb_bytes, ir_dst, true_dst = None, lift_exception = False):
+
+        '''
+        Record a result straight into the columns, no BBResult object needed
+        '''
+
+        bid = self.block_table.intern(addr, bb_bytes)
+        if self.has_result(bid):
+            assert(self.get_ir_dst(bid) == ir_dst)
+            return
+
+        self.grow(bid)
+        flags = BBResultCache.HAS_RESULT
+        if ir_dst != None:
+            flags |= BBResultCache.HAS_IR_DST
+            self.ir_dst[bid] = ir_dst
+        if true_dst != None:
+            flags |= BBResultCache.HAS_TRUE_DST
+            self.true_dst[bid] = true_dst
+        if lift_exception:
+            flags |= BBResultCache.IS_FAIL
+        self.flags[bid] = flags
+        self.result_cnt += 1
+        self.classify(bid)
+
+    def classify(self, bid):
+        self.hits.pop(bid, None)
+        self.misses.pop(bid, None)
+        is_miss = self.get_is_miss(bid)
+        if is_miss == False:
+            self.hits[bid] = None
+        elif is_miss == True:
+            self.misses[bid] = None
+        if self.flags[bid] & BBResultCache.IS_FAIL:
+            self.fails[bid] = None
+
+    def set_true_dst(self, bbr, true_dst):
+        bid = self.get_id(bbr)
+        was_miss = self.get_is_miss(bid)
+        self.true_dst[bid] = true_dst
+        self.flags[bid] |= BBResultCache.HAS_TRUE_DST
+        if self.get_is_miss(bid) != was_miss:
+            self.classify(bid)
+
+    def get_result(self, addr, bb_bytes, count = True):
+        bid = self.block_table.get_id(addr, bb_bytes)
+        res = BBResultView(self, bid) if self.has_result(bid) else None
+        if count:
+            self.lookup_cnt += 1
+            if res:
+                self.lookup_hit_cnt += 1
+        return res
+
+    def get_lookup_stats(self):
+        miss_cnt = self.lookup_cnt - self.lookup_hit_cnt
+        hit_rate = (self.lookup_hit_cnt / self.lookup_cnt) if self.lookup_cnt else 0.0
+        return {
+            "arch" : self.arch,
+            "lookup_cnt" : self.lookup_cnt,
+            "hit_cnt" : self.lookup_hit_cnt,
+            "miss_cnt" : miss_cnt,
+            "hit_rate" : hit_rate,
+            "collision_cnt" : self.block_table.collision_cnt,
+        }
+
+    def values(self):
+        for bid in range(len(self.flags)):
+            if self.flags[bid] & BBResultCache.HAS_RESULT:
+                yield BBResultView(self, bid)
+
+    def get_hit_cnt(self):
+        return len(self.hits)
+
+    def get_miss_cnt(self):
+        return len(self.misses)
+
+    def get_fail_cnt(self):
+        return len(self.fails)
 
-    def get_result(self, addr, bb_byte_arr):
-        assert(isinstance(bb_byte_arr, bytearray))
-        key = (addr, HashableBytearray(bb_byte_arr))
-        return self.cache.get(key, None)
+    # Views are made on iteration, nothing is copied out of the columns
+    def iter_hits(self):
+        return (BBResultView(self, bid) for bid in self.hits)
 
-    def finalize(self):
-        for bbr in self.cache.values():
-            if (bbr.ir_dst != None) and (bbr.true_dst != None) and (bbr.ir_dst == bbr.true_dst):
-                bbr.is_miss = False
+    def iter_misses(self):
+        return (BBResultView(self, bid) for bid in self.misses)
+
+    def iter_fails(self):
+        return (BBResultView(self, bid) for bid in self.fails)
 
     def get_hit_list(self):
-        self.finalize()
-        return [bbr for bbr in self.cache.values() if bbr.is_miss == False]
+        return list(self.iter_hits())
 
     def get_miss_list(self):
-        self.finalize()
-        return [bbr for bbr in self.cache.values() if bbr.is_miss == True]
+        return list(self.iter_misses())
 
     def get_fail_list(self):
-        self.finalize()
-        return [bbr for bbr in self.cache.values() if bbr.is_lift_exception == True]
\ No newline at end of file
+        return list(self.iter_fails())
+
+# Translation Byte Cache -----------------------------------------------------------------------------------------------
+
+class TBBytesCache():
+
+    '''
+    Guest block bytes read once at translation, keyed by (pc, asid), reused on every execution.
+    Retranslation (incl. QEMU invalidating a TB after self-modifying writes) replaces the entry.
+    '''
+
+    def __init__(self):
+        self.blocks = {}
+        self.reuse_cnt = 0
+        self.read_cnt = 0
+        self.retrans_cnt = 0
+        self.modified_cnt = 0
+
+    def put(self, pc, asid, data):
+        key = (pc, asid)
+        old = self.blocks.get(key, None)
+        if old != None:
+            self.retrans_cnt += 1
+            if old != data:
+                self.modified_cnt += 1
+        self.blocks[key] = data
+
+    def invalidate(self, pc, asid):
+        self.blocks.pop((pc, asid), None)
+
+    def get(self, pc, asid, size):
+
+        '''
+        Cached bytes or None, a size mismatch means the TB changed under us
+        '''
+
+        data = self.blocks.get((pc, asid), None)
+        if (data != None) and (len(data) == size):
+            self.reuse_cnt += 1
+            return data
+        return None
+
+    def __str__(self):
+        exec_cnt = self.reuse_cnt + self.read_cnt
+        reuse_rate = (self.reuse_cnt / exec_cnt) if exec_cnt else 0.0
+        return (
+            f"[TB_BYTES] block_cnt: {len(self.blocks)}, "
+            f"reuse_cnt: {self.reuse_cnt}, "
+            f"read_cnt: {self.read_cnt}, "
+            f"reuse_rate: {reuse_rate:.6f}, "
+            f"retrans_cnt: {self.retrans_cnt}, "
+            f"modified_cnt: {self.modified_cnt}"
+        )
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+from sys import argv
+from multiprocessing.pool import ThreadPool
+import subprocess
+import itertools
+import json
+import time
+import os
+import re
+
+# Arg parse ------------------------------------------------------------------------------------------------------------
+
+# Matrix file is JSON, either a list of cells:
+#   [{"arch": "i386", "space": "user", "target_proc": "whoami", "recording": "none"}, ...]
+# or a dict of lists, expanded to every combination:
+#   {"arch": ["i386", "x86_64", "arm", "mips"], "space": ["user", "kernel"], "target_proc": ["whoami"], "recording": ["none"]}
+# Any args after the worker count are passed through to every run.py (run_bap, lift_store, lift_mode, ...)
+
+matrix_path = argv[1] if len(argv) > 1 else None
+out_dir = argv[2] if len(argv) > 2 else "campaign"
+worker_cnt = int(argv[3]) if len(argv) > 3 else os.cpu_count()
+run_args = argv[4:]
+
+CELL_FIELDS = ["arch", "space", "target_proc", "recording"]
+RUN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+STATUS_FILE = "status.json"
+
+# Matrix ---------------------------------------------------------------------------------------------------------------
+
+def load_cells(path):
+    with open(path, "r") as f:
+        matrix = json.load(f)
+
+    if isinstance(matrix, dict):
+        return [dict(zip(CELL_FIELDS, vals)) for vals in itertools.product(*[matrix[k] for k in CELL_FIELDS])]
+    return [{k: cell[k] for k in CELL_FIELDS} for cell in matrix]
+
+def cell_name(cell):
+    rec = os.path.basename(str(cell["recording"]))
+    return "_".join([cell["arch"], cell["space"], cell["target_proc"], rec])
+
+def cell_dir(cell):
+    return os.path.join(out_dir, cell_name(cell))
+
+def cell_status(cell):
+    try:
+        with open(os.path.join(cell_dir(cell), STATUS_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Run ------------------------------------------------------------------------------------------------------------------
+
+def run_cell(cell):
+
+    '''
+    One PANDA process per cell, run from the cell's own directory so outputs don't collide
+    '''
+
+    work_dir = cell_dir(cell)
+    os.makedirs(work_dir, exist_ok = True)
+
+    # Recordings are given relative to where the campaign was launched
+    rec = cell["recording"]
+    if (rec != "none") and (not os.path.isabs(rec)):
+        rec = os.path.abspath(rec)
+
+    cmd = ["python3", RUN_PY, cell["arch"], cell["space"], cell["target_proc"], rec] + run_args
+    start_time = time.perf_counter()
+    with open(os.path.join(work_dir, "run.log"), "w") as log:
+        ret_code = subprocess.call(cmd, cwd = work_dir, stdout = log, stderr = subprocess.STDOUT)
+
+    status = {
+        "cell": cell,
+        "ok": (ret_code == 0),
+        "ret_code": ret_code,
+        "wall_sec": time.perf_counter() - start_time,
+    }
+    with open(os.path.join(work_dir, STATUS_FILE), "w") as f:
+        json.dump(status, f, indent = 4)
+
+    print(f"[{'OK' if status['ok'] else 'FAIL'}] {cell_name(cell)} ({status['wall_sec']:.1f} sec)")
+    return status
+
+# Summary --------------------------------------------------------------------------------------------------------------
+
+SUMMARY_COLS = [
+    "call_imm_cnt",
+    "unique_true_pos",
+    "unique_false_pos",
+    "call_reg_cnt",
+    "ret_cnt",
+    "bb_cnt",
+    "avg_bb_lift_time",
+    "lift_fail_cnt",
+]
+
+IR_LINE = re.compile(r"^\[(VEX|PCODE|BAP)\] (.*)$")
+FIELD = re.compile(r"(\w+): ([\d.]+)")
+
+def parse_result(cell):
+
+    '''
+    Per-IR rows from a cell's result_<space>_<arch>.txt
+    '''
+
+    rows = []
+    path = os.path.join(cell_dir(cell), "result_" + cell["space"] + "_" + cell["arch"] + ".txt")
+    if not os.path.isfile(path):
+        return rows
+
+    with open(path, "r") as f:
+        for line in f:
+            m = IR_LINE.match(line.strip())
+            if m:
+                fields = dict(FIELD.findall(m.group(2)))
+                rows.append([cell_name(cell), m.group(1)] + [fields.get(col, "") for col in SUMMARY_COLS])
+    return rows
+
+def write_summary(cells):
+    header = ["cell", "ir"] + SUMMARY_COLS
+    rows = []
+    for cell in cells:
+        # A failed re-run may leave a stale result file behind
+        if (cell_status(cell) or {}).get("ok", False):
+            rows.extend(parse_result(cell))
+
+    with open(os.path.join(out_dir, "summary.tsv"), "w") as f:
+        for row in [header] + rows:
+            f.write("\t".join(row) + "\n")
+
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(val.ljust(w) for val, w in zip(row, widths)))
+
+# Main -----------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    if not matrix_path:
+        print(f"Usage: {argv[0]} <matrix_json> <opt_out_dir> <opt_worker_cnt> <opt_run_py_args...>")
+        raise RuntimeError
+
+    cells = load_cells(matrix_path)
+    os.makedirs(out_dir, exist_ok = True)
+
+    # Resume: only cells without a successful status are (re)run
+    todo = [cell for cell in cells if not (cell_status(cell) or {}).get("ok", False)]
+    print(f"{len(cells)} cells, {len(cells) - len(todo)} already done, running {len(todo)} on {worker_cnt} workers.")
+
+    with ThreadPool(max(1, worker_cnt)) as pool:
+        statuses = pool.map(run_cell, todo, chunksize = 1)
+
+    fail_cnt = sum(1 for status in statuses if not status["ok"])
+    write_summary(cells)
+    if fail_cnt:
+        print(f"{fail_cnt} cells failed, re-run the same command to retry them.")
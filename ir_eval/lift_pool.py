@@ -0,0 +1,64 @@
+import os
+import multiprocessing
+
+# Worker-side ----------------------------------------------------------------------------------------------------------
+
+class ResultCollector():
+
+    '''
+    Stands in for a LiftStore inside workers, collects lift results to ship back to the parent
+    '''
+
+    def __init__(self):
+        self.results = {}
+
+    def get(self, arch, ir, addr, bb_bytes):
+        return None
+
+    def put(self, arch, ir, addr, bb_bytes, ir_dst, kind, lift_time):
+        self.results[(addr, bytes(bb_bytes))] = (ir_dst, str(kind), lift_time)
+
+worker_sbs = {}
+
+def lift_batch(sb_cls, arch, blocks):
+
+    '''
+    Runs in a pool worker. Returns (ir_dst, kind, lift_time) per block.
+    IR objects don't pickle, so only the summary crosses the pipe.
+    '''
+
+    sb = worker_sbs.get((sb_cls, arch), None)
+    if not sb:
+        sb = sb_cls(arch, verbose = False, lift_store = ResultCollector())
+        worker_sbs[(sb_cls, arch)] = sb
+
+    # Parent de-duplicates, don't keep a second copy of every result here
+    sb.bb_result_cache.clear()
+    sb.lift_store.results.clear()
+
+    sb.lift_blocks(blocks)
+    return [sb.lift_store.results[(addr, data)] for addr, data in blocks]
+
+# Pool -----------------------------------------------------------------------------------------------------------------
+
+class LiftPool():
+
+    '''
+    Long-lived lifter worker processes for one IR, fed batches of blocks over pipes.
+    The Python workers persist, BAP itself doesn't: `bap mc` is one-shot with no streaming/server mode,
+    so a BAP worker spawns one `mc` per batch (SBBap.lift_new_blocks), not one per block.
+    '''
+
+    def __init__(self, sb_cls, worker_cnt = None, batch_size = 64):
+        self.sb_cls = sb_cls
+        self.worker_cnt = worker_cnt if worker_cnt else os.cpu_count()
+        self.batch_size = batch_size
+        self.max_in_flight = 2 * self.worker_cnt
+        self.pool = multiprocessing.Pool(self.worker_cnt)
+
+    def submit(self, arch, blocks):
+        return self.pool.apply_async(lift_batch, (self.sb_cls, arch, blocks))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
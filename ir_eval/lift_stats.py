@@ -0,0 +1,120 @@
+import math
+import heapq
+import collections
+
+import cache
+
+# Histogram ------------------------------------------------------------------------------------------------------------
+
+class LogHistogram():
+
+    '''
+    Log-bucketed latency histogram, BUCKETS_PER_OCTAVE buckets per doubling starting at MIN_SEC
+    Percentiles are bucket upper bounds, capped at the observed max
+    '''
+
+    MIN_SEC = 1e-7
+    BUCKETS_PER_OCTAVE = 4
+    BUCKET_CNT = 32 * BUCKETS_PER_OCTAVE
+
+    def __init__(self):
+        self.counts = [0] * LogHistogram.BUCKET_CNT
+        self.cnt = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+
+    @staticmethod
+    def bucket_idx(sec):
+        if sec <= LogHistogram.MIN_SEC:
+            return 0
+        idx = int(math.log2(sec / LogHistogram.MIN_SEC) * LogHistogram.BUCKETS_PER_OCTAVE)
+        return min(LogHistogram.BUCKET_CNT - 1, idx)
+
+    @staticmethod
+    def bucket_upper(idx):
+        return LogHistogram.MIN_SEC * (2 ** ((idx + 1) / LogHistogram.BUCKETS_PER_OCTAVE))
+
+    def add(self, sec):
+        self.counts[LogHistogram.bucket_idx(sec)] += 1
+        self.cnt += 1
+        self.total_sec += sec
+        self.max_sec = max(self.max_sec, sec)
+
+    def percentile(self, pct):
+        if self.cnt == 0:
+            return 0.0
+
+        rank = max(1, math.ceil((pct / 100) * self.cnt))
+        seen = 0
+        for idx, bucket_cnt in enumerate(self.counts):
+            seen += bucket_cnt
+            if seen >= rank:
+                return min(LogHistogram.bucket_upper(idx), self.max_sec)
+        return self.max_sec
+
+    def __str__(self):
+        mean_sec = (self.total_sec / self.cnt) if self.cnt else 0.0
+        return (
+            f"cnt: {self.cnt}, "
+            f"total: {self.total_sec:.6f} sec, "
+            f"mean: {mean_sec:.6f} sec, "
+            f"p50: {self.percentile(50):.6f} sec, "
+            f"p90: {self.percentile(90):.6f} sec, "
+            f"p99: {self.percentile(99):.6f} sec, "
+            f"max: {self.max_sec:.6f} sec"
+        )
+
+    def buckets_str(self):
+        return ", ".join(
+            f"<{LogHistogram.bucket_upper(idx):.1e}: {bucket_cnt}"
+            for idx, bucket_cnt in enumerate(self.counts) if bucket_cnt
+        )
+
+# Per-IR Profile -------------------------------------------------------------------------------------------------------
+
+class LiftProfile():
+
+    '''
+    Lift latency broken down by block outcome and block byte size.
+    Optionally keeps the N slowest blocks (with bytes) for inspection.
+    '''
+
+    def __init__(self):
+        self.all = LogHistogram()
+        self.by_kind = collections.defaultdict(LogHistogram)
+        self.by_size = collections.defaultdict(LogHistogram)
+        self.slow_n = 0
+        self.slowest = []
+
+    def enable_slowest(self, slow_n):
+        self.slow_n = slow_n
+
+    @staticmethod
+    def size_bucket(byte_cnt):
+        lo = 1 << max(0, byte_cnt.bit_length() - 1)
+        return (lo, (2 * lo) - 1)
+
+    def record(self, lift_time, start_addr, data, kind):
+        self.all.add(lift_time)
+        self.by_kind[str(kind)].add(lift_time)
+        self.by_size[LiftProfile.size_bucket(len(data))].add(lift_time)
+
+        if self.slow_n:
+            entry = (lift_time, start_addr, bytes(data), str(kind))
+            if len(self.slowest) < self.slow_n:
+                heapq.heappush(self.slowest, entry)
+            elif lift_time > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def to_str(self, ir):
+        lines = [
+            f"[{ir}] {self.all}",
+            f"[{ir}] buckets: {self.all.buckets_str()}",
+        ]
+        for kind in sorted(self.by_kind):
+            lines.append(f"[{ir}] kind {kind}: {self.by_kind[kind]}")
+        for (lo, hi) in sorted(self.by_size):
+            lines.append(f"[{ir}] bytes {lo}-{hi}: {self.by_size[(lo, hi)]}")
+        for (lift_time, start_addr, data, kind) in sorted(self.slowest, reverse = True):
+            lines.append(f"[{ir}] slow {lift_time:.6f} sec, addr: {start_addr:016x}, kind: {kind}, bytes: {cache.byte_str(data)}")
+        return "\n".join(lines)
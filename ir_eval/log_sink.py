@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import atexit
+import threading
+
+# Ring Buffer Sink -----------------------------------------------------------------------------------------------------
+
+class LogSink():
+
+    '''
+    Non-blocking log output for code running on the emulator thread.
+    emit() stores a (template, args) record in a preallocated ring, a background thread formats and writes it.
+    Templates are format strings or callables taking args. If the writer falls behind, the oldest records are
+    overwritten and counted as dropped rather than stalling the producer.
+    Slots carry their sequence number, the producer never waits for the writer, so a slot may be reused while
+    it's being drained: the writer only formats slots still holding the sequence it expects.
+    Progress functions are polled by the writer every progress_sec, not on the hot path.
+    '''
+
+    def __init__(self, capacity = (1 << 16), progress_sec = 5.0, poll_sec = 0.1, out = None):
+        self.capacity = capacity
+        self.ring = [None] * capacity
+        self.head = 0
+        self.tail = 0
+        self.emit_cnt = 0
+        self.drop_cnt = 0
+
+        self.progress_sec = progress_sec
+        self.poll_sec = poll_sec
+        self.progress_fns = []
+        self.out = out
+
+        # Writer thread and flush() both drain
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = os.getpid()
+
+    def start(self):
+        if self.thread == None:
+            self.thread = threading.Thread(target = self.run, name = "log_sink", daemon = True)
+            self.thread.start()
+
+    def emit(self, template, *args):
+        seq = self.head
+        self.ring[seq % self.capacity] = (seq, template, args)
+        self.head = seq + 1
+
+    def add_progress(self, progress_fn):
+        self.progress_fns.append(progress_fn)
+
+    def remove_progress(self, progress_fn):
+        if progress_fn in self.progress_fns:
+            self.progress_fns.remove(progress_fn)
+
+    @staticmethod
+    def format(template, args):
+        if callable(template):
+            return template(*args)
+        return template.format(*args)
+
+    def write(self, lines):
+        if lines:
+            out = self.out if self.out != None else sys.stdout
+            out.write("\n".join(lines) + "\n")
+            out.flush()
+
+    def drain(self):
+        with self.lock:
+            head = self.head
+            if (head - self.tail) > self.capacity:
+                self.drop_cnt += (head - self.tail) - self.capacity
+                self.tail = head - self.capacity
+
+            # Slots are left in place, clearing one could erase a record the producer just wrote there
+            lines = []
+            while self.tail < head:
+                (seq, template, args) = self.ring[self.tail % self.capacity]
+                if seq == self.tail:
+                    lines.append(LogSink.format(template, args))
+                else:
+                    self.drop_cnt += 1 # Overwritten by a newer record while draining
+                self.tail += 1
+            self.emit_cnt += len(lines)
+            self.write(lines)
+
+    def run(self):
+        next_progress = time.monotonic() + self.progress_sec
+        while True:
+            time.sleep(self.poll_sec)
+            self.drain()
+
+            now = time.monotonic()
+            if self.progress_sec and (now >= next_progress):
+                next_progress = now + self.progress_sec
+                with self.lock:
+                    self.write([progress_fn() for progress_fn in list(self.progress_fns)])
+
+    def flush(self):
+
+        '''
+        Write everything emitted so far from the calling thread, e.g. before printing results
+        '''
+
+        self.drain()
+
+    def __str__(self):
+        return (
+            f"[LOG] emit_cnt: {self.emit_cnt}, "
+            f"drop_cnt: {self.drop_cnt}"
+        )
+
+# Process-wide sink, writer thread started on first use (again in forked workers, threads don't survive fork)
+default_sink = None
+
+def flush_at_exit():
+
+    '''
+    The writer is a daemon thread, records still in the ring at exit are written here instead of lost
+    '''
+
+    if (default_sink != None) and (default_sink.pid == os.getpid()):
+        default_sink.flush()
+
+def get_sink():
+    global default_sink
+    if (default_sink == None) or (default_sink.pid != os.getpid()):
+        if default_sink == None:
+            atexit.register(flush_at_exit)
+        default_sink = LogSink()
+        default_sink.start()
+    return default_sink
@@ -0,0 +1,114 @@
+import struct
+
+# Last Instruction Filter ----------------------------------------------------------------------------------------------
+
+# Translated blocks end at their first control transfer, so a block can only be a call/ret
+# if its tail decodes to one. Checks are deliberately loose: a false positive just costs a full lift,
+# a false negative loses a result (measured by SwitchBoard's audit lifts).
+
+def x86_is_candidate(data):
+    n = len(data)
+    if n == 0:
+        return False
+
+    # ret, retf
+    if data[-1] in (0xc3, 0xcb):
+        return True
+
+    # ret imm16, retf imm16
+    if (n >= 3) and (data[-3] in (0xc2, 0xca)):
+        return True
+
+    # call rel32
+    if (n >= 5) and (data[-5] == 0xe8):
+        return True
+
+    # call far ptr16:32 (i386)
+    if (n >= 7) and (data[-7] == 0x9a):
+        return True
+
+    # call r/m (ff /2) and call far m (ff /3), modrm + up to 4 byte disp and a SIB byte
+    for i in range(2, min(n, 8) + 1):
+        if (data[-i] == 0xff) and (((data[-i + 1] >> 3) & 0x7) in (2, 3)):
+            return True
+
+    return False
+
+def arm_is_candidate(data):
+
+    '''
+    A32 only, anything not word-sized (e.g. Thumb) is passed through to the lifters
+    '''
+
+    if (len(data) < 4) or (len(data) % 4):
+        return True
+
+    (w,) = struct.unpack("<I", data[-4:])
+
+    # bl, blx imm
+    if (((w >> 24) & 0xf) == 0xb) or ((w >> 25) == 0x7d):
+        return True
+
+    # blx reg, bx reg (incl. bx lr)
+    if (w & 0x0ffffff0) in (0x012fff30, 0x012fff10):
+        return True
+
+    # ldm/pop with pc in the register list
+    if (((w >> 25) & 0x7) == 0x4) and ((w >> 20) & 0x1) and ((w >> 15) & 0x1):
+        return True
+
+    # ldr pc, [...]
+    if (((w >> 26) & 0x3) == 0x1) and ((w >> 20) & 0x1) and (((w >> 12) & 0xf) == 0xf):
+        return True
+
+    # Data processing into pc (e.g. mov pc, lr)
+    if (((w >> 26) & 0x3) == 0x0) and (((w >> 12) & 0xf) == 0xf):
+        return True
+
+    return False
+
+def mips_is_call_or_ret(w):
+    op = w >> 26
+    funct = w & 0x3f
+    rt = (w >> 16) & 0x1f
+
+    # jal, jalx, balc, jialc
+    if op in (0x03, 0x1d, 0x3a, 0x3e):
+        return True
+
+    # jr, jalr
+    if (op == 0x00) and (funct in (0x08, 0x09)):
+        return True
+
+    # bltzal, bgezal (incl. bal) and their likely forms
+    if (op == 0x01) and (rt in (0x10, 0x11, 0x12, 0x13)):
+        return True
+
+    return False
+
+def mips_is_candidate(data):
+
+    '''
+    Big-endian MIPS32, the transfer is either the last word or sits before its delay slot
+    '''
+
+    if (len(data) < 4) or (len(data) % 4):
+        return True
+
+    words = struct.unpack(">" + "I" * min(2, len(data) // 4), data[-min(8, len(data)):])
+    return any(mips_is_call_or_ret(w) for w in words)
+
+ARCH_FILTERS = {
+    "i386" : x86_is_candidate,
+    "x86_64" : x86_is_candidate,
+    "arm" : arm_is_candidate,
+    "mips" : mips_is_candidate,
+}
+
+def get_filter(arch):
+
+    '''
+    Returns a data -> bool candidate check for the arch, unknown arches pass every block
+    '''
+
+    return ARCH_FILTERS.get(str(arch), lambda data: True)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+from sys import argv
+import time
+
+import switchboard
+import bbtrace
+import sampler
+
+# Arg parse ------------------------------------------------------------------------------------------------------------
+
+trace_path = argv[1] if len(argv) > 1 else None
+enable_bap = argv[2] if len(argv) > 2 else "no_bap"
+lift_store_path = argv[3] if len(argv) > 3 else "none"
+dump_fmt = switchboard.DumpFormat(argv[4] if len(argv) > 4 else "json")
+profile_slow_n = int(argv[5]) if len(argv) > 5 else 0
+filter_mode = argv[6] if len(argv) > 6 else "full"
+pi_mode = argv[7] if len(argv) > 7 else "no_pi"
+sample_spec = argv[8] if len(argv) > 8 else "none"
+
+if not trace_path:
+    print(f"Usage: {argv[0]} <trace_file> <opt_bap> <opt_lift_store> <opt_json || jsonl || jsonl.gz || npy> <opt_slowest_n> <opt_full || prefilter> <opt_no_pi || pi> <opt_none || nth:N || reservoir:SIZE>")
+    raise RuntimeError
+
+enable_bap = (enable_bap != "no_bap")
+lift_store_path = None if lift_store_path == "none" else lift_store_path
+
+# Traces don't record guest instruction counts, so no window sampling here
+block_sampler = sampler.from_spec(sample_spec)
+if block_sampler and block_sampler.needs_instr_cnt:
+    raise RuntimeError
+
+# Replay ---------------------------------------------------------------------------------------------------------------
+
+# Offline equivalent of run.py's callbacks, no emulator required
+reader = bbtrace.TraceReader(trace_path)
+print(f"Replaying {reader.space} trace for {reader.arch}: {trace_path}")
+ir_eval = switchboard.SBEval(reader.arch, verbose=False, run_bap=enable_bap, lift_store_path=lift_store_path,
+    profile_slow_n=profile_slow_n, use_prefilter=(filter_mode == "prefilter"),
+    use_pi_cache=(pi_mode == "pi"), sampler=block_sampler, progress=True)
+
+start_time = time.perf_counter()
+for (is_exec, pc, data) in reader:
+    if is_exec:
+        ir_eval.log_block(pc, data)
+    else:
+        ir_eval.lift_block(pc, data)
+ir_eval.close()
+end_time = time.perf_counter()
+
+ir_eval.dump_result(reader.space)
+ir_eval.dump_misses(reader.space, dump_fmt)
+print(ir_eval)
+print(f"Replay time: {(end_time - start_time):.3f} sec")
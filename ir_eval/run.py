@@ -2,9 +2,14 @@
 
 from sys import argv
 import logging
+import os
+import time
 
 from pandare import blocking, Panda
 import switchboard
+import bbtrace
+import cache
+import sampler
 
 # Arg parse ------------------------------------------------------------------------------------------------------------
 
@@ -16,28 +21,130 @@ space = argv[2] if len(argv) > 2 else "user"
 trgt_proc = argv[3] if len(argv) > 3 else "whoami"
 rec_name = argv[4] if len(argv) > 4 else "none"
 enable_bap = argv[5] if len(argv) > 5 else "no_bap"
+lift_store_path = argv[6] if len(argv) > 6 else "none"
+lift_mode = argv[7] if len(argv) > 7 else "inline"
+dump_fmt = switchboard.DumpFormat(argv[8] if len(argv) > 8 else "json")
+profile_slow_n = int(argv[9]) if len(argv) > 9 else 0
+filter_mode = argv[10] if len(argv) > 10 else "full"
+pi_mode = argv[11] if len(argv) > 11 else "no_pi"
+sample_spec = argv[12] if len(argv) > 12 else "none"
 
 if space == "kernel":
     print("IR TEST ON KERNEL!")
 elif space == "user":
     print(f"IR TEST ON USERSPACE BIN: {trgt_proc}")
 else:
-    print(f"Usage: {argv[0]} <arch> <kernel || user> <user_procname> <opt_recording_name>")
+    print(f"Usage: {argv[0]} <arch> <kernel || user> <user_procname> <opt_recording_name> <opt_bap> <opt_lift_store> <opt_inline || queue || capture || dispatch> <opt_json || jsonl || jsonl.gz || npy> <opt_slowest_n> <opt_full || prefilter> <opt_no_pi || pi> <opt_none || nth:N || reservoir:SIZE || window:INSTRS:PERIOD>")
     raise RuntimeError
 
-# Hacky 5th arg -> if present use BAP as well
+# Hacky 5th arg -> if present use BAP as well, "bap_pool" lifts BAP blocks on a worker pool
+bap_workers = 0
 if enable_bap == "no_bap":
     print("Evalulating VEX and PCODE only.")
     enable_bap = False
 else:
     print("Evalulating VEX, PCODE, and BAP.")
+    if enable_bap == "bap_pool":
+        bap_workers = os.cpu_count()
+        print(f"Using {bap_workers} BAP workers.")
     enable_bap = True
 
+# Hacky 6th arg -> persistent lift store shared across runs, off ("none") by default so results never depend on earlier runs
+if lift_store_path == "none":
+    print("Lift store disabled, lifting all blocks.")
+    lift_store_path = None
+else:
+    print(f"Using lift store: {lift_store_path}")
+
+# Hacky 7th arg -> "queue" lifts on per-IR worker pools, callbacks only queue blocks
+# "capture" doesn't lift at all, just writes a block trace for offline replay.py runs
+# "dispatch" doesn't lift either, only runs callbacks and guest reads to measure their overhead
+lift_workers = 0
+trace_path = None
+if lift_mode == "queue":
+    lift_workers = max(1, os.cpu_count() // (3 if enable_bap else 2))
+    print(f"Queued lifting, {lift_workers} workers per IR.")
+elif lift_mode == "capture":
+    trace_path = "trace_" + space + "_" + arch + ".irtr"
+    print(f"Capturing block trace to: {trace_path}")
+elif lift_mode == "dispatch":
+    print("Dispatch only, no lifting.")
+elif lift_mode != "inline":
+    raise RuntimeError
+
+# Hacky 10th arg -> "prefilter" only lifts blocks whose last instruction may be a call/ret
+if filter_mode == "prefilter":
+    print("Pre-filtering blocks, only call/ret candidates are lifted.")
+elif filter_mode != "full":
+    raise RuntimeError
+
+# Hacky 11th arg -> "pi" reuses results for identical blocks at other addresses, rebasing PC-relative call targets
+if pi_mode == "pi":
+    print("Position-independent result cache enabled.")
+elif pi_mode != "no_pi":
+    raise RuntimeError
+
+# Hacky 12th arg -> evaluate a sample of blocks: every Nth unique, a reservoir of unique blocks,
+# or one window of INSTRS guest instructions out of every PERIOD windows
+block_sampler = sampler.from_spec(sample_spec)
+if block_sampler:
+    print(f"Sampling blocks: {block_sampler}")
+    if trace_path or (lift_mode == "dispatch"):
+        raise RuntimeError
+
 # Globals --------------------------------------------------------------------------------------------------------------
 
+# Lowest kernel virtual address per arch, anything below is userspace (MIPS32 kseg0 starts at 2GB)
+KERNEL_BASE = {
+    "i386": 0xc0000000,
+    "x86_64": 0xc000000000000000,
+    "arm": 0xc0000000,
+    "aarch64": 0xc000000000000000,
+    "mips": 0x80000000,
+    "mipsel": 0x80000000,
+    "mips64": 0xc000000000000000,
+    "ppc": 0xc0000000,
+}
+
+class DispatchCounter():
+
+    '''
+    Drop-in for SBEval that only counts blocks, for measuring callback + guest read overhead
+    '''
+
+    def __init__(self):
+        self.translate_cnt = 0
+        self.exec_cnt = 0
+
+    def lift_block(self, pc, data):
+        self.translate_cnt += 1
+
+    def log_block(self, pc, data):
+        self.exec_cnt += 1
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return f"[DISPATCH] translate_cnt: {self.translate_cnt}, exec_cnt: {self.exec_cnt}"
+
 bb_cnt = 0
+kernel_base = KERNEL_BASE[arch]
+# Plain ints: ~100 ns per callback vs ~280 ns with a Counter update (~50 ns for an empty callback, CPython 3.11)
+exec_cb_cnt = 0
+trans_cb_cnt = 0
+tb_bytes = cache.TBBytesCache()
+start_time = time.perf_counter()
 panda = Panda(generic = arch)
-ir_eval = switchboard.SBEval(arch, verbose=False, run_bap=enable_bap)
+if trace_path:
+    ir_eval = bbtrace.TraceWriter(trace_path, arch, space)
+elif lift_mode == "dispatch":
+    ir_eval = DispatchCounter()
+else:
+    ir_eval = switchboard.SBEval(arch, verbose=False, run_bap=enable_bap, lift_store_path=lift_store_path,
+        lift_workers=lift_workers, bap_workers=bap_workers, profile_slow_n=profile_slow_n,
+        use_prefilter=(filter_mode == "prefilter"), use_pi_cache=(pi_mode == "pi"),
+        sampler=block_sampler, progress=True)
 
 # Helpers --------------------------------------------------------------------------------------------------------------
 
@@ -49,12 +156,32 @@ def try_vm_read(panda, cpu, tb):
         logging.error(f"Failed to VM read {tb.size} bytes from 0x{tb.pc:08x}")
         return None
 
-# TODO: this is terrible, fix this!
-def really_in_kernel(addr):
-    if arch == "x86_64":
-        return (addr > 0xc000000000000000)
+# Kernel mappings are shared by every process, so kernel blocks aren't keyed by ASID
+def get_asid(cpu):
+    return panda.current_asid(cpu) if space == "user" else 0
+
+def trans_read(cpu, tb):
+    asid = get_asid(cpu)
+    data = try_vm_read(panda, cpu, tb)
+    if data:
+        tb_bytes.put(tb.pc, asid, data)
     else:
-        return (addr > 0xc0000000)
+        tb_bytes.invalidate(tb.pc, asid)
+    return data
+
+def exec_read(cpu, tb):
+    data = tb_bytes.get(tb.pc, get_asid(cpu), tb.size)
+    if data == None:
+        tb_bytes.read_cnt += 1
+        data = try_vm_read(panda, cpu, tb)
+    return data
+
+# Window sampling needs the guest instruction count, only read when it's in use
+need_instr_cnt = bool(block_sampler) and block_sampler.needs_instr_cnt
+
+def sync_instr_cnt():
+    if need_instr_cnt:
+        ir_eval.set_guest_instr_cnt(panda.rr_get_guest_instr_count())
 
 @blocking
 def run_cmd():
@@ -65,43 +192,70 @@ def run_cmd():
     finish_ir_eval()
 
 def finish_ir_eval():
-    ir_eval.dump_result(space)
-    ir_eval.dump_misses(space)
+    ir_eval.close()
+    if (not trace_path) and (lift_mode != "dispatch"):
+        ir_eval.dump_result(space)
+        ir_eval.dump_misses(space, dump_fmt)
     print(ir_eval)
+    print(tb_bytes)
+    print(
+        f"[RUN] mode: {lift_mode}, "
+        f"space: {space}, "
+        f"wall: {(time.perf_counter() - start_time):.3f} sec, "
+        f"exec_cb_cnt: {exec_cb_cnt}, "
+        f"trans_cb_cnt: {trans_cb_cnt}"
+    )
     panda.end_analysis()
 
 # Userspace ------------------------------------------------------------------------------------------------------------
 
-@panda.cb_after_block_exec(procname=trgt_proc)
+# Cheap checks first, panda.in_kernel() is a cffi call
 def bb_after_exec_usr(cpu, tb, exit_code):
-    if (space == "user") and (not panda.in_kernel(cpu) and not (really_in_kernel(tb.pc))) and (exit_code <= 1):
-        data = try_vm_read(panda, cpu, tb)
+    global exec_cb_cnt
+    exec_cb_cnt += 1
+    if (exit_code <= 1) and (tb.pc < kernel_base) and (not panda.in_kernel(cpu)):
+        data = exec_read(cpu, tb)
         if data:
+            sync_instr_cnt()
             ir_eval.log_block(tb.pc, data)
 
-@panda.cb_after_block_translate(procname=trgt_proc)
 def bb_after_trans_usr(cpu, tb):
-    if (space == "user") and (not panda.in_kernel(cpu) and not (really_in_kernel(tb.pc))):
-        data = try_vm_read(panda, cpu, tb)
+    global trans_cb_cnt
+    trans_cb_cnt += 1
+    if (tb.pc < kernel_base) and (not panda.in_kernel(cpu)):
+        data = trans_read(cpu, tb)
         if data:
+            sync_instr_cnt()
             ir_eval.lift_block(tb.pc, data)
 
 # Kernelspace ----------------------------------------------------------------------------------------------------------
 
-@panda.cb_after_block_exec
 def bb_after_exec_kern(cpu, tb, exit_code):
-    if (space == "kernel") and (panda.in_kernel(cpu)) and (exit_code <= 1):
-        data = try_vm_read(panda, cpu, tb)
+    global exec_cb_cnt
+    exec_cb_cnt += 1
+    if (exit_code <= 1) and (panda.in_kernel(cpu)):
+        data = exec_read(cpu, tb)
         if data:
+            sync_instr_cnt()
             ir_eval.log_block(tb.pc, data)
 
-@panda.cb_after_block_translate
 def bb_after_trans_kern(cpu, tb):
-    if (space == "kernel") and (panda.in_kernel(cpu)):
-        data = try_vm_read(panda, cpu, tb)
+    global trans_cb_cnt
+    trans_cb_cnt += 1
+    if panda.in_kernel(cpu):
+        data = trans_read(cpu, tb)
         if data:
+            sync_instr_cnt()
             ir_eval.lift_block(tb.pc, data)
 
+# Register only the pair for this run's space, so other blocks never enter Python
+if space == "user":
+    panda.cb_after_block_exec(procname=trgt_proc)(bb_after_exec_usr)
+    panda.cb_after_block_translate(procname=trgt_proc)(bb_after_trans_usr)
+else:
+    panda.cb_after_block_exec(bb_after_exec_kern)
+    panda.cb_after_block_translate(bb_after_trans_kern)
+
 # Run ------------------------------------------------------------------------------------------------------------------
 
 if rec_name == "none":
@@ -0,0 +1,151 @@
+import math
+import heapq
+import zlib
+
+# Conveniences ---------------------------------------------------------------------------------------------------------
+
+def block_key(addr, data):
+
+    '''
+    Cheap CRC32 identity for sampling decisions (same as NthSampler's), collisions only skew the sample slightly
+    '''
+
+    return zlib.crc32(data, addr & 0xffffffff)
+
+def wilson_interval(k, n, z = 1.96):
+
+    '''
+    Wilson score interval for k successes in n trials, 95% by default
+    '''
+
+    if n == 0:
+        return (0.0, 1.0)
+    p = k / n
+    denom = 1 + (z * z / n)
+    center = (p + (z * z / (2 * n))) / denom
+    half = (z * math.sqrt((p * (1 - p) / n) + (z * z / (4 * n * n)))) / denom
+    return (max(0.0, center - half), min(1.0, center + half))
+
+# Strategies -----------------------------------------------------------------------------------------------------------
+
+class NthSampler():
+
+    '''
+    Every Nth unique block, chosen by hashing (addr, bytes) so no per-block state is kept.
+    The same blocks are picked on every run, which keeps lift store hits useful across runs.
+    '''
+
+    needs_instr_cnt = False
+
+    def __init__(self, every_n):
+        assert(every_n > 0)
+        self.every_n = every_n
+
+    def is_sampled(self, addr, data, instr_cnt = None):
+        return (block_key(addr, data) % self.every_n) == 0
+
+    def would_sample(self, addr, data, instr_cnt = None):
+        return self.is_sampled(addr, data)
+
+    def includes(self, addr, data):
+        return self.is_sampled(addr, data)
+
+    def __str__(self):
+        return f"nth (every {self.every_n} unique blocks)"
+
+class ReservoirSampler():
+
+    '''
+    Uniform sample of sample_size unique blocks: the ones with the lowest seeded hash of their block_key (bottom-k).
+    Memory is bounded by sample_size, no record of every block seen is kept: a block whose hash is above the
+    current cut-off was either evicted or never admitted, and the cut-off only comes down.
+    Blocks evicted from the reservoir were lifted but are excluded from sampled statistics.
+    '''
+
+    needs_instr_cnt = False
+
+    def __init__(self, sample_size, seed = 0):
+        assert(sample_size > 0)
+        self.sample_size = sample_size
+        self.seed = seed
+        self.members = set()
+        self.heap = [] # Negated member hashes, the root is the cut-off
+        self.evict_cnt = 0
+
+    def hash(self, addr, data):
+        # Multiplicative mix, the lowest values of a raw CRC would cluster on similar blocks
+        return (((block_key(addr, data) ^ self.seed) * 0x9e3779b1) & 0xffffffff)
+
+    def is_sampled(self, addr, data, instr_cnt = None):
+        key = self.hash(addr, data)
+        if key in self.members:
+            return True
+
+        if len(self.heap) < self.sample_size:
+            heapq.heappush(self.heap, -key)
+        elif key < -self.heap[0]:
+            self.members.remove(-heapq.heappushpop(self.heap, -key))
+            self.evict_cnt += 1
+        else:
+            return False
+
+        self.members.add(key)
+        return True
+
+    def would_sample(self, addr, data, instr_cnt = None):
+
+        '''
+        What is_sampled() would answer now, without admitting the block
+        '''
+
+        key = self.hash(addr, data)
+        return (key in self.members) or (len(self.heap) < self.sample_size) or (key < -self.heap[0])
+
+    def includes(self, addr, data):
+        return self.hash(addr, data) in self.members
+
+    def __str__(self):
+        return f"reservoir ({len(self.members)} of {self.sample_size} unique blocks, evict_cnt: {self.evict_cnt})"
+
+class WindowSampler():
+
+    '''
+    Every period-th window of window_len guest instructions, by rr_guest_instr_count
+    '''
+
+    needs_instr_cnt = True
+
+    def __init__(self, window_len, period):
+        assert((window_len > 0) and (period > 0))
+        self.window_len = window_len
+        self.period = period
+
+    def is_sampled(self, addr, data, instr_cnt = None):
+        return ((instr_cnt // self.window_len) % self.period) == 0
+
+    def would_sample(self, addr, data, instr_cnt = None):
+        return self.is_sampled(addr, data, instr_cnt)
+
+    def includes(self, addr, data):
+        return True
+
+    def __str__(self):
+        return f"window ({self.window_len} instrs every {self.window_len * self.period})"
+
+def from_spec(spec):
+
+    '''
+    "none", "nth:<N>", "reservoir:<size>[:<seed>]", or "window:<instr_cnt>:<period>"
+    '''
+
+    fields = spec.split(":")
+    if fields[0] == "none":
+        return None
+    elif fields[0] == "nth":
+        return NthSampler(int(fields[1]))
+    elif fields[0] == "reservoir":
+        return ReservoirSampler(int(fields[1]), int(fields[2]) if len(fields) > 2 else 0)
+    elif fields[0] == "window":
+        return WindowSampler(int(fields[1]), int(fields[2]))
+    else:
+        raise RuntimeError(f"Unknown sampling spec: {spec}")
@@ -0,0 +1,165 @@
+import sqlite3
+import collections
+
+import cache
+
+# Conveniences ---------------------------------------------------------------------------------------------------------
+
+INT64_SIGN = (1 << 63)
+UINT64_MOD = (1 << 64)
+
+def to_sql_int(val):
+
+    '''
+    SQLite integers are signed 64-bit, wrap upper-half addresses (e.g. x86_64 kernel)
+    '''
+
+    if val == None:
+        return None
+    return (val - UINT64_MOD) if (val >= INT64_SIGN) else val
+
+def from_sql_int(val):
+    if val == None:
+        return None
+    return (val + UINT64_MOD) if (val < 0) else val
+
+# Persistent Store -----------------------------------------------------------------------------------------------------
+
+StoredLift = collections.namedtuple("StoredLift", "ir_dst kind lift_time")
+
+class LiftStore():
+
+    '''
+    On-disk lift result store shared across runs, keyed by (arch, IR, addr, block digest).
+    Holds IR call target, block kind (incl. lift failure), and original lift time.
+    Least-recently-used entries are evicted past max_entries when the store is closed.
+    '''
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS lift_results ("
+        "arch TEXT NOT NULL, "
+        "ir TEXT NOT NULL, "
+        "addr INTEGER NOT NULL, "
+        "digest BLOB NOT NULL, "
+        "ir_dst INTEGER, "
+        "kind TEXT NOT NULL, "
+        "lift_time REAL, "
+        "last_used INTEGER NOT NULL, "
+        "PRIMARY KEY (arch, ir, addr, digest)"
+        ") WITHOUT ROWID"
+    )
+
+    def __init__(self, path, max_entries = 4000000, commit_every = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(LiftStore.SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS lift_results_lru ON lift_results (last_used)")
+
+        # LRU clock continues from the last run
+        last_used = self.conn.execute("SELECT MAX(last_used) FROM lift_results").fetchone()[0]
+        self.clock = (last_used + 1) if last_used != None else 0
+
+        self.pending_puts = []
+        self.pending_touches = []
+        self.entry_cnt = None
+        self.evict_cnt = 0
+
+        # Per-IR stats
+        self.lookup_cnt = collections.Counter()
+        self.hit_cnt = collections.Counter()
+
+    def get(self, arch, ir, addr, bb_bytes):
+        self.lookup_cnt[str(ir)] += 1
+        key = (str(arch), str(ir), to_sql_int(addr), cache.block_digest(bb_bytes))
+        row = self.conn.execute(
+            "SELECT ir_dst, kind, lift_time FROM lift_results "
+            "WHERE arch = ? AND ir = ? AND addr = ? AND digest = ?",
+            key
+        ).fetchone()
+
+        if row == None:
+            return None
+
+        self.hit_cnt[str(ir)] += 1
+        self.pending_touches.append((self.clock,) + key)
+        self.clock += 1
+        self.maybe_commit()
+        return StoredLift(ir_dst = from_sql_int(row[0]), kind = row[1], lift_time = row[2])
+
+    def put(self, arch, ir, addr, bb_bytes, ir_dst, kind, lift_time):
+        self.pending_puts.append((
+            str(arch),
+            str(ir),
+            to_sql_int(addr),
+            cache.block_digest(bb_bytes),
+            to_sql_int(ir_dst),
+            str(kind),
+            lift_time,
+            self.clock,
+        ))
+        self.clock += 1
+        self.maybe_commit()
+
+    def maybe_commit(self):
+        if (len(self.pending_puts) + len(self.pending_touches)) >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO lift_results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self.pending_puts
+            )
+            self.conn.executemany(
+                "UPDATE lift_results SET last_used = ? WHERE arch = ? AND ir = ? AND addr = ? AND digest = ?",
+                self.pending_touches
+            )
+        self.pending_puts.clear()
+        self.pending_touches.clear()
+
+    def evict(self):
+        self.entry_cnt = self.conn.execute("SELECT COUNT(*) FROM lift_results").fetchone()[0]
+        over_cnt = self.entry_cnt - self.max_entries
+        if over_cnt > 0:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM lift_results WHERE last_used IN "
+                    "(SELECT last_used FROM lift_results ORDER BY last_used ASC LIMIT ?)",
+                    (over_cnt,)
+                )
+            self.evict_cnt += over_cnt
+            self.entry_cnt -= over_cnt
+
+    def close(self):
+        if self.conn == None:
+            return
+        self.commit()
+        self.evict()
+        self.conn.close()
+        self.conn = None
+
+    def hit_rate(self, ir = None):
+        if ir == None:
+            lookups = sum(self.lookup_cnt.values())
+            hits = sum(self.hit_cnt.values())
+        else:
+            lookups = self.lookup_cnt[str(ir)]
+            hits = self.hit_cnt[str(ir)]
+        return (hits / lookups) if lookups else 0.0
+
+    def __str__(self):
+        per_ir = ", ".join(
+            f"{ir}: {self.hit_cnt[ir]}/{self.lookup_cnt[ir]} ({self.hit_rate(ir):.6f})"
+            for ir in sorted(self.lookup_cnt)
+        )
+        return (
+            f"[STORE] path: {self.path}, "
+            f"entry_cnt: {self.entry_cnt}, "
+            f"evict_cnt: {self.evict_cnt}, "
+            f"hit_rate: {self.hit_rate():.6f} "
+            f"({per_ir})"
+        )
@@ -3,16 +3,24 @@ import abc
 import collections
 import time
 import os
-import sys
 import json
+import gzip
 import shutil
+import resource
 
+import numpy as np
 import pyvex
 import archinfo as pyvex_archinfo
 import pypcode
 import bap
 
 import cache
+import store
+import lift_pool
+import lift_stats
+import prefilter
+import log_sink
+import sampler
 
 # Conveniences ---------------------------------------------------------------------------------------------------------
 
@@ -55,6 +63,17 @@ class ErrorCategory(PrintableEnum):
     MISS    = "MISS"
     FAIL    = "FAIL"
 
+class DumpFormat(PrintableEnum):
+
+    '''
+    Miss/fail export formats
+    '''
+
+    JSON        = "json"
+    JSONL       = "jsonl"
+    JSONL_GZ    = "jsonl.gz"
+    NPY         = "npy"
+
 class InstrKind(PrintableEnum):
 
     '''
@@ -66,6 +85,18 @@ class InstrKind(PrintableEnum):
     RET     = "RET"
     OTHER   = "OTHER"
 
+class BBKind(PrintableEnum):
+
+    '''
+    Basic block outcome, per IR
+    '''
+
+    CALL_IMM    = "CALL_IMM"
+    CALL_REG    = "CALL_REG"
+    RET         = "RET"
+    NONE        = "NONE"
+    FAIL        = "FAIL"
+
 # IR-based Call Finders ------------------------------------------------------------------------------------------------
 
 class SwitchBoard(abc.ABC):
@@ -74,19 +105,36 @@ class SwitchBoard(abc.ABC):
     Base class for IR call-finders
     '''
 
-    def __init__(self, arch, verbose = False):
+    addr_mask = {
+        Arch.i386   : 0xffffffff,
+        Arch.x86_64 : 0xffffffffffffffff,
+        Arch.arm    : 0xffffffff,
+        Arch.mips   : 0xffffffff,
+    }
+
+    # Position-independent cache entry states
+    PI_UNVERIFIED   = 0
+    PI_VERIFIED     = 1
+    PI_ABSOLUTE     = 2
+
+    def __init__(self, arch, verbose = False, lift_store = None, pool = None):
         self.panda_arch = Arch[arch]
         self.verbose = verbose
-        self.bb_result_cache = cache.BBResultCache()
+        self.lift_store = lift_store
+        self.bb_result_cache = cache.BBResultCache(self.panda_arch)
         self.arch = None
         self.ir = None
         self.first_bb = True
         self.next_bb_addr = None
         self.last_bbr = None
+        self.last_pending = None
+        self.deferred_acc = []
         self.print_sep_cnt = 80
+        self.sink = log_sink.get_sink() if verbose else None
 
-        # Volume
+        # Volume, bb_cnt only counts blocks lifted by this run (stored_cnt were restored from the lift store)
         self.bb_cnt = 0
+        self.stored_cnt = 0
         self.avg_bb_byte_cnt = None
 
         # Work
@@ -96,36 +144,273 @@ class SwitchBoard(abc.ABC):
 
         # Speed
         self.avg_bb_lift_time_sec = None
+        self.last_lift_time = None
+        self.profile = lift_stats.LiftProfile()
+
+        # Optional worker pool, blocks are lifted in batches and results resolved as they arrive
+        self.pool = pool
+        self.pending_blocks = []
+        self.in_flight = collections.deque()
+        self.in_flight_keys = set()
+        self.drop_cnt = 0
+
+        # Optional pre-filter, non-candidate blocks skip lifting, every Nth skip is audited with a full lift
+        self.prefilter = None
+        self.prefilter_audit_every = 0
+        self.prefilter_skip_cnt = 0
+        self.prefilter_audit_cnt = 0
+        self.prefilter_fn_cnt = 0
+
+        # Optional position-independent tier, results reused for the same bytes at another address
+        self.pi_cache = None
+        self.pi_lookup_cnt = 0
+        self.pi_hit_cnt = 0
+        self.pi_verify_cnt = 0
+        self.pi_absolute_cnt = 0
 
     @abc.abstractmethod
-    def lift_block(self, start_addr, data):
+    def lift_new_block(self, start_addr, data):
         raise NotImplementedError
 
-    def log_block(self, start_addr, data):
+    def lift_new_blocks(self, blocks):
+
+        '''
+        Lift blocks known to be uncached. Subclasses override to amortize per-block setup.
+        '''
+
+        for start_addr, data in blocks:
+            self.lift_new_block(start_addr, data)
+
+    def is_known(self, start_addr, data):
+        if self.bb_result_cache.get_result(start_addr, data, count = False):
+            return True
+        return self.load_stored(start_addr, data) or self.load_relocated(start_addr, data)
+
+    def lift_block(self, start_addr, data):
+        # Translate-time lookup, not counted: cache_lookup_cnt and hit_rate are per executed block
+        if self.bb_result_cache.get_result(start_addr, data, count = False):
+            return
+        self.lift_uncached_block(start_addr, data)
+
+    def enable_pi_cache(self):
+        self.pi_cache = {}
+
+    def record_relocatable(self, start_addr, data, call_trgt, kind):
+
+        '''
+        Summarize a result position-independently: kind plus call target relative to the block start.
+        Only a call imm target can depend on position (PC-relative vs. absolute encoding), so the first
+        time the same bytes are seen elsewhere they're lifted again and the two summaries compared.
+        '''
+
+        key = cache.block_digest(data)
+        rel = None
+        if call_trgt != None:
+            rel = (call_trgt - start_addr) & SwitchBoard.addr_mask[self.panda_arch]
+
+        entry = self.pi_cache.get(key, None)
+        if entry == None:
+            state = SwitchBoard.PI_VERIFIED if (kind != BBKind.CALL_IMM) else SwitchBoard.PI_UNVERIFIED
+            self.pi_cache[key] = (start_addr, kind, rel, state)
+        elif (entry[3] == SwitchBoard.PI_UNVERIFIED) and (entry[0] != start_addr):
+            self.pi_verify_cnt += 1
+            if (entry[1], entry[2]) == (kind, rel):
+                self.pi_cache[key] = entry[:3] + (SwitchBoard.PI_VERIFIED,)
+            else:
+                self.pi_absolute_cnt += 1
+                self.pi_cache[key] = entry[:3] + (SwitchBoard.PI_ABSOLUTE,)
+
+    def load_relocated(self, start_addr, data):
+
+        '''
+        Rebase a verified position-independent result for these bytes to start_addr. Returns True on success.
+        '''
+
+        if self.pi_cache == None:
+            return False
+
+        self.pi_lookup_cnt += 1
+        entry = self.pi_cache.get(cache.block_digest(data), None)
+        if (entry == None) or (entry[3] != SwitchBoard.PI_VERIFIED):
+            return False
+
+        (_, kind, rel, _) = entry
+        call_trgt = None
+        if rel != None:
+            call_trgt = (start_addr + rel) & SwitchBoard.addr_mask[self.panda_arch]
+
+        self.pi_hit_cnt += 1
+        self.restore_result(start_addr, data, call_trgt, kind, None)
+        return True
+
+    def use_block_table(self, block_table):
+
+        '''
+        Store results against a BlockTable shared with other IRs, call before lifting anything
+        '''
+
+        assert(self.bb_result_cache.result_cnt == 0)
+        self.bb_result_cache = cache.BBResultCache(self.panda_arch, block_table = block_table)
+
+    def enable_prefilter(self, audit_every = 100):
+        self.prefilter = prefilter.get_filter(self.panda_arch)
+        self.prefilter_audit_every = audit_every
+
+    def skip_block(self, start_addr, data):
+
+        '''
+        Pre-filter an uncached block. Returns True if handled without queueing a full lift.
+        '''
+
+        if (not self.prefilter) or self.prefilter(data):
+            return False
+
+        self.prefilter_skip_cnt += 1
+        if self.prefilter_audit_every and ((self.prefilter_skip_cnt % self.prefilter_audit_every) == 0):
+            # Lift anyway, finding a call/ret means the filter missed one
+            self.prefilter_audit_cnt += 1
+            found_cnt = self.call_imm_cnt + self.call_reg_cnt + self.ret_cnt
+            self.lift_new_block(start_addr, data)
+            if (self.call_imm_cnt + self.call_reg_cnt + self.ret_cnt) > found_cnt:
+                self.prefilter_fn_cnt += 1
+            return True
+
+        # Placeholder without an IR target, not persisted so full-lift runs never load it
+        self.bb_result_cache.put(start_addr, data, None)
+        return True
+
+    def lift_uncached_block(self, start_addr, data):
+        # Known results first, like lift_blocks(), a pre-filter placeholder would hide a stored IR target
+        if self.load_stored(start_addr, data) or self.load_relocated(start_addr, data):
+            return
+
+        if self.skip_block(start_addr, data):
+            return
+
+        if self.pool:
+            self.queue_block(start_addr, data)
+        else:
+            self.lift_new_block(start_addr, data)
+
+    def lift_blocks(self, blocks):
+
+        '''
+        Lift an iterable of (addr, bytes) blocks, returns a BBResult per block
+        '''
+
+        blocks = list(blocks)
+        new_blocks = []
+        new_keys = set()
+        for start_addr, data in blocks:
+            key = (start_addr, cache.block_digest(data))
+            if (key in new_keys) or self.is_known(start_addr, data) or self.skip_block(start_addr, data):
+                continue
+
+            new_keys.add(key)
+            if self.pool:
+                self.queue_block(start_addr, data)
+            else:
+                new_blocks.append((start_addr, data))
+
+        if self.pool:
+            self.flush()
+        else:
+            self.lift_new_blocks(new_blocks)
+
+        return [self.bb_result_cache.get_result(start_addr, data, count = False) for start_addr, data in blocks]
+
+    @staticmethod
+    def contiguous_runs(blocks):
+
+        '''
+        Group blocks into runs of back-to-back addresses
+        '''
+
+        runs = []
+        run_end = None
+        for start_addr, data in sorted(blocks, key = lambda b: b[0]):
+            if runs and (start_addr == run_end):
+                runs[-1].append((start_addr, data))
+            else:
+                runs.append([(start_addr, data)])
+            run_end = start_addr + len(data)
+        return runs
+
+    def update_prev(self, true_dst):
         if self.first_bb:
             self.first_bb = False
-        else:
-            self.update_acc_stats(start_addr)
+        elif self.last_bbr or self.last_pending:
+            self.update_acc_stats(true_dst)
+
+    def log_skipped(self, start_addr):
 
-        self.last_bbr = self.bb_result_cache.get_result(start_addr, bytearray(data))
+        '''
+        Execution of a block that isn't evaluated (sampling), it only completes the previous block's result
+        '''
+
+        self.update_prev(start_addr)
+        self.last_bbr = None
+        self.last_pending = None
+
+    def log_block(self, start_addr, data):
+        self.update_prev(start_addr)
+
+        self.last_bbr = self.bb_result_cache.get_result(start_addr, data)
+        self.last_pending = None
         if not self.last_bbr:
-            self.lift_block(start_addr, data)
-            self.last_bbr = self.bb_result_cache.get_result(start_addr, bytearray(data))
-            assert(self.last_bbr)
+            self.lift_uncached_block(start_addr, data)
+            self.last_bbr = self.bb_result_cache.get_result(start_addr, data, count = False)
+            if not self.last_bbr:
+                # Lift in flight, resolve accuracy once its result arrives
+                self.last_pending = (start_addr, data)
 
     def update_acc_stats(self, true_dst):
-        self.last_bbr.true_dst = true_dst
-        if (self.last_bbr.ir_dst != None) and (self.last_bbr.ir_dst != true_dst):
-            self.last_bbr.is_miss = True
-        elif (self.last_bbr.ir_dst != None) and (self.last_bbr.ir_dst == true_dst):
-            self.last_bbr.is_miss = False
+        if not self.last_bbr:
+            assert(self.last_pending)
+            self.deferred_acc.append((self.last_pending, true_dst))
+            return
+
+        self.bb_result_cache.set_true_dst(self.last_bbr, true_dst)
 
         # TODO: add true neg and false neg? Need to feed ground truth func addrs via symbolized binary
 
+    def resolve_deferred(self):
+
+        '''
+        Apply accuracy updates for blocks whose lift results arrived, in execution order
+        '''
+
+        unresolved = []
+        for ((start_addr, data), true_dst) in self.deferred_acc:
+            bbr = self.bb_result_cache.get_result(start_addr, data, count = False)
+            if bbr:
+                self.bb_result_cache.set_true_dst(bbr, true_dst)
+            else:
+                unresolved.append(((start_addr, data), true_dst))
+        self.deferred_acc = unresolved
+
+        if self.last_pending:
+            self.last_bbr = self.bb_result_cache.get_result(*self.last_pending, count = False)
+            if self.last_bbr:
+                self.last_pending = None
+
+    def flush(self):
+
+        '''
+        Wait for in-flight lifts, if any
+        '''
+
+        if self.pool:
+            self.submit_pending()
+            while self.in_flight:
+                self.collect_batch()
+        self.resolve_deferred()
+
     def update_run_stats(self, block_start_addr, block_bytes, lift_start_time, lift_end_time):
         lift_time = (lift_end_time - lift_start_time)
         block_byte_cnt = len(block_bytes)
         self.bb_cnt += 1
+        self.last_lift_time = lift_time
 
         if self.avg_bb_lift_time_sec:
             self.avg_bb_lift_time_sec += ((lift_time - self.avg_bb_lift_time_sec) / self.bb_cnt)
@@ -139,30 +424,147 @@ class SwitchBoard(abc.ABC):
             self.avg_bb_byte_cnt = block_byte_cnt
             assert(self.bb_cnt == 1)
 
+    def update_kind_cnt(self, kind):
+        if kind == BBKind.CALL_IMM:
+            self.call_imm_cnt += 1
+        elif kind == BBKind.CALL_REG:
+            self.call_reg_cnt += 1
+        elif kind == BBKind.RET:
+            self.ret_cnt += 1
+
+    def add_result(self, start_addr, data, call_trgt, kind, persist = True):
+        if self.last_lift_time != None:
+            self.profile.record(self.last_lift_time, start_addr, data, kind)
+
+        if self.pi_cache != None:
+            self.record_relocatable(start_addr, data, call_trgt, kind)
+
+        self.bb_result_cache.put(start_addr, data, call_trgt, None, (kind == BBKind.FAIL))
+
+        if self.lift_store and persist:
+            self.lift_store.put(self.panda_arch, self.ir, start_addr, data, call_trgt, kind, self.last_lift_time)
+        self.last_lift_time = None
+
+    def load_stored(self, start_addr, data):
+
+        '''
+        Restore a lift result persisted by a previous run, if any. Returns True on success.
+        '''
+
+        if not self.lift_store:
+            return False
+
+        stored = self.lift_store.get(self.panda_arch, self.ir, start_addr, data)
+        if not stored:
+            return False
+
+        # No lift time: a previous run's timing would skew this run's averages and profile
+        self.stored_cnt += 1
+        self.restore_result(start_addr, data, stored.ir_dst, BBKind(stored.kind), None, persist = False)
+        return True
+
+    def restore_result(self, start_addr, data, call_trgt, kind, lift_time, persist = True):
+
+        '''
+        Record a result lifted elsewhere (lift store or worker pool), counters updated as if lifted here
+        '''
+
+        self.update_kind_cnt(kind)
+        if lift_time != None:
+            self.update_run_stats(start_addr, data, 0, lift_time)
+
+        self.add_result(start_addr, data, call_trgt, kind, persist)
+
+    def queue_block(self, start_addr, data):
+        key = (start_addr, cache.block_digest(data))
+        if key in self.in_flight_keys:
+            return
+
+        self.in_flight_keys.add(key)
+        self.pending_blocks.append((start_addr, bytes(data)))
+        if len(self.pending_blocks) >= self.pool.batch_size:
+            self.submit_pending()
+
+    def is_pool_full(self):
+        return (len(self.in_flight) >= self.pool.max_in_flight) and (not self.in_flight[0][1].ready())
+
+    def prefetch_block(self, start_addr, data):
+
+        '''
+        Lift ahead of execution. With a pool, dropped when at capacity: execution re-queues it without dropping.
+        '''
+
+        if self.pool and self.is_pool_full():
+            self.drop_cnt += 1
+            return
+        self.lift_block(start_addr, data)
+
+    def submit_pending(self):
+        if self.pending_blocks:
+            self.in_flight.append((self.pending_blocks, self.pool.submit(str(self.panda_arch), self.pending_blocks)))
+            self.pending_blocks = []
+
+        # Backpressure: block on the oldest batch when too many are outstanding
+        while self.in_flight and (self.in_flight[0][1].ready() or (len(self.in_flight) > self.pool.max_in_flight)):
+            self.collect_batch()
+        self.resolve_deferred()
+
+    def collect_batch(self):
+        blocks, async_res = self.in_flight.popleft()
+        for ((start_addr, data), (call_trgt, kind, lift_time)) in zip(blocks, async_res.get()):
+            self.in_flight_keys.discard((start_addr, cache.block_digest(data)))
+            self.restore_result(start_addr, data, call_trgt, BBKind(kind), lift_time)
+
+    def emit_header(self, data):
+        self.sink.emit("\n{0}\n\n[{1}] Got bytes:", self.print_sep_cnt*"-", self.ir)
+        self.sink.emit(cache.byte_str, data)
+        self.sink.emit("\n[{0}] IR for BB:", self.ir)
+
     def log_fail(self, start_addr, data):
-        self.bb_result_cache.add(
-            cache.BBResult(
-                self.panda_arch,
-                start_addr,
-                bytearray(data),
-                None,
-                None,
-                True
-            )
-        )
+        self.add_result(start_addr, data, None, BBKind.FAIL)
 
     def __str__(self):
+        lookup_stats = self.bb_result_cache.get_lookup_stats()
+        pool_str = f", pool_drop_cnt: {self.drop_cnt}" if self.pool else ""
+        stored_str = f"stored_cnt: {self.stored_cnt}, " if self.lift_store else ""
+        pi_str = ""
+        if self.pi_cache != None:
+            pi_rate = (self.pi_hit_cnt / self.pi_lookup_cnt) if self.pi_lookup_cnt else 0.0
+            pi_str = (
+                f", pi_hit_cnt: {self.pi_hit_cnt} "
+                f"(lookup_cnt: {self.pi_lookup_cnt}, "
+                f"hit_rate: {pi_rate:.6f}, "
+                f"verify_cnt: {self.pi_verify_cnt}, "
+                f"absolute_cnt: {self.pi_absolute_cnt})"
+            )
+        filter_str = ""
+        if self.prefilter:
+            fn_rate = (self.prefilter_fn_cnt / self.prefilter_audit_cnt) if self.prefilter_audit_cnt else 0.0
+            filter_str = (
+                f", prefilter_skip_cnt: {self.prefilter_skip_cnt} "
+                f"(audit_cnt: {self.prefilter_audit_cnt}, "
+                f"false_neg_cnt: {self.prefilter_fn_cnt}, "
+                f"false_neg_rate: {fn_rate:.6f})"
+            )
         return (
             f"[{self.ir}] "
             f"call_imm_cnt: {self.call_imm_cnt} "
-            f"(unique_true_pos: {len(self.bb_result_cache.get_hit_list())}, "
-            f"unique_false_pos: {len(self.bb_result_cache.get_miss_list())}), "
+            f"(unique_true_pos: {self.bb_result_cache.get_hit_cnt()}, "
+            f"unique_false_pos: {self.bb_result_cache.get_miss_cnt()}), "
             f"call_reg_cnt: {self.call_reg_cnt}, "
             f"ret_cnt: {self.ret_cnt}, "
             f"bb_cnt: {self.bb_cnt}, "
-            f"avg_bb_byte_cnt: {self.avg_bb_byte_cnt:.6f}, "
-            f"avg_bb_lift_time: {self.avg_bb_lift_time_sec:.6f} sec, "
-            f"lift_fail_cnt: {len(self.bb_result_cache.get_fail_list())}"
+            f"{stored_str}"
+            f"avg_bb_byte_cnt: {(self.avg_bb_byte_cnt or 0.0):.6f}, "
+            f"avg_bb_lift_time: {(self.avg_bb_lift_time_sec or 0.0):.6f} sec, "
+            f"lift_fail_cnt: {self.bb_result_cache.get_fail_cnt()}, "
+            f"cache_lookup_cnt: {lookup_stats['lookup_cnt']} "
+            f"(hit_cnt: {lookup_stats['hit_cnt']}, "
+            f"miss_cnt: {lookup_stats['miss_cnt']}, "
+            f"hit_rate: {lookup_stats['hit_rate']:.6f})"
+            f"{pool_str}"
+            f"{pi_str}"
+            f"{filter_str}"
         )
 
 class SBVex(SwitchBoard):
@@ -178,63 +580,53 @@ class SBVex(SwitchBoard):
         Arch.mips   : pyvex_archinfo.ArchMIPS32(),
     }
 
-    def __init__(self, arch, verbose = False):
-        super().__init__(arch, verbose)
+    def __init__(self, arch, verbose = False, lift_store = None, pool = None):
+        super().__init__(arch, verbose, lift_store, pool)
         self.arch = SBVex.arch_map[self.panda_arch]
         self.ir = IR.VEX
 
-    def lift_block(self, start_addr, data):
-        if self.bb_result_cache.get_result(start_addr, bytearray(data)):
-            return
-
-        start_time = time.process_time()
+    def lift_new_block(self, start_addr, data):
+        start_time = time.perf_counter()
         irsb = pyvex.lift(data, start_addr, self.arch)
-        end_time = time.process_time()
+        end_time = time.perf_counter()
         self.update_run_stats(start_addr, data, start_time, end_time)
 
         if len(irsb.statements) == 0:
             self.log_fail(start_addr, data)
             if self.verbose:
-                print("[VEX] Lift fail logged!")
+                self.sink.emit("[VEX] Lift fail logged!")
             return
 
         if self.verbose:
-            print("\n" + self.print_sep_cnt*"-")
-            print(f"\n[{self.ir}] Got bytes:")
-            print(cache.byte_str(data))
-            print(f"\n[{self.ir}] IR for BB:")
-            irsb.pp()
+            self.emit_header(data)
+            self.sink.emit("{0}", irsb)
 
         call_trgt = None
+        kind = BBKind.NONE
         if irsb.jumpkind == "Ijk_Call":
             if isinstance(irsb.next, pyvex.expr.Const):
                 call_trgt = int(str(irsb.next), 16) # Eww...gross!
+                kind = BBKind.CALL_IMM
                 self.call_imm_cnt += 1
                 if self.verbose:
-                    print(f"\n[{self.ir}] Call dest: {call_trgt:08x}")
+                    self.sink.emit("\n[{0}] Call dest: {1:08x}", self.ir, call_trgt)
             elif isinstance(irsb.next, pyvex.expr.RdTmp):
+                kind = BBKind.CALL_REG
                 self.call_reg_cnt += 1
                 if self.verbose:
-                    print(f"\n[{self.ir}] Call dest is register based!")
+                    self.sink.emit("\n[{0}] Call dest is register based!", self.ir)
             else:
                 raise RuntimeError
         elif irsb.jumpkind == "Ijk_Ret":
+            kind = BBKind.RET
             self.ret_cnt += 1
             if self.verbose:
-                print(f"\n[{self.ir}] Ret found in BB.")
+                self.sink.emit("\n[{0}] Ret found in BB.", self.ir)
         else:
             if self.verbose:
-                print(f"\n[{self.ir}] No calls or returns in BB.")
-
-        self.bb_result_cache.add(
-            cache.BBResult(
-                self.panda_arch,
-                start_addr,
-                bytearray(data),
-                call_trgt,
-                None
-            )
-        )
+                self.sink.emit("\n[{0}] No calls or returns in BB.", self.ir)
+
+        self.add_result(start_addr, data, call_trgt, kind)
 
 class SBBap(SwitchBoard):
 
@@ -252,17 +644,30 @@ class SBBap(SwitchBoard):
         Arch.mips   : "mips",
     }
 
-    def __init__(self, arch, verbose = False):
-        super().__init__(arch, verbose)
+    # Call immediates are PC-relative and can be rebased after a batch lift, except MIPS jal (absolute in its region)
+    pc_rel_calls = {
+        Arch.i386   : True,
+        Arch.x86_64 : True,
+        Arch.arm    : True,
+        Arch.mips   : False,
+    }
+
+    def __init__(self, arch, verbose = False, lift_store = None, pool = None):
+        super().__init__(arch, verbose, lift_store, pool)
         self.arch = SBBap.arch_map[self.panda_arch]
         self.ir = IR.BAP
+        self.mc_cnt = 0
 
-    def parse_bil_and_kinds(self, out):
+    def parse_bil_and_kinds(self, out, sizes = None):
         bil_tups = list()
         for s in out.split(b'\n'):
             if s:
                 if s.startswith(b'('):
                     bil_tups.append(self.BilTup(bil = bap.bil.loads(s), kind = InstrKind.OTHER))
+                elif s.isdigit():
+                    # Only with --show-size, batch lifts
+                    if sizes != None:
+                        sizes.append(int(s))
                 else:
                     assert(len(bil_tups) > 0)
                     if s == b"Call":
@@ -272,46 +677,126 @@ class SBBap(SwitchBoard):
         return bil_tups
 
     def lift_helper(self, addr, data):
+        self.mc_cnt += 1
         code = cache.byte_str(data, sep=" ")
         args = ['--show-bil=adt', '--show-kinds', '--addr=' + str(addr), '--arch=' + self.arch,'--', code]
         load_bil = {'load' : self.parse_bil_and_kinds}
         return bap.run('mc', args, parser=load_bil)
 
+    def lift_run_helper(self, addr, data):
+
+        '''
+        Lift blocks laid out back to back in one `mc` call, instruction sizes are used to split the result
+        '''
+
+        self.mc_cnt += 1
+        sizes = []
+        code = cache.byte_str(data, sep=" ")
+        args = ['--show-bil=adt', '--show-kinds', '--show-size', '--addr=' + str(addr), '--arch=' + self.arch,'--', code]
+        load_bil = {'load' : lambda out: self.parse_bil_and_kinds(out, sizes)}
+        return bap.run('mc', args, parser=load_bil), sizes
+
     def analyze_helper(self, bil_tup):
         analyzer = self.BilAnalyzer(bil_tup.kind)
         analyzer.run(bil_tup.bil)
         return analyzer
 
-    def lift_block(self, start_addr, data):
-        if self.bb_result_cache.get_result(start_addr, bytearray(data)):
-            return
-
+    def lift_new_block(self, start_addr, data):
         try:
-            start_time = time.process_time()
+            start_time = time.perf_counter()
             ir = self.lift_helper(start_addr, data)
-            end_time = time.process_time()
+            end_time = time.perf_counter()
             self.update_run_stats(start_addr, data, start_time, end_time)
         except:
             self.log_fail(start_addr, data)
             if self.verbose:
-                print("[BAP] Lift fail logged!")
+                self.sink.emit("[BAP] Lift fail logged!")
             return
 
+        self.analyze_block(start_addr, data, ir)
+
+    def lift_new_blocks(self, blocks):
+
+        '''
+        Lift all blocks with one `mc` call, rather than one per block. Blocks are laid out back to back from the
+        lowest address and call targets rebased from where a block was lifted to where it is, so contiguous blocks
+        are lifted in place. Blocks that can't be attributed are lifted alone, the rest of the batch is retried.
+        '''
+
+        batches = [sorted(blocks, key = lambda b: b[0])]
+        while batches:
+            batch = batches.pop()
+            if len(batch) <= 1:
+                for start_addr, data in batch:
+                    self.lift_new_block(start_addr, data)
+                continue
+
+            lifted_cnt = self.lift_batch(batch)
+            if lifted_cnt == None:
+                # `mc` rejected the whole batch, halve it to isolate the block(s) it can't lift
+                mid = len(batch) // 2
+                batches += [batch[mid:], batch[:mid]]
+            elif lifted_cnt < len(batch):
+                self.lift_new_block(*batch[lifted_cnt])
+                batches.append(batch[(lifted_cnt + 1):])
+
+    def lift_batch(self, batch):
+
+        '''
+        One `mc` call for a sorted batch. Returns how many leading blocks got a result, None if `mc` failed.
+        '''
+
+        lift_addr = batch[0][0]
+        batch_data = b"".join(data for (_, data) in batch)
+        try:
+            start_time = time.perf_counter()
+            ir, sizes = self.lift_run_helper(lift_addr, batch_data)
+            end_time = time.perf_counter()
+        except:
+            return None
+
+        if len(sizes) != len(ir):
+            return None
+
+        lift_time = (end_time - start_time) / len(batch)
+        insn_idx = 0
+        for (batch_idx, (start_addr, data)) in enumerate(batch):
+            block_ir = []
+            byte_cnt = 0
+            while (byte_cnt < len(data)) and (insn_idx < len(ir)):
+                block_ir.append(ir[insn_idx])
+                byte_cnt += sizes[insn_idx]
+                insn_idx += 1
+
+            # Decoding stopped early or the last instruction took the next block's bytes, nothing after lines up
+            if byte_cnt != len(data):
+                return batch_idx
+
+            # An absolute call target can't be rebased, lift the block again where it is
+            moved_call = (lift_addr != start_addr) and any(bil_tup.kind == InstrKind.CALL for bil_tup in block_ir)
+            if moved_call and (not SBBap.pc_rel_calls[self.panda_arch]):
+                self.lift_new_block(start_addr, data)
+            else:
+                self.update_run_stats(start_addr, data, 0, lift_time)
+                self.analyze_block(start_addr, data, block_ir, lift_addr)
+            lift_addr += len(data)
+
+        return len(batch)
+
+    def analyze_block(self, start_addr, data, ir, lift_addr = None):
         if (len(ir) == 0):
             self.log_fail(start_addr, data)
             if self.verbose:
-                print("[BAP] Lift fail logged!")
+                self.sink.emit("[BAP] Lift fail logged!")
             return
 
         if self.verbose:
-            print("\n" + self.print_sep_cnt*"-")
-            print(f"\n[{self.ir}] Got bytes:")
-            print(cache.byte_str(data))
-            print(f"\n[{self.ir}] IR for BB:")
+            self.emit_header(data)
             for bil_tup in ir:
-                print(f"\n{bil_tup.bil}")
+                self.sink.emit("\n{0}", bil_tup.bil)
 
         call_trgt = None
+        kind = BBKind.NONE
         done = False
 
         for bil_tup in ir:
@@ -324,36 +809,33 @@ class SBBap(SwitchBoard):
             if len(result.call_imm_trgts) != 0:
                 assert(len(result.call_imm_trgts) == 1)
                 call_trgt = result.call_imm_trgts[0]
+                if (lift_addr != None) and (lift_addr != start_addr):
+                    call_trgt = (call_trgt - lift_addr + start_addr) & SwitchBoard.addr_mask[self.panda_arch]
+                kind = BBKind.CALL_IMM
                 if self.verbose:
-                    print(f"\n[{self.ir}] Call dest: {call_trgt:08x}")
+                    self.sink.emit("\n[{0}] Call dest: {1:08x}", self.ir, call_trgt)
                 break
 
             assert(result.call_reg_cnt <= 1)
             if result.call_reg_cnt == 1:
                 self.call_reg_cnt += result.call_reg_cnt
+                kind = BBKind.CALL_REG
                 if self.verbose:
-                    print(f"\n[{self.ir}] Call dest is register based!")
+                    self.sink.emit("\n[{0}] Call dest is register based!", self.ir)
                 break
 
             if result.ret_cnt >= 1:
                 self.ret_cnt += result.ret_cnt
+                kind = BBKind.RET
                 if self.verbose:
-                    print(f"\n[{self.ir}] Ret found in BB.")
+                    self.sink.emit("\n[{0}] Ret found in BB.", self.ir)
                 break
 
-        self.bb_result_cache.add(
-            cache.BBResult(
-                self.panda_arch,
-                start_addr,
-                bytearray(data),
-                call_trgt,
-                None
-            )
-        )
+        self.add_result(start_addr, data, call_trgt, kind)
 
         if (result.call_imm_cnt + result.call_reg_cnt + result.ret_cnt) == 0:
             if self.verbose:
-                    print(f"\n[{self.ir}] No calls or returns in BB.")
+                    self.sink.emit("\n[{0}] No calls or returns in BB.", self.ir)
 
     class BilAnalyzer(bap.adt.Visitor):
 
@@ -408,7 +890,7 @@ class SBPCode(SwitchBoard):
     '''
     PCODE IR call/ret finder
     Code adapted from example: https://github.com/angr/pypcode/blob/master/pypcode/__main__.py
-    Note: printing verbose print affects lift time as written, so always compare to other IRs with verbose == False
+    Note: verbose printing re-decodes the block after timing, so lift times are comparable in either mode
     '''
 
     arch_map = {
@@ -420,8 +902,14 @@ class SBPCode(SwitchBoard):
 
     SLA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "ghidra_v9.2_sla")
 
-    def __init__(self, arch, verbose = False):
-        super().__init__(arch, verbose)
+    # Control-flow opcodes, resolved by name once (all low-numbered in Ghidra's OpCode enum)
+    OPCODES = {pypcode.get_opname(opcode) : opcode for opcode in range(1, 16)}
+    OPC_CALL = OPCODES["CALL"]
+    OPC_CALLIND = OPCODES["CALLIND"]
+    OPC_RETURN = OPCODES["RETURN"]
+
+    def __init__(self, arch, verbose = False, lift_store = None, pool = None):
+        super().__init__(arch, verbose, lift_store, pool)
         self.arch = SBPCode.arch_map[self.panda_arch]
         self.ir = IR.PCODE
         if Arch[arch] == Arch.x86_64:
@@ -444,110 +932,130 @@ class SBPCode(SwitchBoard):
         self.def_space = self.trans.getDefaultSpace()
 
     @staticmethod
-    def print_vardata(data, trans):
-        sys.stdout.write('(%s, 0x%x, %d) ' % (data.space.getName(), data.offset, data.size))
+    def vardata_str(data, trans):
+        out = '(%s, 0x%x, %d) ' % (data.space.getName(), data.offset, data.size)
         if data.space.getName() == 'register':
             regname = trans.getRegisterName(data.space, data.offset, data.size)
-            sys.stdout.write('{%s} ' % regname)
+            out += '{%s} ' % regname
+        return out
 
-    def lift_block(self, start_addr, data):
+    def lift_new_block(self, start_addr, data):
+        start_time = time.perf_counter()
         ba_data = bytearray(data)
-        bbr = self.bb_result_cache.get_result(start_addr, ba_data)
-        if bbr:
-            self.call_trgt = bbr.ir_dst
-            return
+        self.loader.setData(start_addr, ba_data, len(ba_data))
+        self.lift_loaded_block(start_addr, data, start_time)
 
-        if self.verbose:
-            print("\n" + self.print_sep_cnt*"-")
-            print(f"\n[{self.ir}] Got bytes:")
-            print(cache.byte_str(data))
-            print(f"\n[{self.ir}] IR for BB:")
+    def lift_new_blocks(self, blocks):
 
-        start_time = time.process_time()
+        '''
+        Load each run of back-to-back blocks into the image once, then lift blocks from it.
+        A block whose decoding runs into the next block's bytes is lifted alone, so results match lift_new_block().
+        '''
+
+        for run in SwitchBoard.contiguous_runs(blocks):
+            if len(run) == 1:
+                self.lift_new_block(*run[0])
+                continue
+
+            # Image load cost is shared by the run's blocks
+            load_start_time = time.perf_counter()
+            run_data = bytearray(b"".join(data for (_, data) in run))
+            self.loader.setData(run[0][0], run_data, len(run_data))
+            load_time = (time.perf_counter() - load_start_time) / len(run)
+
+            unbounded = []
+            for start_addr, data in run:
+                if not self.lift_loaded_block(start_addr, data, time.perf_counter() - load_time, in_run = True):
+                    unbounded.append((start_addr, data))
+
+            for start_addr, data in unbounded:
+                self.lift_new_block(start_addr, data)
+
+    def lift_loaded_block(self, start_addr, data, start_time, in_run = False):
+
+        '''
+        Lift a block already in the image. In a run, returns False without a result if decoding left the block.
+        '''
 
-        self.loader.setData(start_addr, ba_data, len(ba_data))
         addr = pypcode.Address(self.def_space, start_addr)
-        lastaddr = pypcode.Address(self.def_space, start_addr + len(ba_data))
+        lastaddr = pypcode.Address(self.def_space, start_addr + len(data))
 
+        # Fast path: integer opcode compares, stop at the first control-flow op
         call_trgt = None
-        done = False
-        while addr < lastaddr:
+        kind = BBKind.NONE
+        while (addr < lastaddr) and (kind == BBKind.NONE):
             self.emit.clearCache()
 
             try:
                 length = self.trans.oneInstruction(self.emit, addr)
             except:
+                if in_run:
+                    return False
                 self.log_fail(start_addr, data)
                 if self.verbose:
-                    print("[PCODE] Lift fail logged!")
-                return
+                    self.sink.emit("[PCODE] Lift fail logged!")
+                return True
+
+            # Instruction was decoded from the next block's bytes
+            if in_run and (lastaddr < (addr + length)):
+                return False
 
             for op in self.emit.opcache:
+                opcode = op.getOpcode()
+                if opcode == SBPCode.OPC_CALL:
+                    kind = BBKind.CALL_IMM
+                    call_trgt = op.getInput(0).offset
+                    break
+                elif opcode == SBPCode.OPC_CALLIND:
+                    kind = BBKind.CALL_REG
+                    break
+                elif opcode == SBPCode.OPC_RETURN:
+                    kind = BBKind.RET
+                    break
+
+            addr = addr + length
+
+        end_time = time.perf_counter()
+        self.update_kind_cnt(kind)
+        self.update_run_stats(start_addr, data, start_time, end_time)
 
-                op_name = pypcode.get_opname(op.getOpcode())
-                out = op.getOutput()
-                if out and self.verbose:
-                    SBPCode.print_vardata(out, self.trans)
-                    sys.stdout.write('= ')
+        # Slow path: pretty-print is a second pass, outside the timed region
+        if self.verbose:
+            self.print_block(start_addr, data, addr, kind, call_trgt)
 
-                if self.verbose:
-                    sys.stdout.write('%s ' % op_name)
-                    for i in range(op.numInput()):
-                        SBPCode.print_vardata(op.getInput(i), self.trans)
-                    sys.stdout.write('\n')
-
-                if op_name == "CALL":
-                    done = True
-                    end_time = time.process_time()
-                    self.call_imm_cnt += 1
-                    call_trgt = op.getInput(0).offset
-                    if self.verbose:
-                        print(f"\n[{self.ir}] Call dest: {call_trgt:08x}")
-                elif op_name == "CALLIND":
-                    done = True
-                    end_time = time.process_time()
-                    self.call_reg_cnt += 1
-                    if self.verbose:
-                        print(f"\n[{self.ir}] Call dest is register based!")
-                elif op_name == "RETURN":
-                    done = True
-                    end_time = time.process_time()
-                    self.ret_cnt += 1
-                    if self.verbose:
-                        print(f"\n[{self.ir}] Ret found in BB.")
+        self.add_result(start_addr, data, call_trgt, kind)
+        return True
 
-            if self.verbose:
-                sys.stdout.write('\n')
-
-            if done:
-                self.update_run_stats(start_addr, data, start_time, end_time)
-                self.bb_result_cache.add(
-                    cache.BBResult(
-                        self.panda_arch,
-                        start_addr,
-                        bytearray(data),
-                        call_trgt,
-                        None
-                    )
-                )
-                return
-            else:
-                addr = addr + length
+    def print_block(self, start_addr, data, end_addr, kind, call_trgt):
+        self.emit_header(data)
 
-        end_time = time.process_time()
-        self.update_run_stats(start_addr, data, start_time, end_time)
-        if self.verbose:
-            print(f"\n[{self.ir}] No calls or returns in BB.")
-
-        self.bb_result_cache.add(
-            cache.BBResult(
-                self.panda_arch,
-                start_addr,
-                bytearray(data),
-                call_trgt,
-                None
-            )
-        )
+        # Ops only live until the next oneInstruction(), so text is built here and written by the sink
+        lines = []
+        addr = pypcode.Address(self.def_space, start_addr)
+        while addr < end_addr:
+            self.emit.clearCache()
+            length = self.trans.oneInstruction(self.emit, addr)
+            for op in self.emit.opcache:
+                line = ''
+                out = op.getOutput()
+                if out:
+                    line += SBPCode.vardata_str(out, self.trans) + '= '
+                line += '%s ' % pypcode.get_opname(op.getOpcode())
+                for i in range(op.numInput()):
+                    line += SBPCode.vardata_str(op.getInput(i), self.trans)
+                lines.append(line)
+            lines.append('')
+            addr = addr + length
+        self.sink.emit("{0}", "\n".join(lines))
+
+        if kind == BBKind.CALL_IMM:
+            self.sink.emit("\n[{0}] Call dest: {1:08x}", self.ir, call_trgt)
+        elif kind == BBKind.CALL_REG:
+            self.sink.emit("\n[{0}] Call dest is register based!", self.ir)
+        elif kind == BBKind.RET:
+            self.sink.emit("\n[{0}] Ret found in BB.", self.ir)
+        else:
+            self.sink.emit("\n[{0}] No calls or returns in BB.", self.ir)
 
 # Driver ---------------------------------------------------------------------------------------------------------------
 
@@ -556,77 +1064,320 @@ class SBEval:
     '''
     Driver for IR-based call/ret finders
     BAP turned off by default due to speed (Python sub-processes OCaml binary)
+    Optional lift store path persists lift results across runs
+    Optional per-IR worker pools lift blocks off the callback thread, results are resolved as they arrive
+    Optional pre-filter only lifts blocks ending in a possible call/ret, full lifting is the default
+    Optional position-independent tier rebases results for blocks seen before at another address (ASLR)
+    Optional sampler evaluates a subset of blocks, accuracy is then reported with confidence intervals
+    Optional progress line every few seconds, from the log sink's writer thread (only started if needed)
+    Block bytes are compared on every digest match by default, so a digest collision can't merge two blocks
     '''
 
-    def __init__(self, arch, verbose = False, run_bap = False):
+    def __init__(self, arch, verbose = False, run_bap = False, lift_store_path = None,
+                 lift_workers = 0, bap_workers = 0, lift_batch_size = 64, profile_slow_n = 0,
+                 use_prefilter = False, prefilter_audit_every = 100, use_pi_cache = False, sampler = None,
+                 progress = False, verify_bytes = True):
         self.is_first_bb = True
         self.panda_arch = Arch[arch]
         self.bb_exec_cnt = 0
         self.run_bap = run_bap
 
-        self.ircf_vex = SBVex(arch, verbose)
-        self.ircf_pcode = SBPCode(arch, verbose)
+        # Unsampled blocks only feed the previous block's true_dst
+        self.sampler = sampler
+        self.skip_exec_cnt = 0
+        self.guest_instr_cnt = 0
+
+        self.lift_store = None
+        if lift_store_path:
+            self.lift_store = store.LiftStore(lift_store_path)
+
+        # BAP is the slowest lifter, it can get its own (larger) pool
+        bap_workers = bap_workers if bap_workers else lift_workers
+        self.pools = []
+
+        # Every distinct block is held once, IRs keep per-block result columns indexed into this table
+        self.block_table = cache.BlockTable(verify_bytes)
+
+        self.ircf_vex = SBVex(arch, verbose, self.lift_store, self.make_pool(SBVex, lift_workers, lift_batch_size))
+        self.ircf_pcode = SBPCode(arch, verbose, self.lift_store, self.make_pool(SBPCode, lift_workers, lift_batch_size))
+        if self.run_bap:
+            self.ircf_bap = SBBap(arch, verbose, self.lift_store, self.make_pool(SBBap, bap_workers, lift_batch_size))
+
+        for sb in self.get_sbs():
+            sb.use_block_table(self.block_table)
+            sb.profile.enable_slowest(profile_slow_n)
+            if use_prefilter:
+                sb.enable_prefilter(prefilter_audit_every)
+            if use_pi_cache:
+                sb.enable_pi_cache()
+
+        # Progress is reported by the log sink's writer thread on a timer, log_block() only counts
+        self.sink = log_sink.get_sink() if (verbose or progress) else None
+        self.progress_cnt = 0
+        self.progress_time = time.monotonic()
+        if progress:
+            self.sink.add_progress(self.progress_str)
+
+    def get_sbs(self):
         if self.run_bap:
-            self.ircf_bap = SBBap(arch, verbose)
+            return [self.ircf_vex, self.ircf_pcode, self.ircf_bap]
+        else:
+            return [self.ircf_vex, self.ircf_pcode]
+
+    def make_pool(self, sb_cls, worker_cnt, batch_size):
+        if not worker_cnt:
+            return None
+        pool = lift_pool.LiftPool(sb_cls, worker_cnt, batch_size)
+        self.pools.append(pool)
+        return pool
+
+    @staticmethod
+    def peak_rss_mb():
+
+        '''
+        Peak resident set size of this process (ru_maxrss is KB on Linux)
+        '''
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def sample_str(self):
+
+        '''
+        Per-IR call imm true positive rate over sampled blocks, with a 95% Wilson interval
+        '''
+
+        lines = [
+            f"[SAMPLE] strategy: {self.sampler}, "
+            f"sampled_exec_cnt: {self.bb_exec_cnt - self.skip_exec_cnt}, "
+            f"skipped_exec_cnt: {self.skip_exec_cnt}"
+        ]
+        for sb in self.get_sbs():
+            bbc = sb.bb_result_cache
+            hit_cnt = sum(1 for bbr in bbc.iter_hits() if self.sampler.includes(bbr.addr, bbr.bb_bytes))
+            miss_cnt = sum(1 for bbr in bbc.iter_misses() if self.sampler.includes(bbr.addr, bbr.bb_bytes))
+            total_cnt = hit_cnt + miss_cnt
+            (lo, hi) = sampler.wilson_interval(hit_cnt, total_cnt)
+            lines.append(
+                f"[{sb.ir}] sampled unique_true_pos: {hit_cnt}, "
+                f"unique_false_pos: {miss_cnt}, "
+                f"true_pos_rate: {((hit_cnt / total_cnt) if total_cnt else 0.0):.6f} "
+                f"(95% CI: {lo:.6f}-{hi:.6f})"
+            )
+        return "\n".join(lines) + "\n"
 
     def __str__(self):
+        store_str = f"{self.lift_store}\n" if self.lift_store else ""
+        if self.sampler:
+            store_str += self.sample_str()
+        mem_str = (
+            f"[MEM] unique_bb_cnt: {len(self.block_table)}, "
+            f"digest_collision_cnt: {self.block_table.collision_cnt}, "
+            f"peak_rss: {SBEval.peak_rss_mb():.1f} MB\n"
+        )
+        if self.sink:
+            mem_str += f"{self.sink}\n"
         if self.run_bap:
             return (
                 "\nRESULTS:\n"
                 f"{self.ircf_vex}\n"
                 f"{self.ircf_pcode}\n"
                 f"{self.ircf_bap}\n"
+                f"{store_str}"
+                f"{mem_str}"
             )
         else:
             return (
                 "\nRESULTS:\n"
                 f"{self.ircf_vex}\n"
                 f"{self.ircf_pcode}\n"
+                f"{store_str}"
+                f"{mem_str}"
             )
 
+    def flush(self):
+        self.ircf_vex.flush()
+        self.ircf_pcode.flush()
+        if self.run_bap:
+            self.ircf_bap.flush()
+
+    def progress_str(self):
+        now = time.monotonic()
+        bb_exec_cnt = self.bb_exec_cnt
+        rate = (bb_exec_cnt - self.progress_cnt) / max(now - self.progress_time, 1e-9)
+        self.progress_cnt = bb_exec_cnt
+        self.progress_time = now
+        return f"{bb_exec_cnt} basic blocks observed ({rate:.1f} blocks/sec)."
+
+    def close(self):
+        self.flush()
+        for pool in self.pools:
+            pool.close()
+        if self.lift_store:
+            self.lift_store.close()
+        if self.sink:
+            self.sink.remove_progress(self.progress_str)
+            self.sink.flush()
+
+    def set_guest_instr_cnt(self, instr_cnt):
+        self.guest_instr_cnt = instr_cnt
+
     def lift_block(self, start_addr, data):
-        self.ircf_vex.lift_block(start_addr, data)
-        self.ircf_pcode.lift_block(start_addr, data)
+        # Translation only peeks at the sampler, blocks are admitted when they execute
+        if self.sampler and (not self.sampler.would_sample(start_addr, data, self.guest_instr_cnt)):
+            return
+
+        data = self.block_table.canonical(start_addr, data)
+        self.ircf_vex.prefetch_block(start_addr, data)
+        self.ircf_pcode.prefetch_block(start_addr, data)
         if self.run_bap:
-            self.ircf_bap.lift_block(start_addr, data)
+            self.ircf_bap.prefetch_block(start_addr, data)
 
     def log_block(self, start_addr, data):
+        if self.sampler and (not self.sampler.is_sampled(start_addr, data, self.guest_instr_cnt)):
+            self.bb_exec_cnt += 1
+            self.skip_exec_cnt += 1
+            for sb in self.get_sbs():
+                sb.log_skipped(start_addr)
+            return
+
+        data = self.block_table.canonical(start_addr, data)
         self.ircf_vex.log_block(start_addr, data)
         self.ircf_pcode.log_block(start_addr, data)
         if self.run_bap:
             self.ircf_bap.log_block(start_addr, data)
 
         self.bb_exec_cnt += 1
-        if (self.bb_exec_cnt % 5000) == 0:
-            print(f"{self.bb_exec_cnt} basic blocks observed.")
+
+    # Columnar export: one row per result, block bytes concatenated into a side file at bytes_off
+    NPY_DTYPE = np.dtype([
+        ("addr", np.uint64),
+        ("ir_dst", np.uint64),
+        ("true_dst", np.uint64),
+        ("flags", np.uint8),
+        ("bytes_off", np.uint64),
+        ("bytes_len", np.uint32),
+    ])
+
+    NPY_HAS_IR_DST      = 0x1
+    NPY_HAS_TRUE_DST    = 0x2
+    NPY_IS_MISS         = 0x4
+    NPY_IS_FAIL         = 0x8
 
     @staticmethod
-    def dump_json(sb, category, space):
-        name = 'ir_' + str(sb.ir)
-        data = {}
-        data[name] = []
+    def dump_name(sb, category, space):
+        return 'ir_' + str(sb.ir) + "_" + space + "_" + str(category) + "_" + str(sb.panda_arch)
+
+    @staticmethod
+    def get_category(sb, category):
+        if category == ErrorCategory.MISS:
+            return sb.bb_result_cache.iter_misses()
+        elif category == ErrorCategory.FAIL:
+            return sb.bb_result_cache.iter_fails()
+        else:
+            raise RuntimeError
 
+    @staticmethod
+    def get_category_cnt(sb, category):
         if category == ErrorCategory.MISS:
-            for miss in sb.bb_result_cache.get_miss_list():
-                data[name].append(miss.to_str_dict())
+            return sb.bb_result_cache.get_miss_cnt()
         elif category == ErrorCategory.FAIL:
-            for fail in sb.bb_result_cache.get_fail_list():
-                data[name].append(fail.to_str_dict())
+            return sb.bb_result_cache.get_fail_cnt()
         else:
             raise RuntimeError
 
-        with open(name + "_" + space + "_" + str(category) + "_" + str(sb.panda_arch) + ".json", "w") as f:
+    @staticmethod
+    def dump_json(sb, category, space):
+        name = 'ir_' + str(sb.ir)
+        data = {}
+        data[name] = []
+
+        for bbr in SBEval.get_category(sb, category):
+            data[name].append(bbr.to_str_dict())
+
+        with open(SBEval.dump_name(sb, category, space) + ".json", "w") as f:
             json.dump(data, f, indent = 4)
 
+    @staticmethod
+    def dump_jsonl(sb, category, space, compress = False):
+
+        '''
+        One JSON object per line, streamed from the cache without an intermediate list
+        '''
+
+        if compress:
+            f = gzip.open(SBEval.dump_name(sb, category, space) + ".jsonl.gz", "wt")
+        else:
+            f = open(SBEval.dump_name(sb, category, space) + ".jsonl", "w")
+
+        with f:
+            for bbr in SBEval.get_category(sb, category):
+                f.write(json.dumps(bbr.to_str_dict()) + "\n")
+
+    @staticmethod
+    def dump_npy(sb, category, space):
+
+        '''
+        NumPy structured array (memory-mappable with np.load(mmap_mode='r')) plus a raw block bytes file
+        '''
+
+        name = SBEval.dump_name(sb, category, space)
+        results = SBEval.get_category(sb, category)
+        rows = np.lib.format.open_memmap(name + ".npy", mode = "w+", dtype = SBEval.NPY_DTYPE,
+            shape = (SBEval.get_category_cnt(sb, category),))
+
+        bytes_off = 0
+        with open(name + ".bytes.bin", "wb") as f:
+            for (idx, bbr) in enumerate(results):
+                flags = 0
+                if bbr.ir_dst != None:
+                    flags |= SBEval.NPY_HAS_IR_DST
+                if bbr.true_dst != None:
+                    flags |= SBEval.NPY_HAS_TRUE_DST
+                if bbr.is_miss == True:
+                    flags |= SBEval.NPY_IS_MISS
+                if bbr.is_lift_exception == True:
+                    flags |= SBEval.NPY_IS_FAIL
+
+                rows[idx] = (
+                    bbr.addr,
+                    bbr.ir_dst if bbr.ir_dst != None else 0,
+                    bbr.true_dst if bbr.true_dst != None else 0,
+                    flags,
+                    bytes_off,
+                    len(bbr.bb_bytes),
+                )
+                f.write(bbr.bb_bytes)
+                bytes_off += len(bbr.bb_bytes)
+
+        rows.flush()
+        del rows
+
+    @staticmethod
+    def dump_category(sb, category, space, fmt):
+        if fmt == DumpFormat.JSON:
+            SBEval.dump_json(sb, category, space)
+        elif fmt == DumpFormat.JSONL:
+            SBEval.dump_jsonl(sb, category, space)
+        elif fmt == DumpFormat.JSONL_GZ:
+            SBEval.dump_jsonl(sb, category, space, compress = True)
+        elif fmt == DumpFormat.NPY:
+            SBEval.dump_npy(sb, category, space)
+        else:
+            raise RuntimeError
+
     def dump_result(self, space):
         with open("result_" + space + "_" + str(self.panda_arch) + ".txt", "w") as f:
             f.write(str(self) + "\n")
 
-    def dump_misses(self, space):
-        SBEval.dump_json(self.ircf_vex, ErrorCategory.MISS, space)
-        SBEval.dump_json(self.ircf_vex, ErrorCategory.FAIL, space)
-        SBEval.dump_json(self.ircf_pcode, ErrorCategory.MISS, space)
-        SBEval.dump_json(self.ircf_pcode, ErrorCategory.FAIL, space)
+        with open("profile_" + space + "_" + str(self.panda_arch) + ".txt", "w") as f:
+            for sb in self.get_sbs():
+                f.write(sb.profile.to_str(sb.ir) + "\n")
+
+    def dump_misses(self, space, fmt = DumpFormat.JSON):
+        SBEval.dump_category(self.ircf_vex, ErrorCategory.MISS, space, fmt)
+        SBEval.dump_category(self.ircf_vex, ErrorCategory.FAIL, space, fmt)
+        SBEval.dump_category(self.ircf_pcode, ErrorCategory.MISS, space, fmt)
+        SBEval.dump_category(self.ircf_pcode, ErrorCategory.FAIL, space, fmt)
         if self.run_bap:
-            SBEval.dump_json(self.ircf_bap, ErrorCategory.MISS, space)
-            SBEval.dump_json(self.ircf_bap, ErrorCategory.FAIL, space)
\ No newline at end of file
+            SBEval.dump_category(self.ircf_bap, ErrorCategory.MISS, space, fmt)
+            SBEval.dump_category(self.ircf_bap, ErrorCategory.FAIL, space, fmt)
\ No newline at end of file
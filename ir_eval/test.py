@@ -1,8 +1,25 @@
 import enum
 import collections
 import unittest
+import tempfile
+import random
+import os
+import io
+import time
+import threading
+import json
+import gzip
+
+import numpy as np
 
 import switchboard
+import cache
+import store
+import bbtrace
+import prefilter
+import log_sink
+import sampler
+import lift_stats
 
 # Test Data x86 --------------------------------------------------------------------------------------------------------
 
@@ -134,6 +151,99 @@ class TestIRs(unittest.TestCase):
         self.run_ir(switchboard.IR.BAP, bb_ret)
         self.run_ir(switchboard.IR.BAP, bb_bl)
 
+    def run_ir_batch(self, sb_cls):
+        snippets = [bb_call_imm, bb_call_neg_imm, bb_call_reg, bb_ret]
+        sb = sb_cls("x86_64")
+        bbrs = sb.lift_blocks([(s.addr, s.bytes) for s in snippets])
+        self.assertEqual([bbr.ir_dst for bbr in bbrs], [0x1337, 0x1337, None, None])
+        self.assertEqual(sb.call_imm_cnt, 2)
+        self.assertEqual(sb.call_reg_cnt, 1)
+        self.assertEqual(sb.ret_cnt, 1)
+
+    def run_ir_batch_vs_single(self, sb_cls):
+
+        '''
+        Back-to-back blocks, the first cut inside its call, must lift the same batched as one at a time
+        '''
+
+        truncated = b"".join(bb_call_imm_str[:2]) + bb_call_imm_str[2][:2]
+        blocks = [
+            (0x1000, truncated),
+            (0x1000 + len(truncated), bb_call_imm_str[2][2:] + bb_ret_str[2]),
+            (0x4000, bb_call_imm.bytes),
+            (0x4000 + len(bb_call_imm.bytes), bb_ret.bytes),
+        ]
+
+        sb = sb_cls("x86_64")
+        for start_addr, data in blocks:
+            sb.lift_block(start_addr, data)
+        single = [sb.bb_result_cache.get_result(start_addr, data, count = False) for (start_addr, data) in blocks]
+
+        sb_batch = sb_cls("x86_64")
+        batch = sb_batch.lift_blocks(blocks)
+        self.assertEqual(
+            [(bbr.ir_dst, bbr.is_lift_exception) for bbr in batch],
+            [(bbr.ir_dst, bbr.is_lift_exception) for bbr in single]
+        )
+        self.assertEqual(
+            (sb_batch.call_imm_cnt, sb_batch.call_reg_cnt, sb_batch.ret_cnt, sb_batch.bb_cnt),
+            (sb.call_imm_cnt, sb.call_reg_cnt, sb.ret_cnt, sb.bb_cnt)
+        )
+
+    def run_ir_batch_scattered(self, sb_cls, lift_fail = False):
+
+        '''
+        Blocks far apart, including the same bytes at two addresses, must lift the same batched as one at a time
+        '''
+
+        blocks = [
+            (0x2000, bb_ret.bytes),
+            (0x9000, bb_call_reg.bytes),
+            (0x400000, bb_call_imm.bytes),
+            (0x500000, bb_call_imm.bytes),
+            (0x7f0000001000, bb_call_neg_imm.bytes),
+        ]
+        if lift_fail:
+            blocks.append((0x6000, b"\x0f\xff"))
+
+        sb = sb_cls("x86_64")
+        for start_addr, data in blocks:
+            sb.lift_block(start_addr, data)
+        single = [sb.bb_result_cache.get_result(start_addr, data, count = False) for (start_addr, data) in blocks]
+
+        sb_batch = sb_cls("x86_64")
+        batch = sb_batch.lift_blocks(blocks)
+        self.assertEqual(
+            [bbr.ir_dst for bbr in batch[:5]],
+            [None, None, 0x401337, 0x501337, (0x7f0000001000 + 0x1337 - bb_call_neg_imm.addr)]
+        )
+        self.assertEqual(
+            [(bbr.ir_dst, bbr.is_lift_exception) for bbr in batch],
+            [(bbr.ir_dst, bbr.is_lift_exception) for bbr in single]
+        )
+        self.assertEqual(
+            (sb_batch.call_imm_cnt, sb_batch.call_reg_cnt, sb_batch.ret_cnt, sb_batch.bb_cnt),
+            (sb.call_imm_cnt, sb.call_reg_cnt, sb.ret_cnt, sb.bb_cnt)
+        )
+        return sb_batch
+
+    def test_batch(self):
+        self.run_ir_batch(switchboard.SBVex)
+        self.run_ir_batch(switchboard.SBPCode)
+        self.run_ir_batch_vs_single(switchboard.SBVex)
+        self.run_ir_batch_vs_single(switchboard.SBPCode)
+        for sb_cls in [switchboard.SBVex, switchboard.SBPCode]:
+            self.run_ir_batch_scattered(sb_cls)
+            self.run_ir_batch_scattered(sb_cls, lift_fail = True)
+
+    def test_bap_batch(self):
+        self.run_ir_batch(switchboard.SBBap)
+        self.run_ir_batch_vs_single(switchboard.SBBap)
+
+        # Non-contiguous blocks still take a single `mc` call
+        self.assertEqual(self.run_ir_batch_scattered(switchboard.SBBap).mc_cnt, 1)
+        self.run_ir_batch_scattered(switchboard.SBBap, lift_fail = True)
+
     '''
     def test_vex_special(self):
         self.run_ir(switchboard.IR.VEX, bb_sysexit)
@@ -145,5 +255,624 @@ class TestIRs(unittest.TestCase):
         self.run_ir(switchboard.IR.BAP, bb_sysexit)
     '''
 
+class TestCache(unittest.TestCase):
+
+    '''
+    Verify digest-keyed result cache lookups
+    '''
+
+    def test_lookup(self):
+        bbc = cache.BBResultCache(switchboard.Arch.x86_64, verify_bytes=True)
+        bbc.add(cache.BBResult(switchboard.Arch.x86_64, bb_ret.addr, bb_ret.bytes, None, None))
+        self.assertIsNotNone(bbc.get_result(bb_ret.addr, bytearray(bb_ret.bytes)))
+        self.assertIsNone(bbc.get_result(bb_ret.addr, bb_call_reg.bytes))
+        self.assertIsNone(bbc.get_result(bb_ret.addr + 1, bb_ret.bytes))
+
+        stats = bbc.get_lookup_stats()
+        self.assertEqual(stats["lookup_cnt"], 3)
+        self.assertEqual(stats["hit_cnt"], 1)
+        self.assertEqual(stats["miss_cnt"], 2)
+
+    def test_exec_lookups(self):
+
+        '''
+        One counted lookup per executed block, the lift after a miss doesn't look up again
+        '''
+
+        sb = switchboard.SBVex("x86_64")
+        for snippet in [bb_call_imm, bb_ret, bb_call_imm, bb_ret, bb_call_reg]:
+            sb.log_block(snippet.addr, snippet.bytes)
+
+        stats = sb.bb_result_cache.get_lookup_stats()
+        self.assertEqual((stats["lookup_cnt"], stats["hit_cnt"], stats["miss_cnt"]), (5, 2, 3))
+        self.assertEqual(sb.bb_cnt, 3)
+
+        # Translate-time lookups aren't counted
+        sb.lift_block(bb_ret.addr, bb_ret.bytes)
+        sb.lift_block(bb_call_neg_imm.addr, bb_call_neg_imm.bytes)
+        self.assertEqual(sb.bb_result_cache.get_lookup_stats()["lookup_cnt"], 5)
+        self.assertEqual(sb.bb_cnt, 4)
+
+    def test_digest_collision(self):
+
+        '''
+        SBEval compares block bytes by default, blocks whose digests collide keep separate results
+        '''
+
+        block_digest = cache.block_digest
+        cache.block_digest = lambda data: b"collide"
+        try:
+            for verify_bytes in [True, False]:
+                ir_eval = switchboard.SBEval("x86_64", verify_bytes=verify_bytes)
+                ir_eval.log_block(0x1000, bb_call_imm.bytes)
+                ir_eval.log_block(0x1000, bb_ret.bytes)
+                ir_eval.flush()
+                sb = ir_eval.ircf_vex
+                bbr = sb.bb_result_cache.get_result(0x1000, bb_ret.bytes, count = False)
+                if verify_bytes:
+                    self.assertEqual(len(ir_eval.block_table), 2)
+                    self.assertEqual(ir_eval.block_table.collision_cnt, 1)
+                    self.assertEqual((bbr.bb_bytes, bbr.ir_dst), (bb_ret.bytes, None))
+                    self.assertEqual((sb.call_imm_cnt, sb.ret_cnt), (1, 1))
+                else:
+                    # Unverified, the ret block is taken for the call block already seen
+                    self.assertEqual(len(ir_eval.block_table), 1)
+                    self.assertEqual((sb.call_imm_cnt, sb.ret_cnt), (1, 0))
+                ir_eval.close()
+        finally:
+            cache.block_digest = block_digest
+
+    def test_classify(self):
+        bbc = cache.BBResultCache(switchboard.Arch.x86_64)
+        call_bbr = cache.BBResult(switchboard.Arch.x86_64, bb_call_imm.addr, bb_call_imm.bytes, 0x1337, None)
+        fail_bbr = cache.BBResult(switchboard.Arch.x86_64, bb_sysexit.addr, bb_sysexit.bytes, None, None, True)
+        bbc.add(call_bbr)
+        bbc.add(fail_bbr)
+        self.assertEqual((bbc.get_hit_cnt(), bbc.get_miss_cnt(), bbc.get_fail_cnt()), (0, 0, 1))
+
+        bbc.set_true_dst(call_bbr, 0x1337)
+        self.assertEqual((bbc.get_hit_cnt(), bbc.get_miss_cnt()), (1, 0))
+        bbc.set_true_dst(call_bbr, 0x1338)
+        self.assertEqual((bbc.get_hit_cnt(), bbc.get_miss_cnt()), (0, 1))
+        self.assertEqual(bbc.get_miss_list(), [call_bbr])
+        self.assertEqual(bbc.get_fail_list(), [fail_bbr])
+
+    def test_shared_table(self):
+        table = cache.BlockTable()
+        vex_bbc = cache.BBResultCache(switchboard.Arch.x86_64, block_table=table)
+        pcode_bbc = cache.BBResultCache(switchboard.Arch.x86_64, block_table=table)
+        data = table.canonical(bb_call_imm.addr, bytearray(bb_call_imm.bytes))
+        vex_bbc.add(cache.BBResult(switchboard.Arch.x86_64, bb_call_imm.addr, data, 0x1337, None))
+        pcode_bbc.add(cache.BBResult(switchboard.Arch.x86_64, bb_call_imm.addr, data, 0x1338, None))
+        self.assertEqual(len(table), 1)
+
+        vex_bbr = vex_bbc.get_result(bb_call_imm.addr, bb_call_imm.bytes)
+        pcode_bbr = pcode_bbc.get_result(bb_call_imm.addr, bb_call_imm.bytes)
+        self.assertIs(vex_bbr.bb_bytes, pcode_bbr.bb_bytes)
+        vex_bbc.set_true_dst(vex_bbr, 0x1337)
+        pcode_bbc.set_true_dst(pcode_bbr, 0x1337)
+        self.assertEqual((vex_bbr.is_miss, pcode_bbr.is_miss), (False, True))
+        self.assertEqual(pcode_bbc.get_miss_list()[0].to_str_dict(), pcode_bbr.to_str_dict())
+
+    def test_views(self):
+
+        '''
+        Columnar cache classifies exactly like per-object BBResults updated in place
+        '''
+
+        rng = random.Random(0)
+        bbc = cache.BBResultCache(switchboard.Arch.x86_64)
+        ref = {}
+        for i in range(500):
+            addr = rng.randrange(64)
+            data = bytes([rng.randrange(4)] * rng.randint(1, 3))
+            if (addr, data) not in ref:
+                ir_dst = rng.choice([None, 0x10, 0x20, 0xffffffffffff0000])
+                ref[(addr, data)] = cache.BBResult(switchboard.Arch.x86_64, addr, data, ir_dst, None, (i % 7) == 0)
+                bbc.put(addr, data, ir_dst, None, (i % 7) == 0)
+
+            # Reference semantics: true_dst always recorded, hit/miss only decided once there's an IR target
+            true_dst = rng.choice([0x10, 0x20, 0xffffffffffff0000])
+            bbr = ref[(addr, data)]
+            bbr.true_dst = true_dst
+            if bbr.ir_dst != None:
+                bbr.is_miss = (bbr.ir_dst != true_dst)
+            bbc.set_true_dst(bbc.get_result(addr, data), true_dst)
+
+        ref_hits = {bbr for bbr in ref.values() if bbr.is_miss == False}
+        ref_misses = {bbr for bbr in ref.values() if bbr.is_miss == True}
+        ref_fails = {bbr for bbr in ref.values() if bbr.is_lift_exception}
+        self.assertEqual(set(bbc.iter_hits()), ref_hits)
+        self.assertEqual(set(bbc.iter_misses()), ref_misses)
+        self.assertEqual(set(bbc.iter_fails()), ref_fails)
+        self.assertEqual((bbc.get_hit_cnt(), bbc.get_miss_cnt(), bbc.get_fail_cnt()),
+            (len(ref_hits), len(ref_misses), len(ref_fails)))
+
+        for view in bbc.values():
+            bbr = ref[(view.addr, view.bb_bytes)]
+            self.assertEqual(view.to_str_dict(), bbr.to_str_dict())
+            self.assertEqual(view.is_miss, bbr.is_miss)
+
+    def test_tb_bytes(self):
+        tbc = cache.TBBytesCache()
+        tbc.put(bb_ret.addr, 1, bb_ret.bytes)
+        self.assertEqual(tbc.get(bb_ret.addr, 1, len(bb_ret.bytes)), bb_ret.bytes)
+        self.assertIsNone(tbc.get(bb_ret.addr, 2, len(bb_ret.bytes)))
+        self.assertIsNone(tbc.get(bb_ret.addr, 1, len(bb_ret.bytes) + 1))
+
+        # Self-modified code gets retranslated
+        tbc.put(bb_ret.addr, 1, bb_call_reg.bytes)
+        self.assertEqual(tbc.get(bb_ret.addr, 1, len(bb_call_reg.bytes)), bb_call_reg.bytes)
+        self.assertEqual((tbc.reuse_cnt, tbc.retrans_cnt, tbc.modified_cnt), (2, 1, 1))
+
+        tbc.invalidate(bb_ret.addr, 1)
+        self.assertIsNone(tbc.get(bb_ret.addr, 1, len(bb_call_reg.bytes)))
+
+class TestPrefilter(unittest.TestCase):
+
+    '''
+    Verify the last-instruction pre-filter keeps call/ret blocks and skips the rest
+    '''
+
+    def test_x86_64(self):
+        is_candidate = prefilter.get_filter(switchboard.Arch.x86_64)
+
+        # Snippets minus their unreachable trailing instruction, as a translated block would end
+        for snippet_str in [bb_call_imm_str, bb_call_neg_imm_str, bb_call_reg_str, bb_ret_str]:
+            self.assertTrue(is_candidate(b"".join(snippet_str[:-1])))
+        self.assertFalse(is_candidate(b"".join(bb_call_imm_str[:2])))
+
+    def test_audit(self):
+        sb = switchboard.SBVex("x86_64")
+        sb.enable_prefilter(audit_every = 1)
+        sb.lift_block(0x1000, b"".join(bb_call_imm_str[:-1]))
+        sb.lift_block(0x2000, b"".join(bb_call_imm_str[:2]) + b"\xe9\x00\x01\x00\x00")   # jmp
+        sb.lift_block(0x3000, bb_call_imm.bytes)    # Unreachable tail hides the call
+        self.assertEqual((sb.prefilter_skip_cnt, sb.prefilter_audit_cnt, sb.prefilter_fn_cnt), (2, 2, 1))
+        self.assertEqual(sb.call_imm_cnt, 2)
+
+class TestPICache(unittest.TestCase):
+
+    '''
+    Verify position-independent reuse rebases PC-relative targets and never absolute ones
+    '''
+
+    def test_rebase(self):
+        sb = switchboard.SBVex("x86_64")
+        sb.enable_pi_cache()
+        for addr in [0x1000, 0x2000, 0x7f0000003000]:
+            sb.lift_block(addr, bb_call_imm.bytes)
+            self.assertEqual(sb.bb_result_cache.get_result(addr, bb_call_imm.bytes).ir_dst, addr + 0x1337)
+        self.assertEqual((sb.bb_cnt, sb.pi_verify_cnt, sb.pi_hit_cnt, sb.call_imm_cnt), (2, 1, 1, 3))
+
+    def test_absolute(self):
+        jal = b"\x0c\x00\x04\x00\x00\x00\x00\x00"     # jal 0x1000; nop
+        sb = switchboard.SBVex("mips")
+        sb.enable_pi_cache()
+        for addr in [0x400000, 0x500000, 0x600000]:
+            sb.lift_block(addr, jal)
+            self.assertEqual(sb.bb_result_cache.get_result(addr, jal).ir_dst, 0x1000)
+        self.assertEqual((sb.bb_cnt, sb.pi_absolute_cnt, sb.pi_hit_cnt), (3, 1, 0))
+
+class TestSampler(unittest.TestCase):
+
+    '''
+    Verify sampling strategies and that skipped blocks still resolve sampled call targets
+    '''
+
+    def test_wilson(self):
+        (lo, hi) = sampler.wilson_interval(50, 100)
+        self.assertAlmostEqual(lo, 0.4038, places = 4)
+        self.assertAlmostEqual(hi, 0.5962, places = 4)
+        self.assertEqual(sampler.wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_reservoir(self):
+        res = sampler.ReservoirSampler(10)
+        for addr in range(1000):
+            res.is_sampled(addr, bb_ret.bytes)
+        self.assertEqual(len(res.members), 10)
+        for addr in range(1000):
+            self.assertEqual(res.would_sample(addr, bb_ret.bytes), res.includes(addr, bb_ret.bytes))
+            self.assertEqual(res.is_sampled(addr, bb_ret.bytes), res.includes(addr, bb_ret.bytes))
+
+        # Bottom-k: the members are the 10 lowest hashes, whatever order blocks arrive in
+        lowest = sorted(res.hash(addr, bb_ret.bytes) for addr in range(1000))[:10]
+        self.assertEqual(sorted(res.members), lowest)
+        shuffled = sampler.ReservoirSampler(10)
+        for addr in random.Random(0).sample(range(1000), 1000):
+            shuffled.is_sampled(addr, bb_ret.bytes)
+        self.assertEqual(shuffled.members, res.members)
+
+    def test_translate_not_sampled(self):
+
+        '''
+        Translated blocks aren't admitted to the reservoir, only executed ones are
+        '''
+
+        res = sampler.ReservoirSampler(2)
+        ir_eval = switchboard.SBEval("x86_64", sampler=res)
+        for addr in range(0x1000, 0x1100, 0x10):
+            ir_eval.lift_block(addr, bb_ret.bytes)
+        self.assertEqual(len(res.members), 0)
+        self.assertEqual(ir_eval.ircf_vex.bb_cnt, 16) # Reservoir not full yet, every translation may be sampled
+
+        ir_eval.log_block(0x2000, bb_ret.bytes)
+        self.assertTrue(res.includes(0x2000, bb_ret.bytes))
+        self.assertEqual(len(res.members), 1)
+        ir_eval.close()
+
+    def test_skipped_true_dst(self):
+        sb = switchboard.SBVex("x86_64")
+        sb.log_block(bb_call_imm.addr, bb_call_imm.bytes)
+        sb.log_skipped(0x1337)
+        sb.log_skipped(0x2000)
+        sb.log_block(bb_ret.addr, bb_ret.bytes)
+        self.assertEqual((sb.bb_result_cache.get_hit_cnt(), sb.bb_result_cache.get_miss_cnt()), (1, 0))
+
+class TestLogSink(unittest.TestCase):
+
+    '''
+    Verify ring buffer records are formatted in order and overruns drop the oldest
+    '''
+
+    def test_ring(self):
+        out = io.StringIO()
+        sink = log_sink.LogSink(capacity=4, out=out)
+        sink.emit("[{0}] Call dest: {1:08x}", switchboard.IR.VEX, 0x1337)
+        sink.emit(cache.byte_str, bb_ret.bytes)
+        sink.flush()
+        self.assertEqual(out.getvalue(), "[VEX] Call dest: 00001337\n" + cache.byte_str(bb_ret.bytes) + "\n")
+
+        for i in range(6):
+            sink.emit("{0}", i)
+        sink.flush()
+        self.assertTrue(out.getvalue().endswith("2\n3\n4\n5\n"))
+        self.assertEqual((sink.emit_cnt, sink.drop_cnt), (6, 2))
+
+    def test_overrun_while_draining(self):
+        out = io.StringIO()
+        sink = log_sink.LogSink(capacity=8, out=out)
+        record_cnt = 4000
+
+        # Slow formatting gives up the GIL, so the producer wraps the ring mid-drain
+        def slow_fmt(i):
+            time.sleep(0.0002)
+            return str(i)
+
+        # Keeps emitting for the whole test instead of finishing before the first drain
+        def produce():
+            for i in range(record_cnt):
+                sink.emit(slow_fmt, i)
+                if (i % 16) == 0:
+                    time.sleep(0)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        while producer.is_alive():
+            sink.flush()
+        producer.join()
+        sink.flush()
+
+        # Every record is either written once, in order, or counted as dropped
+        written = [int(line) for line in out.getvalue().split()]
+        self.assertEqual(written, sorted(set(written)))
+        self.assertEqual(sink.emit_cnt, len(written))
+        self.assertEqual(sink.emit_cnt + sink.drop_cnt, record_cnt)
+        self.assertEqual(written[-1], record_cnt - 1)
+
+class TestLiftProfile(unittest.TestCase):
+
+    '''
+    Verify latency histogram buckets and percentiles, and the per-outcome/size profile breakdown
+    '''
+
+    def test_buckets(self):
+        hist = lift_stats.LogHistogram
+        self.assertEqual(hist.bucket_idx(0.0), 0)
+        self.assertEqual(hist.bucket_idx(hist.MIN_SEC), 0)
+
+        # Lower bounds are inclusive, one octave is BUCKETS_PER_OCTAVE buckets
+        self.assertEqual(hist.bucket_idx(2 * hist.MIN_SEC), hist.BUCKETS_PER_OCTAVE)
+        self.assertEqual(hist.bucket_idx(1.99 * hist.MIN_SEC), hist.BUCKETS_PER_OCTAVE - 1)
+        self.assertAlmostEqual(hist.bucket_upper(hist.BUCKETS_PER_OCTAVE - 1), 2 * hist.MIN_SEC)
+        for sec in [3e-7, 1e-6, 4.2e-5, 1e-3, 0.5]:
+            idx = hist.bucket_idx(sec)
+            self.assertLessEqual(hist.bucket_upper(idx - 1), sec * (1 + 1e-9))
+            self.assertLess(sec, hist.bucket_upper(idx))
+
+        # Anything past the last bucket is clamped into it
+        self.assertEqual(hist.bucket_idx(1e6), hist.BUCKET_CNT - 1)
+
+    def test_percentiles(self):
+        hist = lift_stats.LogHistogram()
+        self.assertEqual(hist.percentile(50), 0.0)
+
+        for _ in range(90):
+            hist.add(1e-6)
+        for _ in range(10):
+            hist.add(1e-3)
+
+        fast_upper = lift_stats.LogHistogram.bucket_upper(lift_stats.LogHistogram.bucket_idx(1e-6))
+        self.assertEqual(hist.percentile(50), fast_upper)
+        self.assertEqual(hist.percentile(90), fast_upper)
+        self.assertEqual(hist.percentile(91), 1e-3)     # Capped at the observed max
+        self.assertEqual(hist.percentile(99), 1e-3)
+        self.assertEqual(hist.cnt, 100)
+        self.assertAlmostEqual(hist.total_sec, (90 * 1e-6) + (10 * 1e-3))
+
+    def test_breakdown(self):
+        profile = lift_stats.LiftProfile()
+        profile.enable_slowest(2)
+        records = [
+            (1e-5, 0x1000, bb_call_imm.bytes, switchboard.BBKind.CALL_IMM),
+            (3e-5, 0x2000, bb_ret.bytes, switchboard.BBKind.RET),
+            (2e-5, 0x3000, b"\x90", switchboard.BBKind.NONE),
+            (5e-5, 0x4000, bb_call_reg.bytes, switchboard.BBKind.CALL_REG),
+            (4e-5, 0x5000, b"\x90" * 8, switchboard.BBKind.NONE),
+        ]
+        for record in records:
+            profile.record(*record)
+
+        self.assertEqual(profile.all.cnt, 5)
+        self.assertEqual(
+            {kind: hist.cnt for kind, hist in profile.by_kind.items()},
+            {str(switchboard.BBKind.CALL_IMM): 1, str(switchboard.BBKind.RET): 1,
+             str(switchboard.BBKind.NONE): 2, str(switchboard.BBKind.CALL_REG): 1}
+        )
+
+        # One 1 byte block, the 8-14 byte ones share a bucket
+        self.assertEqual(lift_stats.LiftProfile.size_bucket(12), (8, 15))
+        self.assertEqual(
+            {bucket: hist.cnt for bucket, hist in profile.by_size.items()},
+            {(1, 1): 1, (8, 15): 4}
+        )
+
+        # Slowest N, printed slowest first
+        self.assertEqual(sorted(entry[1] for entry in profile.slowest), [0x4000, 0x5000])
+        slow_lines = [line for line in profile.to_str(switchboard.IR.VEX).split("\n") if " slow " in line]
+        self.assertEqual(len(slow_lines), 2)
+        self.assertIn(f"addr: {0x4000:016x}", slow_lines[0])
+        self.assertIn(f"addr: {0x5000:016x}", slow_lines[1])
+
+class TestLiftStore(unittest.TestCase):
+
+    '''
+    Verify lift results persist across store instances
+    '''
+
+    def test_persist(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "lift_store.db")
+
+            sb = switchboard.SBVex(bb_call_imm.arch, lift_store=store.LiftStore(path))
+            sb.lift_block(bb_call_imm.addr, bb_call_imm.bytes)
+            sb.lift_store.close()
+
+            sb = switchboard.SBVex(bb_call_imm.arch, lift_store=store.LiftStore(path))
+            sb.lift_block(bb_call_imm.addr, bb_call_imm.bytes)
+            self.assertEqual(sb.lift_store.hit_rate(switchboard.IR.VEX), 1.0)
+            self.assertEqual(sb.call_imm_cnt, 1)
+            self.assertEqual(sb.bb_result_cache.get_result(bb_call_imm.addr, bb_call_imm.bytes).ir_dst, 0x1337)
+
+            # Restored, not lifted: the previous run's lift time stays out of this run's stats
+            self.assertEqual((sb.bb_cnt, sb.stored_cnt, sb.avg_bb_lift_time_sec), (0, 1, None))
+            self.assertIn("stored_cnt: 1", str(sb))
+            sb.lift_store.close()
+
+    def test_prefilter(self):
+
+        '''
+        A stored result wins over the pre-filter, on single, exec and batch paths
+        '''
+
+        addr = 0x3000
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "lift_store.db")
+
+            # Unreachable tail hides the call from the pre-filter, a full lift stores it
+            sb = switchboard.SBVex(bb_call_imm.arch, lift_store=store.LiftStore(path))
+            sb.lift_block(addr, bb_call_imm.bytes)
+            sb.lift_store.close()
+
+            for lift in ["lift_block", "log_block", "lift_blocks"]:
+                sb = switchboard.SBVex(bb_call_imm.arch, lift_store=store.LiftStore(path))
+                sb.enable_prefilter(audit_every = 0)
+                if lift == "lift_blocks":
+                    sb.lift_blocks([(addr, bb_call_imm.bytes)])
+                else:
+                    getattr(sb, lift)(addr, bb_call_imm.bytes)
+
+                bbr = sb.bb_result_cache.get_result(addr, bb_call_imm.bytes, count = False)
+                self.assertEqual(bbr.ir_dst, addr + 0x1337)
+                self.assertEqual((sb.stored_cnt, sb.prefilter_skip_cnt, sb.call_imm_cnt), (1, 0, 1))
+                sb.lift_store.close()
+
+class TestLiftPool(unittest.TestCase):
+
+    '''
+    Verify queued lifting on worker pools ends with the same results as lifting inline
+    '''
+
+    def run_eval(self, lift_workers):
+        bad_bytes = b"\x0f\xff"
+        events = [
+            (False, bb_call_imm.addr, bb_call_imm.bytes),
+            (True, bb_call_imm.addr, bb_call_imm.bytes),
+            (True, 0x1337, bb_ret.bytes),                       # Call target, hit
+            (True, bb_call_neg_imm.addr, bb_call_neg_imm.bytes),
+            (True, 0x2000, bb_call_reg.bytes),                  # Not the call target, miss
+            (False, 0x3000, bad_bytes),
+            (True, 0x3000, bad_bytes),                          # Lift fail
+            (True, bb_call_imm.addr, bb_call_imm.bytes),
+            (True, 0x1337, bb_ret.bytes),
+        ]
+
+        ir_eval = switchboard.SBEval("x86_64", lift_workers = lift_workers, lift_batch_size = 2)
+        for (is_exec, addr, data) in events:
+            if is_exec:
+                ir_eval.log_block(addr, data)
+            else:
+                ir_eval.lift_block(addr, data)
+        ir_eval.close()
+
+        return [
+            (
+                sb.bb_result_cache.get_hit_cnt(),
+                sb.bb_result_cache.get_miss_cnt(),
+                sb.bb_result_cache.get_fail_cnt(),
+                sb.call_imm_cnt,
+            )
+            for sb in ir_eval.get_sbs()
+        ]
+
+    def test_same_as_inline(self):
+        inline_cnts = self.run_eval(lift_workers = 0)
+        self.assertEqual(inline_cnts[0], (1, 1, 1, 2))
+        self.assertEqual(self.run_eval(lift_workers = 2), inline_cnts)
+
+class TestBlockTrace(unittest.TestCase):
+
+    '''
+    Verify block trace capture round-trips, compressed and not
+    '''
+
+    def test_round_trip(self):
+        events = [
+            (False, bb_call_imm.addr, bb_call_imm.bytes),
+            (True, bb_call_imm.addr, bb_call_imm.bytes),
+            (True, bb_call_neg_imm.addr, bb_call_neg_imm.bytes),
+            (False, bb_ret.addr, bb_ret.bytes),
+            (True, bb_call_imm.addr, bb_call_imm.bytes),
+            (True, bb_ret.addr, bb_ret.bytes),
+        ]
+
+        for compress in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "trace.irtr")
+                writer = bbtrace.TraceWriter(path, "x86_64", "user", compress)
+                for (is_exec, addr, data) in events:
+                    if is_exec:
+                        writer.log_block(addr, data)
+                    else:
+                        writer.lift_block(addr, data)
+                writer.close()
+
+                reader = bbtrace.TraceReader(path)
+                self.assertEqual(reader.arch, "x86_64")
+                self.assertEqual(reader.space, "user")
+                self.assertEqual(list(reader), events)
+
+    def test_chunked_read(self):
+
+        '''
+        Events and block definitions split across stream refills decode the same as in one read
+        '''
+
+        rng = random.Random(0)
+        blocks = [(0x1000 * i, bytes(rng.randrange(256) for _ in range(rng.randint(1, 300)))) for i in range(50)]
+        events = [(bool(rng.randrange(2)),) + rng.choice(blocks) for _ in range(2000)]
+
+        for compress in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "trace.irtr")
+                writer = bbtrace.TraceWriter(path, "x86_64", "kernel", compress)
+                for (is_exec, addr, data) in events:
+                    if is_exec:
+                        writer.log_block(addr, data)
+                    else:
+                        writer.lift_block(addr, data)
+                writer.close()
+
+                for chunk_size in [1, 7, 64, (1 << 20)]:
+                    reader = bbtrace.TraceReader(path, chunk_size=chunk_size)
+                    self.assertEqual((reader.arch, reader.space), ("x86_64", "kernel"))
+                    self.assertEqual(list(reader), events)
+
+class TestDump(unittest.TestCase):
+
+    '''
+    Verify miss/fail exports reload to the cached results, including when there are none
+    '''
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def make_sb(with_errors):
+        sb = switchboard.SBVex("x86_64")
+        sb.log_block(bb_call_imm.addr, bb_call_imm.bytes)
+        sb.log_block(0x2000 if with_errors else 0x1337, bb_ret.bytes)
+        if with_errors:
+            sb.log_block(bb_call_neg_imm.addr, bb_call_neg_imm.bytes)
+            sb.log_block(0x3000, b"\x0f\xff")
+        sb.log_block(0x4000, bb_ret.bytes)
+        return sb
+
+    def check_npy(self, sb, category):
+        name = switchboard.SBEval.dump_name(sb, category, "user")
+        switchboard.SBEval.dump_category(sb, category, "user", switchboard.DumpFormat.NPY)
+
+        rows = np.load(name + ".npy", mmap_mode = "r")
+        with open(name + ".bytes.bin", "rb") as f:
+            bb_bytes = f.read()
+
+        loaded = []
+        for row in rows:
+            flags = int(row["flags"])
+            loaded.append((
+                int(row["addr"]),
+                int(row["ir_dst"]) if (flags & switchboard.SBEval.NPY_HAS_IR_DST) else None,
+                int(row["true_dst"]) if (flags & switchboard.SBEval.NPY_HAS_TRUE_DST) else None,
+                bool(flags & switchboard.SBEval.NPY_IS_MISS),
+                bool(flags & switchboard.SBEval.NPY_IS_FAIL),
+                bb_bytes[int(row["bytes_off"]):int(row["bytes_off"]) + int(row["bytes_len"])],
+            ))
+
+        expected = [
+            (bbr.addr, bbr.ir_dst, bbr.true_dst, bbr.is_miss == True, bbr.is_lift_exception == True, bbr.bb_bytes)
+            for bbr in switchboard.SBEval.get_category(sb, category)
+        ]
+        self.assertEqual(loaded, expected)
+        return loaded
+
+    def check_jsonl(self, sb, category, fmt):
+        name = switchboard.SBEval.dump_name(sb, category, "user")
+        switchboard.SBEval.dump_category(sb, category, "user", fmt)
+
+        if fmt == switchboard.DumpFormat.JSONL_GZ:
+            f = gzip.open(name + ".jsonl.gz", "rt")
+        else:
+            f = open(name + ".jsonl", "r")
+        with f:
+            loaded = [json.loads(line) for line in f]
+
+        expected = [
+            json.loads(json.dumps(bbr.to_str_dict()))
+            for bbr in switchboard.SBEval.get_category(sb, category)
+        ]
+        self.assertEqual(loaded, expected)
+        return loaded
+
+    def test_round_trip(self):
+        sb = TestDump.make_sb(with_errors = True)
+        self.assertEqual(len(self.check_npy(sb, switchboard.ErrorCategory.MISS)), 2)
+        self.assertEqual(len(self.check_npy(sb, switchboard.ErrorCategory.FAIL)), 1)
+        for fmt in [switchboard.DumpFormat.JSONL, switchboard.DumpFormat.JSONL_GZ]:
+            self.assertEqual(len(self.check_jsonl(sb, switchboard.ErrorCategory.MISS, fmt)), 2)
+            self.assertEqual(len(self.check_jsonl(sb, switchboard.ErrorCategory.FAIL, fmt)), 1)
+
+    def test_empty(self):
+        sb = TestDump.make_sb(with_errors = False)
+        for category in [switchboard.ErrorCategory.MISS, switchboard.ErrorCategory.FAIL]:
+            self.assertEqual(self.check_npy(sb, category), [])
+            for fmt in [switchboard.DumpFormat.JSONL, switchboard.DumpFormat.JSONL_GZ]:
+                self.assertEqual(self.check_jsonl(sb, category, fmt), [])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file